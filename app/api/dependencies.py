@@ -2,18 +2,10 @@ from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.session_service_mqtt import (
     SessionServiceMQTT,
+    get_station_context
 )
 from app.models.station import StationConfig
 from app.database.connection import get_db
-from app.database.repositories import (
-    StationRepository,
-    ChargerRepository,
-    ConnectorRepository,
-    SessionRepository,
-    PowerMetricRepository,
-    BESSStatusRepository,
-    EventRepository
-)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,46 +32,10 @@ async def get_session_service(
 ) -> SessionServiceMQTT:
     """
     Dependency injection pour le SessionService
-    Utilise les instances globales partagées
+    Utilise le contexte partagé de la station
     """
     try:
-        from app.services.session_service_mqtt import (
-            _global_load_manager,
-            _global_bess_controller,
-            _global_station_db_id,
-            _global_station_config,
-            _global_mqtt_service
-        )
-
-        # Vérifier que tout est initialisé
-        if _global_station_config is None:
-            raise RuntimeError("Global station config not initialized")
-
-        if _global_mqtt_service is None:
-            raise RuntimeError("Global MQTT service not initialized")
-
-        if _global_load_manager is None:
-            raise RuntimeError("Global load manager not initialized")
-
-        service = SessionServiceMQTT.__new__(SessionServiceMQTT)
-        service.config = _global_station_config
-        service.db = db
-        service.mqtt = _global_mqtt_service
-        service.load_manager = _global_load_manager
-        service.bess_controller = _global_bess_controller
-        service.station_db_id = _global_station_db_id
-
-        service.station_repo = StationRepository(db)
-        service.charger_repo = ChargerRepository(db)
-        service.connector_repo = ConnectorRepository(db)
-        service.session_repo = SessionRepository(db)
-        service.power_metric_repo = PowerMetricRepository(db)
-        service.event_repo = EventRepository(db)
-
-        if service.bess_controller:
-            service.bess_repo = BESSStatusRepository(db)
-        else:
-            service.bess_repo = None
+        service = SessionServiceMQTT.from_context(get_station_context(), db)
 
         logger.debug("Session service created for request")
         return service
@@ -58,6 +58,7 @@ async def update_connector(
 
     if update_data.status:
         connector = await repo.update_status(connector_id, update_data.status.value)
+        await db.commit()
     else:
         connector = await repo.get_by_id(connector_id)
         # Appliquer d'autres mises à jour si nécessaire
@@ -1,3 +1,4 @@
+from dataclasses import asdict
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.session import (
@@ -5,7 +6,9 @@ from app.models.session import (
     SessionCreateResponse,
     SessionStop,
     PowerUpdate,
-    PowerUpdateResponse
+    PowerUpdateResponse,
+    PowerUpdateBatch,
+    PowerUpdateBatchResponse
 )
 from app.services.session_service import SessionService
 from app.api.dependencies import get_session_service
@@ -90,25 +93,17 @@ async def update_session_power(
     Update consumption
     """
     try:
-        # Récupérer la session en DB pour avoir l'énergie actuelle
-        db_session = await service.session_repo.get_by_session_id(sessionId)
-        if not db_session:
+        # État en mémoire : la ligne en DB n'est écrite que par lots
+        # (power_update_writer), son énergie peut être en retard
+        if sessionId not in service.load_manager.sessions:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        energy_increment = request.consumedPower / 3600  # kWh
-        total_energy = db_session.total_energy + energy_increment
-
-        # Calculer le SOC (approximation)
-        soc_increment = energy_increment * 1.5
-        vehicle_soc = min(100, db_session.vehicle_soc + soc_increment) if db_session.vehicle_soc else 20.0
-
-        new_allocated = await service.update_power_and_energy(
-            session_id=sessionId,
-            consumed_power=request.consumedPower,
-            vehicle_max_power=request.vehicleMaxPower,
-            total_energy=total_energy,
-            vehicle_soc=vehicle_soc
-        )
+        # Même calcul d'énergie et de SOC que la route par lot
+        allocations = await service.update_power_and_energy_many([
+            (sessionId, request.consumedPower, request.vehicleMaxPower,
+             request.timestamp.timestamp() if request.timestamp else None)
+        ])
+        new_allocated = allocations.get(sessionId, 0.0)
 
         return PowerUpdateResponse(newAllocatedPower=new_allocated)
 
@@ -119,6 +114,28 @@ async def update_session_power(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/power-update-batch", response_model=PowerUpdateBatchResponse)
+async def update_sessions_power(
+        request: PowerUpdateBatch,
+        service: SessionServiceMQTT = Depends(get_session_service)
+):
+    """
+    POST /sessions/power-update-batch
+    Update consumption of several sessions with a single reallocation
+    """
+    try:
+        new_allocated = await service.update_power_and_energy_many([
+            (u.sessionId, u.consumedPower, u.vehicleMaxPower,
+             u.timestamp.timestamp() if u.timestamp else None)
+            for u in request.updates
+        ])
+        return PowerUpdateBatchResponse(newAllocatedPower=new_allocated)
+
+    except Exception as e:
+        logger.error(f"Error updating power for {len(request.updates)} sessions: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{sessionId}")
 async def get_session(
         sessionId: str,
@@ -202,7 +219,7 @@ async def get_session_details(
         "session_id": sessionId,
         "in_memory": {
             "exists": memory_session is not None,
-            "data": memory_session.dict() if memory_session else None
+            "data": asdict(memory_session) if memory_session else None
         },
         "in_database": {
             "exists": db_session is not None,
@@ -1,6 +1,10 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
 from app.api.dependencies import get_session_service
-from app.services.session_service_mqtt import SessionServiceMQTT
+from app.config import settings
+from app.services.session_service_mqtt import SessionServiceMQTT, get_station_context
 import logging
 import traceback
 
@@ -8,7 +12,7 @@ router = APIRouter(prefix="/station", tags=["Station"])
 logger = logging.getLogger(__name__)
 
 
-@router.get("/status")
+@router.get("/status", response_class=ORJSONResponse)
 async def get_station_status(
         service: SessionServiceMQTT = Depends(get_session_service)
 ):
@@ -29,7 +33,9 @@ async def get_station_status(
 
         status = await service.get_station_status()
         logger.info(f"Station status retrieved: {status.get('activeSessions', 0)} active sessions")
-        return status
+        # Sérialisé directement par orjson (datetime et enums inclus),
+        # sans passer par jsonable_encoder
+        return ORJSONResponse(status)
 
     except HTTPException:
         raise
@@ -46,6 +52,55 @@ async def get_station_status(
         )
 
 
+@router.get("/status/summary", response_class=ORJSONResponse)
+async def get_station_summary(
+        service: SessionServiceMQTT = Depends(get_session_service)
+):
+    """
+    GET /station/status/summary
+    Get real-time station totals, without the per-session lists
+    """
+    try:
+        return ORJSONResponse(await service.get_station_summary())
+    except Exception as e:
+        logger.error(f"Error getting station summary: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting station summary: {str(e)}"
+        )
+
+
+@router.get("/status/stream")
+async def stream_station_status(
+        request: Request,
+        interval: float = Query(settings.STATUS_STREAM_INTERVAL, ge=0.2, le=60,
+                                description="Secondes entre deux envois")
+):
+    """
+    GET /station/status/stream
+    Server-Sent Events: push the station status every `interval` seconds
+    """
+    # Le statut est entièrement en mémoire : aucune session DB n'est
+    # gardée ouverte pendant toute la durée du flux
+    service = SessionServiceMQTT.from_context(get_station_context(), None)
+
+    async def events():
+        while not await request.is_disconnected():
+            try:
+                status = await service.get_station_status()
+            except Exception as e:
+                logger.error(f"Error streaming station status: {e}", exc_info=True)
+                return
+            yield b"data: " + orjson.dumps(status) + b"\n\n"
+            await asyncio.sleep(interval)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
 @router.get("/power/history")
 async def get_power_history(
         minutes: int = Query(60, ge=1, le=1440, description="Minutes d'historique"),
@@ -1,11 +1,18 @@
-from typing import List, Dict, Tuple
-from app.models.session import ChargingSession, PowerAllocation
+from typing import List, Dict, Optional, Tuple
+from app.models.session import ChargingSession, PowerAllocation, SessionStatus
 from app.models.station import StationConfig
 from app.models.bess import BESSStatus
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Intervalle de recalcul complet des totaux (détection de dérive)
+TOTALS_RESYNC_INTERVAL = 60.0  # secondes
+
+# Taux d'utilisation du réseau en dessous duquel la BESS peut se recharger
+BESS_CHARGE_THRESHOLD = 0.7
+
 
 class LoadManagementAlgorithm:
     """
@@ -22,14 +29,38 @@ class LoadManagementAlgorithm:
         self.config = station_config
         self.sessions: Dict[str, ChargingSession] = {}
 
+        # Constantes dérivées de la config (figée pendant la vie du service)
+        self.grid_available: float = station_config.gridCapacity - station_config.staticLoad
+        self.bess_charge_threshold: float = self.grid_available * BESS_CHARGE_THRESHOLD
+
+        # Totaux maintenus de façon incrémentale (lecture en O(1))
+        self._total_consumed: float = 0.0
+        self._total_allocated: float = 0.0
+        self._last_totals_resync = time.monotonic()
+
+        # Puissance max par chargeur (la config ne change pas en cours de route)
+        self._charger_max_power: Dict[str, float] = {
+            c.id: c.maxPower for c in station_config.chargers
+        }
+
+        # Sessions par chargeur et demande (min(véhicule, connecteur)) par chargeur
+        self._charger_sessions: Dict[str, Dict[str, ChargingSession]] = {}
+        self._charger_demand: Dict[str, float] = {}
+        self._total_demand: float = 0.0
+
+        # Vrai si la dernière allocation complète a dû brider les sessions
+        self._throttled: bool = False
+
     def calculate_power_allocation(
             self,
             sessions: Dict[str, ChargingSession],
             bess_status: BESSStatus = None
-    ) -> List[PowerAllocation]:
+    ) -> Dict[str, PowerAllocation]:
         """
         Calculer l'allocation optimale de puissance pour toutes les sessions actives
 
+        Retourne les allocations indexées par ID de session.
+
         Algorithme:
         1. Calculer la puissance disponible totale (grid + BESS)
         2. Déterminer la demande totale des véhicules
@@ -38,22 +69,19 @@ class LoadManagementAlgorithm:
         """
 
         if not sessions:
-            return []
+            return {}
 
         # 1. Calculer la puissance disponible
-        available_grid = self.config.gridCapacity - self.config.staticLoad
-        available_bess = 0
-
-        if bess_status and self.config.battery:
-            available_bess = bess_status.availableDischarge
-
-        total_available = available_grid + available_bess
+        total_available = self._total_available(bess_status)
 
         # 2. Calculer la demande totale
-        total_demand = sum(
-            min(s.vehicleMaxPower, self._get_charger_connector_limit(s))
-            for s in sessions.values()
-        )
+        if sessions is self.sessions:
+            total_demand = self.total_demand
+        else:
+            total_demand = sum(
+                min(s.vehicleMaxPower, self._get_charger_connector_limit(s))
+                for s in sessions.values()
+            )
 
         # 3. Déterminer le facteur de limitation
         if total_demand <= total_available:
@@ -63,8 +91,12 @@ class LoadManagementAlgorithm:
             # Distribution proportionnelle
             allocation_factor = total_available / total_demand
 
+        if sessions is self.sessions:
+            self._throttled = allocation_factor < 1.0
+
         # 4. Calculer les allocations individuelles
-        allocations = []
+        allocations: Dict[str, PowerAllocation] = {}
+        allocated_total = 0.0
 
         for session in sessions.values():
             # Puissance maximale que ce connecteur peut recevoir
@@ -78,22 +110,33 @@ class LoadManagementAlgorithm:
 
             # Arrondir à 0.1 kW près
             allocated = round(allocated, 1)
+            allocated_total += allocated
 
-            allocations.append(PowerAllocation(
+            allocations[session.sessionId] = PowerAllocation(
                 sessionId=session.sessionId,
                 chargerId=session.chargerId,
                 connectorId=session.connectorId,
                 allocatedPower=allocated,
                 consumedPower=session.consumedPower,
                 vehicleMaxPower=session.vehicleMaxPower
-            ))
+            )
 
-        logger.info(f"Power allocation calculated: {len(allocations)} sessions, "
-                    f"total available: {total_available}kW, total allocated: "
-                    f"{sum(a.allocatedPower for a in allocations)}kW")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Power allocation calculated: {len(allocations)} sessions, "
+                        f"total available: {total_available}kW, total allocated: "
+                        f"{allocated_total}kW")
 
         return allocations
 
+    def _total_available(self, bess_status: BESSStatus = None) -> float:
+        """Puissance disponible pour les sessions (réseau + décharge BESS)"""
+        available = self.grid_available
+
+        if bess_status and self.config.battery:
+            available += bess_status.availableDischarge
+
+        return available
+
     def _get_charger_connector_limit(self, session: ChargingSession) -> float:
         """
         Obtenir la limite de puissance pour un connecteur spécifique
@@ -101,26 +144,39 @@ class LoadManagementAlgorithm:
         La puissance d'un chargeur est partagée entre ses connecteurs.
         Si plusieurs connecteurs sont actifs, la puissance est divisée.
         """
-        charger_config = next(
-            (c for c in self.config.chargers if c.id == session.chargerId),
-            None
-        )
+        return self._connector_limit(session.chargerId)
 
-        if not charger_config:
-            logger.warning(f"Charger {session.chargerId} not found in config")
-            return 0
+    def _connector_limit(self, charger_id: str) -> float:
+        """Limite par connecteur actif d'un chargeur"""
+        max_power = self._charger_max_power.get(charger_id)
 
-        # Compter combien de connecteurs du même chargeur sont actifs
-        active_connectors = sum(
-            1 for s in self.sessions.values()
-            if s.chargerId == session.chargerId and s.status == "active"
-        )
+        if max_power is None:
+            logger.warning(f"Charger {charger_id} not found in config")
+            return 0
 
-        if active_connectors == 0:
-            active_connectors = 1
+        # Nombre de connecteurs actifs sur ce chargeur
+        active_connectors = len(self._charger_sessions.get(charger_id, ())) or 1
 
         # Diviser la puissance du chargeur par le nombre de connecteurs actifs
-        return charger_config.maxPower / active_connectors
+        return max_power / active_connectors
+
+    def _update_charger_demand(self, charger_id: str):
+        """
+        Recalculer la demande d'un chargeur
+
+        Nécessaire quand le nombre de sessions du chargeur change (la limite par
+        connecteur change pour toutes ses sessions) ou qu'un véhicule change de
+        puissance max. Coût proportionnel au nombre de connecteurs du chargeur.
+        """
+        charger_sessions = self._charger_sessions.get(charger_id)
+        if charger_sessions:
+            limit = self._connector_limit(charger_id)
+            demand = sum(min(s.vehicleMaxPower, limit) for s in charger_sessions.values())
+        else:
+            demand = 0.0
+
+        self._total_demand += demand - self._charger_demand.get(charger_id, 0.0)
+        self._charger_demand[charger_id] = demand
 
     def handle_session_start(
             self,
@@ -142,7 +198,7 @@ class LoadManagementAlgorithm:
             sessionId=session_id,
             chargerId=charger_id,
             connectorId=connector_id,
-            status="active",
+            status=SessionStatus.ACTIVE,
             startTime=datetime.now(),
             vehicleMaxPower=vehicle_max_power,
             allocatedPower=0.0,
@@ -152,20 +208,17 @@ class LoadManagementAlgorithm:
         )
 
         self.sessions[session_id] = new_session
+        self._charger_sessions.setdefault(charger_id, {})[session_id] = new_session
+        self._update_charger_demand(charger_id)
 
         # Recalculer l'allocation pour toutes les sessions
         allocations = self.calculate_power_allocation(self.sessions)
 
         # Mettre à jour les sessions avec les nouvelles allocations
-        for alloc in allocations:
-            if alloc.sessionId in self.sessions:
-                self.sessions[alloc.sessionId].allocatedPower = alloc.allocatedPower
+        self.apply_allocations(allocations)
 
         # Retourner la puissance allouée à la nouvelle session
-        new_allocation = next(
-            (a for a in allocations if a.sessionId == session_id),
-            None
-        )
+        new_allocation = allocations.get(session_id)
 
         if new_allocation:
             logger.info(f"Session {session_id} started, allocated {new_allocation.allocatedPower}kW")
@@ -188,21 +241,23 @@ class LoadManagementAlgorithm:
 
         # Mettre à jour la session
         session = self.sessions[session_id]
-        session.status = "completed"
+        session.status = SessionStatus.COMPLETED
         session.endTime = datetime.now()
         session.totalEnergy = consumed_energy
 
-        # Retirer la session des sessions actives
+        # Retirer la session des sessions actives (et de ses totaux)
+        self._total_consumed -= session.consumedPower
+        self._total_allocated -= session.allocatedPower
         del self.sessions[session_id]
+        self._charger_sessions.get(session.chargerId, {}).pop(session_id, None)
+        self._update_charger_demand(session.chargerId)
 
         # Recalculer l'allocation pour les sessions restantes
         if self.sessions:
             allocations = self.calculate_power_allocation(self.sessions)
 
             # Mettre à jour les allocations
-            for alloc in allocations:
-                if alloc.sessionId in self.sessions:
-                    self.sessions[alloc.sessionId].allocatedPower = alloc.allocatedPower
+            self.apply_allocations(allocations)
 
         logger.info(f"Session {session_id} stopped, total energy: {consumed_energy}kWh")
         return True
@@ -225,31 +280,162 @@ class LoadManagementAlgorithm:
 
         # Mettre à jour les informations de la session
         session = self.sessions[session_id]
-        session.consumedPower = consumed_power
-        session.vehicleMaxPower = vehicle_max_power
+        self.set_consumed_power(session, consumed_power)
+        self.set_vehicle_max_power(session, vehicle_max_power)
+
+        # Aucune session bridée avant ni après la mise à jour : chaque session
+        # reçoit sa demande, seule l'allocation de cette session peut changer
+        if not self._throttled and self.total_demand <= self._total_available(bess_status):
+            allocated = round(
+                min(session.vehicleMaxPower, self._connector_limit(session.chargerId)), 1
+            )
+            self._total_allocated += allocated - session.allocatedPower
+            session.allocatedPower = allocated
+            session.offeredPower = allocated
+            return allocated
 
         # Recalculer l'allocation globale
         allocations = self.calculate_power_allocation(self.sessions, bess_status)
 
         # Mettre à jour toutes les sessions
-        for alloc in allocations:
-            if alloc.sessionId in self.sessions:
-                self.sessions[alloc.sessionId].allocatedPower = alloc.allocatedPower
-                self.sessions[alloc.sessionId].offeredPower = alloc.allocatedPower
+        self.apply_allocations(allocations, update_offered=True)
 
         # Retourner la nouvelle allocation pour cette session
-        new_allocation = next(
-            (a for a in allocations if a.sessionId == session_id),
-            None
-        )
+        new_allocation = allocations.get(session_id)
 
         if new_allocation:
-            logger.debug(f"Session {session_id} power update: consumed={consumed_power}kW, "
-                         f"allocated={new_allocation.allocatedPower}kW")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Session {session_id} power update: consumed={consumed_power}kW, "
+                             f"allocated={new_allocation.allocatedPower}kW")
             return new_allocation.allocatedPower
 
         return 0.0
 
+    def handle_power_updates(
+            self,
+            updates: List[Tuple[str, float, float]],
+            bess_status: BESSStatus = None
+    ) -> Dict[str, PowerAllocation]:
+        """
+        Gérer plusieurs mises à jour de puissance avec une seule réallocation
+
+        updates: tuples (session_id, consumed_power, vehicle_max_power) ;
+        les sessions inconnues sont ignorées.
+        Retourne les allocations indexées par ID de session.
+        """
+        for session_id, consumed_power, vehicle_max_power in updates:
+            session = self.sessions.get(session_id)
+            if session is None:
+                logger.warning(f"Session {session_id} not found")
+                continue
+            self.set_consumed_power(session, consumed_power)
+            self.set_vehicle_max_power(session, vehicle_max_power)
+
+        allocations = self.calculate_power_allocation(self.sessions, bess_status)
+        self.apply_allocations(allocations, update_offered=True)
+        return allocations
+
+    def set_consumed_power(self, session: ChargingSession, consumed_power: float):
+        """
+        Mettre à jour la puissance consommée d'une session
+
+        Toute écriture de consumedPower doit passer par ici pour que
+        le total incrémental reste cohérent.
+        """
+        self._total_consumed += consumed_power - session.consumedPower
+        session.consumedPower = consumed_power
+
+    def set_vehicle_max_power(self, session: ChargingSession, vehicle_max_power: float):
+        """
+        Mettre à jour la puissance max acceptée par le véhicule
+
+        Toute écriture de vehicleMaxPower doit passer par ici pour que
+        la demande incrémentale reste cohérente.
+        """
+        if session.vehicleMaxPower == vehicle_max_power:
+            return
+        session.vehicleMaxPower = vehicle_max_power
+        self._update_charger_demand(session.chargerId)
+
+    def apply_allocations(self, allocations: Dict[str, PowerAllocation], update_offered: bool = False):
+        """
+        Appliquer des allocations aux sessions en mémoire
+
+        Args:
+            allocations: Allocations calculées par calculate_power_allocation
+            update_offered: Mettre aussi à jour offeredPower
+        """
+        sessions = self.sessions
+        for session_id, alloc in allocations.items():
+            session = sessions.get(session_id)
+            if session is None:
+                continue
+
+            self._total_allocated += alloc.allocatedPower - session.allocatedPower
+            session.allocatedPower = alloc.allocatedPower
+
+            if update_offered:
+                session.offeredPower = alloc.allocatedPower
+
+    def _resync_totals(self):
+        """
+        Recalculer entièrement les totaux pour corriger une éventuelle dérive
+        (erreurs d'arrondi ou écriture directe sur une session)
+        """
+        total_consumed = sum(s.consumedPower for s in self.sessions.values())
+        total_allocated = sum(s.allocatedPower for s in self.sessions.values())
+        previous_demand = self._total_demand
+
+        for charger_id in list(self._charger_demand):
+            self._update_charger_demand(charger_id)
+        self._total_demand = sum(self._charger_demand.values())
+
+        drift = max(abs(total_consumed - self._total_consumed),
+                    abs(total_allocated - self._total_allocated),
+                    abs(previous_demand - self._total_demand))
+        if drift > 0.01:
+            logger.warning(f"Load manager totals drifted by {drift:.3f}kW, resynchronized")
+
+        self._total_consumed = total_consumed
+        self._total_allocated = total_allocated
+        self._last_totals_resync = time.monotonic()
+
+    def _check_totals(self):
+        """
+        Déclencher le recalcul complet une fois par intervalle
+
+        En DEBUG, le recalcul est fait à chaque lecture pour signaler
+        immédiatement toute dérive des totaux incrémentaux.
+        """
+        if (logger.isEnabledFor(logging.DEBUG)
+                or time.monotonic() - self._last_totals_resync >= TOTALS_RESYNC_INTERVAL):
+            self._resync_totals()
+
+    @property
+    def total_consumed(self) -> float:
+        """Puissance consommée par les sessions en kW (hors charge statique)"""
+        self._check_totals()
+        return self._total_consumed
+
+    @property
+    def total_allocated(self) -> float:
+        """Puissance allouée à l'ensemble des sessions en kW"""
+        self._check_totals()
+        return self._total_allocated
+
+    @property
+    def total_demand(self) -> float:
+        """Demande totale des sessions en kW (véhicule limité par son connecteur)"""
+        self._check_totals()
+        return self._total_demand
+
+    def find_session(self, charger_id: str, connector_id: int) -> Optional[ChargingSession]:
+        """Session active sur un connecteur, None si le connecteur est libre"""
+        for session in self.sessions.values():
+            if session.connectorId == connector_id and session.chargerId == charger_id:
+                return session
+        return None
+
     def get_current_allocations(self) -> List[PowerAllocation]:
         """Obtenir les allocations actuelles pour toutes les sessions"""
         return [
@@ -266,9 +452,9 @@ class LoadManagementAlgorithm:
 
     def get_total_consumption(self) -> float:
         """Calculer la consommation totale actuelle"""
-        return sum(s.consumedPower for s in self.sessions.values()) + self.config.staticLoad
+        return self.total_consumed + self.config.staticLoad
 
     def is_grid_compliant(self) -> bool:
         """Vérifier si la consommation respecte la limite du réseau"""
         total = self.get_total_consumption()
-        return total <= self.config.gridCapacity
\ No newline at end of file
+        return total <= self.config.gridCapacity
@@ -1,17 +1,20 @@
+import asyncio
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy import text
 from app.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Créer l'engine async
+# Créer l'engine async (un seul pool partagé par l'API, les handlers MQTT
+# et les writers de fond)
 engine = create_async_engine(
     settings.DATABASE_URL,
     echo=settings.DATABASE_ECHO,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW
 )
 
 # Session factory
@@ -46,6 +49,19 @@ async def init_db():
     logger.info("Database initialized successfully")
 
 
+async def warm_up_pool():
+    """
+    Ouvrir pool_size connexions au démarrage pour que les premiers
+    messages n'aient pas à payer l'établissement des connexions
+    """
+    async def _checkout():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(_checkout() for _ in range(settings.DATABASE_POOL_SIZE)))
+    logger.info(f"Database pool warmed up ({settings.DATABASE_POOL_SIZE} connections)")
+
+
 async def close_db():
     """
     Fermer les connexions à la base de données
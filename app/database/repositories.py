@@ -1,17 +1,20 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, desc, func, case
+from sqlalchemy import select, insert, update, bindparam, and_, desc, func, case, Float, DateTime
 from sqlalchemy.orm import selectinload
 from app.database.models import (
     Station, Charger, ChargingSession, Connector, SessionPowerUpdate,
     PowerMetric, BESSStatusLog, LoadManagementEvent,
-    SessionStatusEnum
+    SessionStatusEnum, ConnectorStatusEnum
 )
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Les repositories ne font que flush : la transaction est validée une seule
+# fois par l'appelant (service, handler ou route), à la fin de l'opération.
+
 
 class StationRepository:
     """Repository pour les stations"""
@@ -29,7 +32,7 @@ class StationRepository:
             config=config
         )
         self.db.add(station)
-        await self.db.commit()
+        await self.db.flush()
         await self.db.refresh(station)
         return station
 
@@ -70,10 +73,92 @@ class SessionRepository:
             status=SessionStatusEnum.ACTIVE
         )
         self.db.add(session)
-        await self.db.commit()
+        await self.db.flush()
         await self.db.refresh(session)
         return session
 
+    async def create_and_occupy(self, session_id: str, station_db_id: int,
+                                charger_db_id: int, connector_id: int,
+                                vehicle_max_power: float, allocated_power: float):
+        """
+        Créer une session active et occuper son connecteur
+
+        Une seule requête : WITH occupied AS (UPDATE connectors ... RETURNING)
+        INSERT INTO charging_sessions ... SELECT FROM occupied.
+        Retourne (id, connector_id, start_time), ou None si le connecteur n'existe pas.
+        """
+        now = datetime.utcnow()
+        occupied = (
+            update(Connector)
+            .where(Connector.id == connector_id)
+            .values(status=ConnectorStatusEnum.OCCUPIED, updated_at=now)
+            .returning(Connector.id)
+            .cte("occupied")
+        )
+        result = await self.db.execute(
+            insert(ChargingSession)
+            .from_select(
+                [
+                    "session_id", "station_id", "charger_id", "connector_id",
+                    "status", "start_time", "vehicle_max_power",
+                    "allocated_power", "offered_power", "consumed_power", "total_energy"
+                ],
+                select(
+                    bindparam("session_id", session_id),
+                    bindparam("station_id", station_db_id),
+                    bindparam("charger_id", charger_db_id),
+                    occupied.c.id,
+                    bindparam("status", SessionStatusEnum.ACTIVE, type_=ChargingSession.status.type),
+                    bindparam("start_time", now, type_=ChargingSession.start_time.type),
+                    bindparam("vehicle_max_power", vehicle_max_power, type_=Float),
+                    bindparam("allocated_power", allocated_power, type_=Float),
+                    bindparam("offered_power", allocated_power, type_=Float),
+                    bindparam("consumed_power", 0.0, type_=Float),
+                    bindparam("total_energy", 0.0, type_=Float)
+                )
+            )
+            .returning(ChargingSession.id, ChargingSession.connector_id, ChargingSession.start_time)
+        )
+        return result.one_or_none()
+
+    async def complete_and_release(self, session_id: str, total_energy: float):
+        """
+        Clôturer une session active et libérer son connecteur
+
+        Une seule requête : WITH completed AS (UPDATE charging_sessions ...
+        RETURNING) UPDATE connectors ... FROM completed.
+        Retourne (id, connector_id, start_time), ou None si la session n'est pas active.
+        """
+        now = datetime.utcnow()
+        completed = (
+            update(ChargingSession)
+            .where(
+                and_(
+                    ChargingSession.session_id == session_id,
+                    ChargingSession.status == SessionStatusEnum.ACTIVE
+                )
+            )
+            .values(
+                status=SessionStatusEnum.COMPLETED,
+                end_time=now,
+                total_energy=total_energy,
+                consumed_power=0.0,
+                allocated_power=0.0,
+                offered_power=0.0
+            )
+            .returning(
+                ChargingSession.id, ChargingSession.connector_id, ChargingSession.start_time
+            )
+            .cte("completed")
+        )
+        result = await self.db.execute(
+            update(Connector)
+            .where(Connector.id == completed.c.connector_id)
+            .values(status=ConnectorStatusEnum.AVAILABLE, updated_at=now)
+            .returning(completed.c.id, completed.c.connector_id, completed.c.start_time)
+        )
+        return result.one_or_none()
+
     async def get_by_session_id(self, session_id: str) -> Optional[ChargingSession]:
         """Récupérer une session par son ID"""
         result = await self.db.execute(
@@ -86,6 +171,21 @@ class SessionRepository:
         )
         return result.scalar_one_or_none()
 
+    async def get_by_session_ids(self, session_ids: List[str]) -> Dict[str, ChargingSession]:
+        """Récupérer plusieurs sessions en une requête, indexées par ID (absentes ignorées)"""
+        if not session_ids:
+            return {}
+
+        result = await self.db.execute(
+            select(ChargingSession)
+            .where(ChargingSession.session_id.in_(session_ids))
+            .options(
+                selectinload(ChargingSession.station),
+                selectinload(ChargingSession.charger)
+            )
+        )
+        return {s.session_id: s for s in result.scalars()}
+
     async def get_active_sessions(self, station_db_id: int) -> List[ChargingSession]:
         """Récupérer toutes les sessions actives d'une station"""
         result = await self.db.execute(
@@ -105,35 +205,104 @@ class SessionRepository:
                            total_energy: float = None, vehicle_soc: float = None):
         """
         Mettre à jour les données de puissance d'une session
+
+        Un seul UPDATE ... RETURNING, sans SELECT préalable de la session
         """
-        session = await self.get_by_session_id(session_id)
-        if session:
-            session.consumed_power = consumed_power
-            session.allocated_power = allocated_power
-            session.vehicle_max_power = vehicle_max_power
-            session.offered_power = allocated_power
-
-            # Mettre à jour l'énergie si fournie
-            if total_energy is not None:
-                session.total_energy = total_energy
-
-            # Mettre à jour le SOC si fourni
-            if vehicle_soc is not None:
-                session.vehicle_soc = vehicle_soc
-
-            # Ajouter un log de mise à jour
-            update_log = SessionPowerUpdate(
-                session_id=session.id,
-                consumed_power=consumed_power,
-                allocated_power=allocated_power,
-                vehicle_max_power=vehicle_max_power
-            )
-            self.db.add(update_log)
+        values = {
+            "consumed_power": consumed_power,
+            "allocated_power": allocated_power,
+            "vehicle_max_power": vehicle_max_power,
+            "offered_power": allocated_power
+        }
 
-            await self.db.commit()
-            await self.db.refresh(session)
-            return session
-        return None
+        # Mettre à jour l'énergie si fournie
+        if total_energy is not None:
+            values["total_energy"] = total_energy
+
+        # Mettre à jour le SOC si fourni
+        if vehicle_soc is not None:
+            values["vehicle_soc"] = vehicle_soc
+
+        result = await self.db.execute(
+            update(ChargingSession)
+            .where(ChargingSession.session_id == session_id)
+            .values(**values)
+            .returning(ChargingSession)
+        )
+        session = result.scalar_one_or_none()
+        if session is None:
+            return None
+
+        # Ajouter un log de mise à jour
+        update_log = SessionPowerUpdate(
+            session_id=session.id,
+            consumed_power=consumed_power,
+            allocated_power=allocated_power,
+            vehicle_max_power=vehicle_max_power
+        )
+        self.db.add(update_log)
+
+        await self.db.flush()
+        return session
+
+    async def update_power_bulk(self, updates: List[dict]) -> int:
+        """
+        Mettre à jour les données de puissance de plusieurs sessions en un lot
+
+        updates: dicts avec session_id, consumed_power, allocated_power,
+        vehicle_max_power, total_energy et vehicle_soc (None = inchangé)
+        Retourne le nombre de mises à jour envoyées.
+        """
+        if not updates:
+            return 0
+
+        now = datetime.utcnow()
+        params = [
+            {"b_timestamp": now, **{f"b_{key}": value for key, value in u.items()}}
+            for u in updates
+        ]
+
+        # Seules les sessions encore actives : un lot vidé avant l'arrêt mais
+        # écrit après ne doit pas écraser l'énergie finale de la session
+        sessions = ChargingSession.__table__
+        active = sessions.c.status == SessionStatusEnum.ACTIVE
+        await self.db.execute(
+            update(sessions)
+            .where(sessions.c.session_id == bindparam("b_session_id"), active)
+            .values(
+                consumed_power=bindparam("b_consumed_power"),
+                allocated_power=bindparam("b_allocated_power"),
+                offered_power=bindparam("b_allocated_power"),
+                vehicle_max_power=bindparam("b_vehicle_max_power"),
+                total_energy=func.coalesce(
+                    bindparam("b_total_energy", type_=Float), sessions.c.total_energy
+                ),
+                vehicle_soc=func.coalesce(
+                    bindparam("b_vehicle_soc", type_=Float), sessions.c.vehicle_soc
+                )
+            ),
+            params
+        )
+
+        # Logs de mise à jour : INSERT ... SELECT qui résout l'ID DB de la
+        # session côté serveur (aucune ligne pour une session inconnue ou close)
+        await self.db.execute(
+            insert(SessionPowerUpdate.__table__).from_select(
+                ["session_id", "timestamp", "consumed_power",
+                 "allocated_power", "vehicle_max_power"],
+                select(
+                    sessions.c.id,
+                    bindparam("b_timestamp", type_=DateTime),
+                    bindparam("b_consumed_power", type_=Float),
+                    bindparam("b_allocated_power", type_=Float),
+                    bindparam("b_vehicle_max_power", type_=Float)
+                ).where(sessions.c.session_id == bindparam("b_session_id"), active)
+            ),
+            params
+        )
+
+        await self.db.flush()
+        return len(updates)
 
 
 class PowerMetricRepository:
@@ -157,7 +326,7 @@ class PowerMetricRepository:
             active_sessions=active_sessions
         )
         self.db.add(metric)
-        await self.db.commit()
+        await self.db.flush()
         return metric
 
     async def get_recent_metrics(self, station_db_id: int,
@@ -229,7 +398,7 @@ class BESSStatusRepository:
             available_charge=available_charge
         )
         self.db.add(log)
-        await self.db.commit()
+        await self.db.flush()
         return log
 
     async def get_latest(self, station_db_id: int) -> Optional[BESSStatusLog]:
@@ -275,9 +444,28 @@ class EventRepository:
             data=data
         )
         self.db.add(event)
-        await self.db.commit()
+        await self.db.flush()
         return event
 
+    async def copy_records(self, records: List[tuple]) -> int:
+        """
+        Insérer un lot d'événements via COPY (asyncpg), sans passer par l'ORM
+
+        records: tuples (timestamp, event_type, description, data sérialisé en JSON)
+        """
+        if not records:
+            return 0
+
+        connection = await self.db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            LoadManagementEvent.__tablename__,
+            records=records,
+            columns=["timestamp", "event_type", "description", "data"]
+        )
+        await self.db.flush()
+        return len(records)
+
     async def get_recent_events(self, limit: int = 100) -> List[LoadManagementEvent]:
         """Récupérer les événements récents"""
         result = await self.db.execute(
@@ -307,10 +495,20 @@ class ConnectorRepository:
             status=ConnectorStatusEnum.AVAILABLE
         )
         self.db.add(connector)
-        await self.db.commit()
+        await self.db.flush()
         await self.db.refresh(connector)
         return connector
 
+    async def create_many(self, rows: List[dict]) -> int:
+        """Créer plusieurs connecteurs en un seul INSERT"""
+        from app.database.models import Connector
+
+        if not rows:
+            return 0
+
+        await self.db.execute(insert(Connector), rows)
+        return len(rows)
+
     async def get_by_id(self, connector_db_id: int) -> Optional[Connector]:
         """Récupérer un connecteur par son ID de base de données"""
         from app.database.models import Connector
@@ -358,7 +556,7 @@ class ConnectorRepository:
         if connector:
             connector.status = ConnectorStatusEnum(status)
             connector.updated_at = datetime.utcnow()
-            await self.db.commit()
+            await self.db.flush()
             await self.db.refresh(connector)
             return connector
         return None
@@ -432,10 +630,26 @@ class ChargerRepository:
             serial_number=serial_number
         )
         self.db.add(charger)
-        await self.db.commit()
+        await self.db.flush()
         await self.db.refresh(charger)
         return charger
 
+    async def create_many(self, rows: List[dict]) -> Dict[str, int]:
+        """
+        Créer plusieurs chargeurs en un seul INSERT
+
+        Returns:
+            dict: charger_id -> ID DB des chargeurs créés
+        """
+        if not rows:
+            return {}
+
+        result = await self.db.execute(
+            insert(Charger).returning(Charger.charger_id, Charger.id),
+            rows
+        )
+        return dict(result.all())
+
     async def get_by_charger_id(self, station_db_id: int,
                                 charger_id: str) -> Optional[Charger]:
         """Récupérer un chargeur par son ID avec ses connecteurs"""
@@ -451,6 +665,32 @@ class ChargerRepository:
         )
         return result.scalar_one_or_none()
 
+    async def get_charger_and_connector_ids(self, station_db_id: int, charger_id: str,
+                                            connector_id: int):
+        """
+        Résoudre les IDs DB d'un chargeur et de l'un de ses connecteurs en une requête
+
+        Retourne (charger_db_id, connector_db_id) ; connector_db_id vaut None si
+        le connecteur n'existe pas. None si le chargeur n'existe pas.
+        """
+        result = await self.db.execute(
+            select(Charger.id, Connector.id)
+            .outerjoin(
+                Connector,
+                and_(
+                    Connector.charger_id == Charger.id,
+                    Connector.connector_id == connector_id
+                )
+            )
+            .where(
+                and_(
+                    Charger.station_id == station_db_id,
+                    Charger.charger_id == charger_id
+                )
+            )
+        )
+        return result.one_or_none()
+
     async def get_with_connectors(self, charger_db_id: int) -> Optional[Charger]:
         """Récupérer un chargeur avec tous ses connecteurs"""
         result = await self.db.execute(
@@ -7,10 +7,11 @@ import asyncio
 
 from app.models.station import StationConfig
 from app.api.routes import station, sessions, connectors, chargers
-from app.database.connection import init_db, close_db, AsyncSessionLocal
+from app.database.connection import init_db, close_db, warm_up_pool, AsyncSessionLocal
 from app.services.station_init_service import StationInitService
 from app.services.mqtt_service import initialize_mqtt_service, get_mqtt_service
 from app.services.session_service_mqtt import SessionServiceMQTT
+from app.services.write_behind import event_writer, power_update_writer
 
 logging.basicConfig(
     level=logging.INFO,
@@ -49,6 +50,7 @@ async def lifespan(app: FastAPI):
 
     # 1. Initialiser la base de données
     await init_db()
+    await warm_up_pool()
     logger.info("✓ Database initialized")
 
     # 2. Charger la configuration de la station
@@ -66,6 +68,7 @@ async def lifespan(app: FastAPI):
     # 5. Obtenir l'event loop et le passer au service MQTT
     loop = asyncio.get_event_loop()
     mqtt_service.set_event_loop(loop)
+    mqtt_service.start_workers()
     logger.info("✓ MQTT service initialized with event loop")
 
     # 6. Initialiser le SessionService avec MQTT
@@ -74,6 +77,10 @@ async def lifespan(app: FastAPI):
         await _session_service.initialize()
     logger.info("✓ Session service initialized with MQTT")
 
+    # 7. Démarrer l'écriture différée (événements, mises à jour de puissance)
+    event_writer.start()
+    power_update_writer.start()
+
     logger.info("=" * 60)
     logger.info("Electra EMS API started successfully")
     logger.info(f"MQTT Connected: {mqtt_service.connected}")
@@ -84,6 +91,9 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down Electra EMS API...")
     mqtt_service.disconnect()
+    await mqtt_service.stop_workers()
+    await power_update_writer.stop()
+    await event_writer.stop()
     await close_db()
     logger.info("✓ Shutdown complete")
 
@@ -123,6 +133,7 @@ async def root():
         "endpoints": {
             "docs": "/docs",
             "station_status": "/station/status",
+            "station_summary": "/station/status/summary",
             "sessions": "/sessions"
         }
     }
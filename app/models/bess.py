@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 
@@ -8,15 +9,16 @@ class BESSMode(str, Enum):
     DISCHARGING = "discharging"
     BOOST = "boost"  # Actively boosting charging sessions
 
-class BESSStatus(BaseModel):
+@dataclass(slots=True, frozen=True)
+class BESSStatus:
     timestamp: datetime
     mode: BESSMode
-    power: float = Field(..., description="Current power (positive=discharge, negative=charge) in kW")
-    soc: float = Field(..., description="State of Charge in %")
-    capacity: float = Field(..., description="Total capacity in kWh")
-    availableEnergy: float = Field(..., description="Available energy above minSOC in kWh")
-    availableDischarge: float = Field(..., description="Available discharge power in kW")
-    availableCharge: float = Field(..., description="Available charge power in kW")
+    power: float  # Puissance actuelle (positive=décharge, négative=charge) en kW
+    soc: float  # State of Charge en %
+    capacity: float  # Capacité totale en kWh
+    availableEnergy: float  # Énergie disponible au-dessus du minSOC en kWh
+    availableDischarge: float  # Puissance de décharge disponible en kW
+    availableCharge: float  # Puissance de charge disponible en kW
 
 class BESSCommand(BaseModel):
     command: str = Field(..., description="charge, discharge, idle")
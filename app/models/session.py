@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 from datetime import datetime
 from enum import Enum
 
@@ -30,37 +31,67 @@ class SessionStop(BaseModel):
 class PowerUpdate(BaseModel):
     consumedPower: float = Field(..., description="Currently consumed power in kW")
     vehicleMaxPower: float = Field(..., description="Vehicle max power acceptance in kW")
+    timestamp: Optional[datetime] = Field(
+        None, description="Measurement time, used to integrate energy (default: reception time)"
+    )
 
 
 class PowerUpdateResponse(BaseModel):
     newAllocatedPower: float = Field(..., description="New allocated power in kW")
 
 
-class ChargingSession(BaseModel):
+class SessionPowerUpdateItem(PowerUpdate):
+    sessionId: str
+
+
+class PowerUpdateBatch(BaseModel):
+    updates: List[SessionPowerUpdateItem]
+
+
+class PowerUpdateBatchResponse(BaseModel):
+    newAllocatedPower: Dict[str, float] = Field(
+        ..., description="New allocated power in kW, by session ID (unknown sessions omitted)"
+    )
+
+
+@dataclass(slots=True)
+class ChargingSession:
+    """
+    Session active en mémoire (load manager)
+
+    Dataclass à slots plutôt que modèle Pydantic : ces objets sont lus en
+    boucle par l'algorithme d'allocation et n'ont pas besoin de validation.
+    """
     sessionId: str
     chargerId: str
     connectorId: int
     status: SessionStatus
     startTime: datetime
-    endTime: Optional[datetime] = None
 
-    # Power metrics
+    # Power metrics (kW)
     vehicleMaxPower: float
     allocatedPower: float
     consumedPower: float
-    offeredPower: float = Field(..., description="Power offered by charger (≥ consumed)")
+    offeredPower: float  # Puissance offerte par le chargeur (≥ consumed)
+
+    endTime: Optional[datetime] = None
 
     # Energy metrics
-    totalEnergy: float = Field(0.0, description="Total energy delivered in kWh")
+    totalEnergy: float = 0.0  # Énergie délivrée en kWh
 
     # Vehicle info
-    vehicleSoc: Optional[float] = Field(None, description="Vehicle SOC if available")
+    vehicleSoc: float = 0.0  # SOC véhicule (0.0 tant qu'il n'est pas remonté)
+
+    # Instant (s epoch) de la dernière mise à jour de puissance, None avant
+    # la première : l'énergie est intégrée sur l'intervalle écoulé
+    lastPowerUpdate: Optional[float] = None
 
 
-class PowerAllocation(BaseModel):
+@dataclass(slots=True, frozen=True)
+class PowerAllocation:
     sessionId: str
     chargerId: str
     connectorId: int
     allocatedPower: float
     consumedPower: float
-    vehicleMaxPower: float
\ No newline at end of file
+    vehicleMaxPower: float
@@ -0,0 +1,62 @@
+"""
+Transport MQTT en mémoire, sans broker (tests)
+"""
+from itertools import count
+from typing import Callable, List, Optional, Union
+import paho.mqtt.client as mqtt
+
+
+class FakeMqttTransport:
+    """
+    Remplaçant du client paho pour MQTTService et les clients de test
+
+    publish() remet le message à on_message si un abonnement correspond :
+    MQTTService le place ensuite dans la file asyncio de son chargeur,
+    exactement comme un message reçu du broker. Pas de réseau ni d'ACK,
+    les publications sont acquittées immédiatement.
+    """
+
+    def __init__(self):
+        self.on_connect: Optional[Callable] = None
+        self.on_disconnect: Optional[Callable] = None
+        self.on_message: Optional[Callable] = None
+        self._subscriptions: List[str] = []
+        self._mids = count(1)
+
+    def username_pw_set(self, username: str, password: Optional[str] = None):
+        pass
+
+    def connect(self, host: str = None, port: int = 1883, keepalive: int = 60) -> int:
+        """Connexion immédiate : on_connect est appelé (abonnements)"""
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        if self.on_disconnect:
+            self.on_disconnect(self, None, 0)
+
+    def subscribe(self, topic: str, qos: int = 0):
+        self._subscriptions.append(topic)
+        return mqtt.MQTT_ERR_SUCCESS, next(self._mids)
+
+    def publish(self, topic: str, payload: Union[bytes, str, None] = None,
+                qos: int = 0, retain: bool = False) -> mqtt.MQTTMessageInfo:
+        """Livrer le message aux abonnés du processus"""
+        mid = next(self._mids)
+        if self.on_message and any(mqtt.topic_matches_sub(sub, topic) for sub in self._subscriptions):
+            msg = mqtt.MQTTMessage(mid=mid, topic=topic.encode())
+            msg.payload = payload.encode() if isinstance(payload, str) else (payload or b"")
+            msg.qos = qos
+            self.on_message(self, None, msg)
+
+        info = mqtt.MQTTMessageInfo(mid)
+        info.rc = mqtt.MQTT_ERR_SUCCESS
+        info._set_as_published()
+        return info
@@ -1,6 +1,7 @@
+import struct
 from pydantic import BaseModel, Field
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+from datetime import datetime, timezone
 
 
 # Messages des Chargeurs vers EMS
@@ -25,6 +26,28 @@ class ChargerTelemetryMessage(BaseModel):
     temperature: Optional[float] = None
 
 
+# Télémétrie binaire (topic .../telemetry/bin), little-endian, 24 octets :
+# connector_id (uint32), voltage V, current A, power W, vehicle_soc %
+# (float32), timestamp (uint32, secondes epoch UTC). Publiée uniquement
+# pendant la charge ; la session est retrouvée par chargeur/connecteur.
+CHARGER_TELEMETRY_STRUCT = struct.Struct("<IffffI")
+
+
+def unpack_charger_telemetry(charger_id: str, data: bytes) -> dict:
+    """Décoder une télémétrie binaire en payload de ChargerTelemetryMessage"""
+    connector_id, voltage, current, power, vehicle_soc, timestamp = CHARGER_TELEMETRY_STRUCT.unpack(data)
+    return {
+        "timestamp": datetime.fromtimestamp(timestamp, timezone.utc),
+        "charger_id": charger_id,
+        "connector_id": connector_id,
+        "voltage": voltage,
+        "current": current,
+        "power": power,
+        "vehicle_soc": vehicle_soc,
+        "status": "charging"
+    }
+
+
 class SessionStartMessage(BaseModel):
     """Message de démarrage de session depuis le chargeur"""
     timestamp: datetime
@@ -58,6 +81,23 @@ class SessionUpdateMessage(BaseModel):
     energy_delivered: float = Field(..., description="Énergie délivrée depuis le début en kWh")
 
 
+class SessionUpdateItem(BaseModel):
+    """Mise à jour d'une session au sein d'un lot"""
+    connector_id: int
+    session_id: str
+    consumed_power: float = Field(..., description="Puissance consommée en kW")
+    vehicle_max_power: float = Field(..., description="Puissance max acceptée en kW")
+    vehicle_soc: Optional[float] = None
+    energy_delivered: float = Field(..., description="Énergie délivrée depuis le début en kWh")
+
+
+class SessionUpdateBatchMessage(BaseModel):
+    """Mises à jour de toutes les sessions d'un chargeur, en un seul message"""
+    timestamp: datetime
+    charger_id: str
+    updates: List[SessionUpdateItem]
+
+
 # Messages de l'EMS vers les Chargeurs
 
 class PowerLimitCommand(BaseModel):
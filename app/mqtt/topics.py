@@ -8,6 +8,7 @@ class MQTTTopics:
 
     # Topics Chargeurs (Telemetry - Chargers to EMS)
     CHARGER_TELEMETRY = "electra/{station_id}/charger/{charger_id}/telemetry"
+    CHARGER_TELEMETRY_BIN = "electra/{station_id}/charger/{charger_id}/telemetry/bin"
     CHARGER_STATUS = "electra/{station_id}/charger/{charger_id}/status"
     CHARGER_CONNECTOR_STATUS = "electra/{station_id}/charger/{charger_id}/connector/{connector_id}/status"
 
@@ -19,6 +20,7 @@ class MQTTTopics:
     SESSION_START = "electra/{station_id}/charger/{charger_id}/session/start"
     SESSION_STOP = "electra/{station_id}/charger/{charger_id}/session/stop"
     SESSION_UPDATE = "electra/{station_id}/charger/{charger_id}/session/update"
+    SESSION_UPDATE_BATCH = "electra/{station_id}/charger/{charger_id}/session/update_batch"
 
     # Topics BESS (Battery - Bidirectional)
     BESS_STATUS = "electra/{station_id}/bess/status"
@@ -33,6 +35,10 @@ class MQTTTopics:
     def get_charger_telemetry(station_id: str, charger_id: str) -> str:
         return f"electra/{station_id}/charger/{charger_id}/telemetry"
 
+    @staticmethod
+    def get_charger_telemetry_bin(station_id: str, charger_id: str) -> str:
+        return f"electra/{station_id}/charger/{charger_id}/telemetry/bin"
+
     @staticmethod
     def get_charger_command(station_id: str, charger_id: str) -> str:
         return f"electra/{station_id}/charger/{charger_id}/command"
@@ -57,16 +63,22 @@ class MQTTTopics:
     def get_session_update(station_id: str, charger_id: str) -> str:
         return f"electra/{station_id}/charger/{charger_id}/session/update"
 
+    @staticmethod
+    def get_session_update_batch(station_id: str, charger_id: str) -> str:
+        return f"electra/{station_id}/charger/{charger_id}/session/update_batch"
+
     @staticmethod
     def get_all_charger_topics(station_id: str) -> list:
         """Obtenir tous les topics pour s'abonner"""
         return [
             f"electra/{station_id}/charger/+/telemetry",
+            f"electra/{station_id}/charger/+/telemetry/bin",
             f"electra/{station_id}/charger/+/status",
             f"electra/{station_id}/charger/+/connector/+/status",
             f"electra/{station_id}/charger/+/session/start",
             f"electra/{station_id}/charger/+/session/stop",
             f"electra/{station_id}/charger/+/session/update",
+            f"electra/{station_id}/charger/+/session/update_batch",
         ]
 
     @staticmethod
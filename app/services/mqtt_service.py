@@ -1,6 +1,6 @@
 import asyncio
-import json
-from typing import Callable, Dict, Optional
+import orjson
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 import paho.mqtt.client as mqtt
 from app.config import settings
@@ -10,7 +10,9 @@ from app.mqtt.messages import (
     SessionStartMessage,
     SessionStopMessage,
     SessionUpdateMessage,
+    SessionUpdateBatchMessage,
     BESSStatusMessage,
+    unpack_charger_telemetry,
     PowerLimitCommand,
     BESSCommandMessage
 )
@@ -35,25 +37,40 @@ class MQTTService:
         self.loop: Optional[asyncio.AbstractEventLoop] = None
         self.executor = ThreadPoolExecutor(max_workers=4)
 
-        # Queue pour les messages à traiter
-        self.message_queue = asyncio.Queue()
+        # Files de messages à traiter, une par worker. Les messages d'un même
+        # chargeur vont toujours dans la même file pour garder leur ordre.
+        self._queues: list[asyncio.Queue] = []
+        self._workers: list[asyncio.Task] = []
 
         # Handlers pour les différents types de messages
         self.telemetry_handlers: list[Callable] = []
         self.session_start_handlers: list[Callable] = []
         self.session_stop_handlers: list[Callable] = []
         self.session_update_handlers: list[Callable] = []
+        self.session_update_batch_handlers: list[Callable] = []
         self.bess_status_handlers: list[Callable] = []
+        self._handlers_registered = False
+
+        # Dernière limite publiée par connecteur (charger_id, connector_id) -> kW
+        self._last_power_limits: Dict[Tuple[str, int], float] = {}
 
     def set_event_loop(self, loop: asyncio.AbstractEventLoop):
         """Définir l'event loop à utiliser"""
         self.loop = loop
         logger.info("Event loop set for MQTT service")
 
-    def initialize(self):
-        """Initialiser le client MQTT"""
-        client_id = f"ems_{self.station_id}_{int(datetime.now().timestamp())}"
-        self.client = mqtt.Client(client_id=client_id)
+    def initialize(self, client: Optional[mqtt.Client] = None):
+        """
+        Initialiser le client MQTT
+
+        Args:
+            client: Transport à utiliser à la place d'un client paho
+                (ex. FakeMqttTransport pour les tests sans broker)
+        """
+        if client is None:
+            client_id = f"ems_{self.station_id}_{int(datetime.now().timestamp())}"
+            client = mqtt.Client(client_id=client_id)
+        self.client = client
 
         if settings.MQTT_USERNAME and settings.MQTT_PASSWORD:
             self.client.username_pw_set(
@@ -105,126 +122,108 @@ class MQTTService:
             logger.info(f"Subscribed to: {topic}")
 
     def _on_message(self, client, userdata, msg):
-        """Router pour les messages MQTT entrants"""
+        """Router pour les messages MQTT entrants (thread du client paho)"""
         try:
             topic = msg.topic
-            payload = json.loads(msg.payload.decode())
-
-            logger.debug(f"Received message on {topic}")
-
-            # Au lieu de créer des tasks, on utilise run_coroutine_threadsafe
-            if self.loop and self.loop.is_running():
-                # Router vers le bon handler
-                if "/telemetry" in topic:
-                    asyncio.run_coroutine_threadsafe(
-                        self._handle_charger_telemetry(payload),
-                        self.loop
-                    )
-                elif "/session/start" in topic:
-                    asyncio.run_coroutine_threadsafe(
-                        self._handle_session_start(payload),
-                        self.loop
-                    )
-                elif "/session/stop" in topic:
-                    asyncio.run_coroutine_threadsafe(
-                        self._handle_session_stop(payload),
-                        self.loop
-                    )
-                elif "/session/update" in topic:
-                    asyncio.run_coroutine_threadsafe(
-                        self._handle_session_update(payload),
-                        self.loop
-                    )
-                elif "/bess/status" in topic or "/bess/telemetry" in topic:
-                    asyncio.run_coroutine_threadsafe(
-                        self._handle_bess_status(payload),
-                        self.loop
-                    )
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Received message on {topic}")
+
+            if topic.endswith("/telemetry/bin"):
+                # electra/{station_id}/charger/{charger_id}/telemetry/bin
+                kind = "telemetry"
+                payload = unpack_charger_telemetry(topic.split("/")[3], msg.payload)
+            else:
+                payload = orjson.loads(msg.payload)
+                kind = self._route(topic)
+                if kind is None:
+                    return
+
+            # Le traitement est fait par les workers : le thread paho rend la
+            # main immédiatement et ne dépend pas de la latence de la DB
+            if self.loop and self.loop.is_running() and self._queues:
+                self.loop.call_soon_threadsafe(self._enqueue, kind, payload)
             else:
-                logger.warning("Event loop not available, message not processed")
+                logger.warning("MQTT workers not running, message not processed")
 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to decode JSON from topic {msg.topic}: {e}")
         except Exception as e:
             logger.error(f"Error processing message: {e}", exc_info=True)
 
-    async def _handle_session_update_mqtt(self, message: SessionUpdateMessage):
-        """
-        Handler pour les mises à jour de session depuis un chargeur
-        """
-        logger.debug(f"Session update from {message.charger_id}: {message.session_id}")
-
+    @staticmethod
+    def _route(topic: str) -> Optional[str]:
+        """Type de message d'un topic JSON, None si non géré"""
+        if "/telemetry" in topic and "/bess/" not in topic:
+            return "telemetry"
+        elif "/session/start" in topic:
+            return "session_start"
+        elif "/session/stop" in topic:
+            return "session_stop"
+        elif "/session/update_batch" in topic:
+            return "session_update_batch"
+        elif "/session/update" in topic:
+            return "session_update"
+        elif "/bess/status" in topic or "/bess/telemetry" in topic:
+            return "bess_status"
+        return None
+
+    def _enqueue(self, kind: str, payload: dict):
+        """Placer un message dans la file de son chargeur (event loop)"""
+        key = payload.get("charger_id") or "bess"
+        queue = self._queues[hash(key) % len(self._queues)]
         try:
-            # Vérifier que la session existe
-            if message.session_id not in self.load_manager.sessions:
-                logger.warning(f"Session {message.session_id} not found in load manager")
-                return
-
-            # Mettre à jour la puissance dans le load manager
-            new_allocated = await self.update_power(
-                session_id=message.session_id,
-                consumed_power=message.consumed_power,
-                vehicle_max_power=message.vehicle_max_power
-            )
-
-            # IMPORTANT: Mettre à jour aussi l'énergie délivrée
-            session_in_memory = self.load_manager.sessions[message.session_id]
-            session_in_memory.totalEnergy = message.energy_delivered
-            session_in_memory.vehicleSoc = message.vehicle_soc
-
-            # Mettre à jour l'énergie dans la DB
-            db_session = await self.session_repo.get_by_session_id(message.session_id)
-            if db_session:
-                db_session.total_energy = message.energy_delivered
-                db_session.vehicle_soc = message.vehicle_soc
-                await self.db.commit()
-
-            # Si l'allocation a changé significativement, envoyer la nouvelle limite
-            if abs(session_in_memory.allocatedPower - new_allocated) > 0.5:
-                self.mqtt.publish_power_limit(
-                    charger_id=message.charger_id,
-                    connector_id=message.connector_id,
-                    power_limit=new_allocated
-                )
-                logger.info(f"Updated power limit for {message.session_id}: {new_allocated:.1f}kW")
-
-            # Log détaillé
-            logger.debug(
-                f"Session {message.session_id} updated: "
-                f"consumed={message.consumed_power:.1f}kW, "
-                f"allocated={new_allocated:.1f}kW, "
-                f"energy={message.energy_delivered:.2f}kWh, "
-                f"soc={message.vehicle_soc:.1f}%"
-            )
-
+            queue.put_nowait((kind, payload))
+        except asyncio.QueueFull:
+            logger.warning(f"MQTT queue full, dropping {kind} message from {key}")
+
+    async def _worker(self, queue: asyncio.Queue):
+        """Consommer une file de messages"""
+        handlers = {
+            "telemetry": self._handle_charger_telemetry,
+            "session_start": self._handle_session_start,
+            "session_stop": self._handle_session_stop,
+            "session_update": self._handle_session_update,
+            "session_update_batch": self._handle_session_update_batch,
+            "bess_status": self._handle_bess_status
+        }
+        while True:
+            kind, payload = await queue.get()
+            try:
+                await handlers[kind](payload)
+            except Exception as e:
+                logger.error(f"Error processing {kind} message: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    def start_workers(self, num_workers: int = settings.MQTT_WORKERS,
+                      queue_size: int = settings.MQTT_QUEUE_SIZE):
+        """Démarrer les workers de traitement (depuis l'event loop)"""
+        if self._workers:
+            return
+        self._queues = [asyncio.Queue(maxsize=queue_size) for _ in range(num_workers)]
+        self._workers = [asyncio.create_task(self._worker(q)) for q in self._queues]
+        logger.info(f"Started {num_workers} MQTT workers")
+
+    async def stop_workers(self):
+        """Arrêter les workers"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues = []
+
+    async def _handle_charger_telemetry(self, payload: dict):
+        """Traiter une télémétrie chargeur"""
+        try:
+            message = ChargerTelemetryMessage(**payload)
+            for handler in self.telemetry_handlers:
+                try:
+                    await handler(message)
+                except Exception as e:
+                    logger.error(f"Error in telemetry handler: {e}", exc_info=True)
         except Exception as e:
-            logger.error(f"Error handling session update: {e}", exc_info=True)
-
-    async def _handle_charger_telemetry(self, message: ChargerTelemetryMessage):
-        """
-        Handler pour la télémétrie des chargeurs
-        """
-        logger.debug(
-            f"Telemetry from {message.charger_id}:{message.connector_id} - "
-            f"{message.power / 1000:.1f}kW"
-        )
-
-        # Si une session est active sur ce connecteur
-        if message.session_id and message.session_id in self.load_manager.sessions:
-            session = self.load_manager.sessions[message.session_id]
-
-            # Mettre à jour la puissance consommée (convertir W en kW)
-            session.consumedPower = message.power / 1000
-
-            # Mettre à jour le SOC si disponible
-            if message.vehicle_soc is not None:
-                session.vehicleSoc = message.vehicle_soc
-
-            logger.debug(
-                f"Session {message.session_id} telemetry updated: "
-                f"power={session.consumedPower:.1f}kW, "
-                f"soc={session.vehicleSoc:.1f}%"
-            )
+            logger.error(f"Error handling charger telemetry: {e}", exc_info=True)
 
     async def _handle_session_start(self, payload: dict):
         """Traiter un démarrage de session"""
@@ -262,6 +261,18 @@ class MQTTService:
         except Exception as e:
             logger.error(f"Error handling session update: {e}", exc_info=True)
 
+    async def _handle_session_update_batch(self, payload: dict):
+        """Traiter un lot de mises à jour de session"""
+        try:
+            message = SessionUpdateBatchMessage(**payload)
+            for handler in self.session_update_batch_handlers:
+                try:
+                    await handler(message)
+                except Exception as e:
+                    logger.error(f"Error in session update batch handler: {e}", exc_info=True)
+        except Exception as e:
+            logger.error(f"Error handling session update batch: {e}", exc_info=True)
+
     async def _handle_bess_status(self, payload: dict):
         """Traiter un statut BESS"""
         try:
@@ -292,10 +303,36 @@ class MQTTService:
         """Enregistrer un handler pour les mises à jour de session"""
         self.session_update_handlers.append(handler)
 
+    def register_session_update_batch_handler(self, handler: Callable):
+        """Enregistrer un handler pour les lots de mises à jour de session"""
+        self.session_update_batch_handlers.append(handler)
+
     def register_bess_status_handler(self, handler: Callable):
         """Enregistrer un handler pour les statuts BESS"""
         self.bess_status_handlers.append(handler)
 
+    def register_handlers_once(self, telemetry: Callable, session_start: Callable,
+                               session_stop: Callable, session_update: Callable,
+                               session_update_batch: Callable, bess_status: Callable) -> bool:
+        """
+        Enregistrer le jeu complet de handlers, une seule fois par service
+
+        Returns:
+            bool: False si les handlers étaient déjà enregistrés
+        """
+        if self._handlers_registered:
+            return False
+
+        self.register_telemetry_handler(telemetry)
+        self.register_session_start_handler(session_start)
+        self.register_session_stop_handler(session_stop)
+        self.register_session_update_handler(session_update)
+        self.register_session_update_batch_handler(session_update_batch)
+        self.register_bess_status_handler(bess_status)
+
+        self._handlers_registered = True
+        return True
+
     # Publication de commandes
 
     def publish_power_limit(self, charger_id: str, connector_id: int, power_limit: float):
@@ -321,12 +358,46 @@ class MQTTService:
         result = self.client.publish(topic, payload, qos=1)
 
         if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            logger.debug(f"Published power limit {power_limit}kW to {charger_id}:{connector_id}")
+            self._last_power_limits[(charger_id, connector_id)] = power_limit
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Published power limit {power_limit}kW to {charger_id}:{connector_id}")
             return True
         else:
             logger.error(f"Failed to publish power limit to {topic}")
             return False
 
+    def forget_power_limit(self, charger_id: str, connector_id: int):
+        """
+        Oublier la dernière limite publiée sur un connecteur (début/fin de
+        session) : la prochaine limite sera envoyée quelle que soit sa valeur
+        """
+        self._last_power_limits.pop((charger_id, connector_id), None)
+
+    def publish_power_limits_batch(self, limits: List[Tuple[str, int, float]],
+                                   threshold: float = 0.5) -> int:
+        """
+        Publier un lot de limites de puissance (charger_id, connector_id, kW)
+
+        Seules les limites qui diffèrent de plus de threshold kW de la
+        dernière valeur publiée sur le connecteur sont envoyées.
+
+        Returns:
+            int: Nombre de limites publiées
+        """
+        if not self.connected:
+            logger.error("Cannot publish: MQTT not connected")
+            return 0
+
+        published = 0
+        for charger_id, connector_id, power_limit in limits:
+            last = self._last_power_limits.get((charger_id, connector_id))
+            if last is not None and abs(last - power_limit) <= threshold:
+                continue
+            if self.publish_power_limit(charger_id, connector_id, power_limit):
+                published += 1
+
+        return published
+
     def publish_bess_command(self, command: str, power: float):
         """Publier une commande vers le BESS"""
         if not self.connected:
@@ -369,7 +440,7 @@ class MQTTService:
             "vehicle_max_power": vehicle_max_power
         }
 
-        payload = json.dumps(command)
+        payload = orjson.dumps(command)
         result = self.client.publish(topic, payload, qos=1)
 
         if result.rc == mqtt.MQTT_ERR_SUCCESS:
@@ -399,9 +470,9 @@ def get_mqtt_service() -> MQTTService:
     return _mqtt_service
 
 
-def initialize_mqtt_service(station_id: str) -> MQTTService:
-    """Initialiser le service MQTT"""
+def initialize_mqtt_service(station_id: str, client: Optional[mqtt.Client] = None) -> MQTTService:
+    """Initialiser le service MQTT (client : transport injecté, paho par défaut)"""
     global _mqtt_service
     _mqtt_service = MQTTService(station_id)
-    _mqtt_service.initialize()
+    _mqtt_service.initialize(client)
     return _mqtt_service
@@ -1,17 +1,17 @@
-from typing import Dict, Optional
-from sqlalchemy.ext.asyncio import AsyncSession
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from app.models.session import ChargingSession, SessionStatus
 from app.models.station import StationConfig
 from app.core.load_management import LoadManagementAlgorithm
 from app.core.bess_controller import BESSController
+from app.services.write_behind import event_writer
 from app.database.repositories import (
     StationRepository,
     ChargerRepository,
-    ConnectorRepository,
     SessionRepository,
     PowerMetricRepository,
-    BESSStatusRepository,
-    EventRepository
+    BESSStatusRepository
 )
 import logging
 from datetime import datetime
@@ -22,35 +22,38 @@ logger = logging.getLogger(__name__)
 class SessionService:
     """
     Service de gestion des sessions de charge avec persistance en base de données
+
+    Chaque méthode publique ouvre sa propre session SQLAlchemy via la factory
+    fournie : une AsyncSession n'est jamais partagée entre deux opérations,
+    et chaque opération d'écriture est validée en une seule transaction.
     """
 
-    def __init__(self, station_config: StationConfig, db: AsyncSession):
+    def __init__(self, station_config: StationConfig,
+                 sessionmaker: async_sessionmaker[AsyncSession]):
         self.config = station_config
-        self.db = db
+        self._sessionmaker = sessionmaker
         self.load_manager = LoadManagementAlgorithm(station_config)
 
-        # Repositories
-        self.station_repo = StationRepository(db)
-        self.charger_repo = ChargerRepository(db)
-        self.connector_repo = ConnectorRepository(db)
-        self.session_repo = SessionRepository(db)
-        self.power_metric_repo = PowerMetricRepository(db)
-        self.event_repo = EventRepository(db)
-
         # Initialiser le BESS si présent dans la config
         self.bess_controller: Optional[BESSController] = None
-        self.bess_repo: Optional[BESSStatusRepository] = None
 
         if station_config.battery:
             self.bess_controller = BESSController(station_config.battery)
-            self.bess_repo = BESSStatusRepository(db)
 
         # Station DB ID (sera chargé lors de l'initialisation)
         self.station_db_id: Optional[int] = None
 
+        # Partie statique du statut, copiée puis complétée à chaque appel
+        self._status_skeleton = {
+            "stationId": station_config.stationId,
+            "gridCapacity": station_config.gridCapacity
+        }
+
     async def initialize(self):
         """Initialiser le service et charger l'ID de la station"""
-        station = await self.station_repo.get_by_station_id(self.config.stationId)
+        async with self._sessionmaker() as db:
+            station = await StationRepository(db).get_by_station_id(self.config.stationId)
+
         if station:
             self.station_db_id = station.id
             logger.info(f"SessionService initialized for station {self.config.stationId} (DB ID: {self.station_db_id})")
@@ -79,42 +82,42 @@ class SessionService:
         logger.info(f"Creating session {session_id} on {charger_id}:{connector_id}, "
                     f"vehicle max: {vehicle_max_power}kW")
 
-        # Récupérer le chargeur depuis la DB
-        charger = await self.charger_repo.get_by_charger_id(
-            self.station_db_id,
-            charger_id
-        )
+        async with self._sessionmaker.begin() as db:
+            return await self._create_session(
+                db, session_id, charger_id, connector_id, vehicle_max_power
+            )
 
-        if not charger:
-            raise ValueError(f"Charger {charger_id} not found")
+    async def _create_session(
+            self,
+            db: AsyncSession,
+            session_id: str,
+            charger_id: str,
+            connector_id: int,
+            vehicle_max_power: float
+    ) -> float:
+        """Création de la session dans la transaction ouverte par create_session"""
+        session_repo = SessionRepository(db)
 
-        # Récupérer le connecteur
-        connector = await self.connector_repo.get_by_charger_and_connector_id(
-            charger.id,
+        # Récupérer les IDs DB du chargeur et du connecteur (une seule requête)
+        ids = await ChargerRepository(db).get_charger_and_connector_ids(
+            self.station_db_id,
+            charger_id,
             connector_id
         )
 
-        if not connector:
-            raise ValueError(f"Connector {connector_id} not found on charger {charger_id}")
-
-        # Mettre à jour le statut du connecteur
-        await self.connector_repo.update_status(connector.id, "occupied")
+        if ids is None:
+            raise ValueError(f"Charger {charger_id} not found")
 
-        # Créer la session dans la DB
-        db_session = await self.session_repo.create(
-            session_id=session_id,
-            station_db_id=self.station_db_id,
-            charger_db_id=charger.id,
-            connector_id=connector.id,
-            vehicle_max_power=vehicle_max_power
-        )
+        charger_db_id, connector_db_id = ids
+        if connector_db_id is None:
+            raise ValueError(f"Connector {connector_id} not found on charger {charger_id}")
 
         # Obtenir le statut BESS si disponible
         bess_status = None
         if self.bess_controller:
             bess_status = self.bess_controller.get_status()
             # Sauvegarder le statut BESS
-            await self.bess_repo.create(
+            await BESSStatusRepository(db).create(
                 station_db_id=self.station_db_id,
                 mode=bess_status.mode.value,
                 power=bess_status.power,
@@ -133,16 +136,18 @@ class SessionService:
             vehicle_max_power=vehicle_max_power
         )
 
-        # Mettre à jour l'allocation dans la DB
-        await self.session_repo.update_power(
+        # Créer la session avec son allocation et occuper le connecteur
+        await session_repo.create_and_occupy(
             session_id=session_id,
-            consumed_power=0.0,
-            allocated_power=allocated,
-            vehicle_max_power=vehicle_max_power
+            station_db_id=self.station_db_id,
+            charger_db_id=charger_db_id,
+            connector_id=connector_db_id,
+            vehicle_max_power=vehicle_max_power,
+            allocated_power=allocated
         )
 
         # Log de l'événement
-        await self.event_repo.create(
+        event_writer.record(
             event_type="session_start",
             description=f"Session {session_id} started on {charger_id}:{connector_id}",
             data={
@@ -158,7 +163,7 @@ class SessionService:
         await self._optimize_bess_usage()
 
         # Sauvegarder les métriques de puissance
-        await self._save_power_metrics()
+        await self._save_power_metrics(db)
 
         return allocated
 
@@ -184,35 +189,33 @@ class SessionService:
         if not success:
             return False
 
-        # Mettre à jour dans la DB
-        db_session = await self.session_repo.complete_session(
-            session_id=session_id,
-            total_energy=consumed_energy
-        )
-
-        if not db_session:
-            logger.warning(f"Session {session_id} not found in database")
-            return False
-
-        # Libérer le connecteur
-        await self.connector_repo.update_status(db_session.connector_id, "available")
+        async with self._sessionmaker.begin() as db:
+            # Clôturer la session et libérer le connecteur en une seule requête
+            db_session = await SessionRepository(db).complete_and_release(
+                session_id=session_id,
+                total_energy=consumed_energy
+            )
 
-        # Log de l'événement
-        await self.event_repo.create(
-            event_type="session_stop",
-            description=f"Session {session_id} stopped",
-            data={
-                "session_id": session_id,
-                "consumed_energy": consumed_energy,
-                "duration": (datetime.utcnow() - db_session.start_time).total_seconds()
-            }
-        )
+            if not db_session:
+                logger.warning(f"Session {session_id} not found in database")
+                return False
+
+            # Log de l'événement
+            event_writer.record(
+                event_type="session_stop",
+                description=f"Session {session_id} stopped",
+                data={
+                    "session_id": session_id,
+                    "consumed_energy": consumed_energy,
+                    "duration": (datetime.utcnow() - db_session.start_time).total_seconds()
+                }
+            )
 
-        # Réévaluer l'utilisation de la BESS
-        await self._optimize_bess_usage()
+            # Réévaluer l'utilisation de la BESS
+            await self._optimize_bess_usage()
 
-        # Sauvegarder les métriques
-        await self._save_power_metrics()
+            # Sauvegarder les métriques
+            await self._save_power_metrics(db)
 
         return True
 
@@ -241,46 +244,89 @@ class SessionService:
             bess_status=bess_status
         )
 
-        # Mettre à jour dans la DB
-        await self.session_repo.update_power(
-            session_id=session_id,
-            consumed_power=consumed_power,
-            allocated_power=new_allocated,
-            vehicle_max_power=vehicle_max_power
-        )
-
-        # Optimiser l'utilisation de la BESS
-        await self._optimize_bess_usage()
-
-        # Appliquer la puissance BESS (simulation du temps qui passe)
-        if self.bess_controller and self.bess_controller.current_power != 0:
-            # Simuler 1 seconde d'écoulement
-            self.bess_controller.apply_power(
-                self.bess_controller.current_power,
-                duration_seconds=1.0
+        async with self._sessionmaker.begin() as db:
+            # Mettre à jour dans la DB
+            await SessionRepository(db).update_power(
+                session_id=session_id,
+                consumed_power=consumed_power,
+                allocated_power=new_allocated,
+                vehicle_max_power=vehicle_max_power
             )
 
-            # Sauvegarder le nouveau statut BESS
-            if self.bess_repo:
-                bess_status = self.bess_controller.get_status()
-                await self.bess_repo.create(
-                    station_db_id=self.station_db_id,
-                    mode=bess_status.mode.value,
-                    power=bess_status.power,
-                    soc=bess_status.soc,
-                    capacity=bess_status.capacity,
-                    available_energy=bess_status.availableEnergy,
-                    available_discharge=bess_status.availableDischarge,
-                    available_charge=bess_status.availableCharge
-                )
+            # Optimiser l'utilisation de la BESS
+            await self._optimize_bess_usage()
+
+            # Appliquer la puissance BESS (simulation du temps qui passe)
+            await self._simulate_bess_tick(db)
 
-        # Sauvegarder les métriques périodiquement (tous les 5 updates)
-        # Pour éviter trop d'écritures en DB
-        if hash(session_id) % 5 == 0:
-            await self._save_power_metrics()
+            # Sauvegarder les métriques périodiquement (tous les 5 updates)
+            # Pour éviter trop d'écritures en DB
+            if hash(session_id) % 5 == 0:
+                await self._save_power_metrics(db)
 
         return new_allocated
 
+    async def update_power_many(self, updates: List[Tuple[str, float, float]]) -> Dict[str, float]:
+        """
+        Mettre à jour la consommation de plusieurs sessions en une fois
+
+        Une seule réallocation et une seule transaction pour tout le lot.
+
+        Args:
+            updates: tuples (session_id, consumed_power, vehicle_max_power)
+
+        Returns:
+            Dict[str, float]: Nouvelle puissance allouée par session
+        """
+        bess_status = None
+        if self.bess_controller:
+            bess_status = self.bess_controller.get_status()
+
+        allocations = self.load_manager.handle_power_updates(updates, bess_status)
+
+        async with self._sessionmaker.begin() as db:
+            await SessionRepository(db).update_power_bulk([
+                {
+                    "session_id": session_id,
+                    "consumed_power": consumed_power,
+                    "allocated_power": allocations[session_id].allocatedPower,
+                    "vehicle_max_power": vehicle_max_power,
+                    "total_energy": None,
+                    "vehicle_soc": None
+                }
+                for session_id, consumed_power, vehicle_max_power in updates
+                if session_id in allocations
+            ])
+
+            await self._optimize_bess_usage()
+            await self._simulate_bess_tick(db)
+            await self._save_power_metrics(db)
+
+        return {session_id: a.allocatedPower for session_id, a in allocations.items()}
+
+    async def _simulate_bess_tick(self, db: AsyncSession):
+        """Appliquer 1 seconde de puissance BESS (simulation du temps qui passe)"""
+        if not self.bess_controller or self.bess_controller.current_power == 0:
+            return
+
+        self.bess_controller.apply_power(
+            self.bess_controller.current_power,
+            duration_seconds=1.0
+        )
+
+        # Sauvegarder le nouveau statut BESS
+        bess_status = self.bess_controller.get_status()
+        await BESSStatusRepository(db).create(
+            station_db_id=self.station_db_id,
+            mode=bess_status.mode.value,
+            power=bess_status.power,
+            soc=bess_status.soc,
+            capacity=bess_status.capacity,
+            available_energy=bess_status.availableEnergy,
+            available_discharge=bess_status.availableDischarge,
+            available_charge=bess_status.availableCharge
+        )
+
     async def _optimize_bess_usage(self):
         """
         Optimiser l'utilisation de la BESS
@@ -289,17 +335,12 @@ class SessionService:
             return
 
         # Calculer la puissance disponible du réseau
-        grid_available = self.config.gridCapacity - self.config.staticLoad
+        grid_available = self.load_manager.grid_available
 
         # Calculer la demande totale actuelle
-        total_consumed = sum(
-            s.consumedPower for s in self.load_manager.sessions.values()
-        )
+        total_consumed = self.load_manager.total_consumed
 
-        total_demand = sum(
-            min(s.vehicleMaxPower, self.load_manager._get_charger_connector_limit(s))
-            for s in self.load_manager.sessions.values()
-        )
+        total_demand = self.load_manager.total_demand
 
         # Décision: Boost ou Charge ?
         if total_demand > grid_available:
@@ -312,9 +353,11 @@ class SessionService:
             if boost_power > 0:
                 command = self.bess_controller.set_discharge(boost_power)
                 logger.info(f"BESS command: discharge {command.power}kW")
+                # Pas de batterie physique derrière ce service : commande appliquée ici
+                self.bess_controller.apply_power(command.power, duration_seconds=0.0)
 
                 # Log de l'événement
-                await self.event_repo.create(
+                event_writer.record(
                     event_type="bess_boost",
                     description=f"BESS boost activated: {command.power}kW",
                     data={
@@ -324,7 +367,7 @@ class SessionService:
                     }
                 )
 
-        elif total_consumed < grid_available * 0.7:
+        elif total_consumed < self.load_manager.bess_charge_threshold:
             # Opportunité de charger (utilisation < 70%)
             charge_power = self.bess_controller.calculate_charge_opportunity(
                 grid_available=grid_available,
@@ -334,9 +377,10 @@ class SessionService:
             if charge_power > 0:
                 command = self.bess_controller.set_charge(charge_power)
                 logger.info(f"BESS command: charge {command.power}kW")
+                self.bess_controller.apply_power(-command.power, duration_seconds=0.0)
 
                 # Log de l'événement
-                await self.event_repo.create(
+                event_writer.record(
                     event_type="bess_charge",
                     description=f"BESS charging: {command.power}kW",
                     data={
@@ -350,31 +394,29 @@ class SessionService:
             # Idle
             self.bess_controller.set_idle()
 
-    async def _save_power_metrics(self):
+    async def _save_power_metrics(self, db: AsyncSession):
         """
         Sauvegarder les métriques de puissance actuelles
         """
         total_consumed = self.load_manager.get_total_consumption()
-        allocations = self.load_manager.get_current_allocations()
 
         bess_power = 0.0
         if self.bess_controller:
             bess_power = self.bess_controller.current_power
 
-        await self.power_metric_repo.create(
+        await PowerMetricRepository(db).create(
             station_db_id=self.station_db_id,
             grid_power=total_consumed - bess_power,
             bess_power=bess_power,
-            total_allocated=sum(a.allocatedPower for a in allocations),
+            total_allocated=self.load_manager.total_allocated,
             total_consumed=total_consumed,
             available_power=self.config.gridCapacity - total_consumed + bess_power,
             active_sessions=len(self.load_manager.sessions)
         )
 
-    async def get_station_status(self) -> dict:
-        """Obtenir le statut complet de la station"""
+    async def get_station_summary(self) -> dict:
+        """Obtenir les grandeurs scalaires du statut, sans les listes de sessions"""
         total_consumed = self.load_manager.get_total_consumption()
-        allocations = self.load_manager.get_current_allocations()
 
         bess_power = 0.0
         bess_soc = None
@@ -384,39 +426,46 @@ class SessionService:
             bess_power = bess_status.power
             bess_soc = bess_status.soc
 
-        return {
-            "stationId": self.config.stationId,
+        status = self._status_skeleton.copy()
+        status.update({
             "timestamp": datetime.now().isoformat(),
-            "gridCapacity": self.config.gridCapacity,
             "gridPower": total_consumed - bess_power,
             "bessPower": bess_power,
             "bessSOC": bess_soc,
-            "totalAllocated": sum(a.allocatedPower for a in allocations),
+            "totalAllocated": self.load_manager.total_allocated,
             "totalConsumed": total_consumed,
             "activeSessions": len(self.load_manager.sessions),
-            "availablePower": self.config.gridCapacity - total_consumed + bess_power,
-            "sessions": [s.dict() for s in self.load_manager.sessions.values()],
-            "powerAllocation": [a.dict() for a in allocations]
-        }
+            "availablePower": self.config.gridCapacity - total_consumed + bess_power
+        })
+        return status
+
+    async def get_station_status(self) -> dict:
+        """Obtenir le statut complet de la station"""
+        status = await self.get_station_summary()
+        status["sessions"] = [asdict(s) for s in self.load_manager.sessions.values()]
+        status["powerAllocation"] = [asdict(a) for a in self.load_manager.get_current_allocations()]
+        return status
 
     async def get_session_statistics(self, days: int = 7) -> dict:
         """Obtenir les statistiques des sessions"""
         from datetime import timedelta
 
         start_date = datetime.utcnow() - timedelta(days=days)
-        stats = await self.session_repo.get_session_statistics(
-            station_db_id=self.station_db_id,
-            start_date=start_date
-        )
+        async with self._sessionmaker() as db:
+            stats = await SessionRepository(db).get_session_statistics(
+                station_db_id=self.station_db_id,
+                start_date=start_date
+            )
 
         return stats
 
     async def get_power_history(self, minutes: int = 60) -> list:
         """Obtenir l'historique de puissance"""
-        metrics = await self.power_metric_repo.get_recent_metrics(
-            station_db_id=self.station_db_id,
-            minutes=minutes
-        )
+        async with self._sessionmaker() as db:
+            metrics = await PowerMetricRepository(db).get_recent_metrics(
+                station_db_id=self.station_db_id,
+                minutes=minutes
+            )
 
         return [
             {
@@ -1,17 +1,20 @@
-from typing import Dict, Optional
+from dataclasses import dataclass
+from functools import cached_property
+from operator import attrgetter
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.session import ChargingSession, SessionStatus
 from app.models.station import StationConfig
 from app.core.load_management import LoadManagementAlgorithm
 from app.core.bess_controller import BESSController
+from app.services.write_behind import event_writer, power_update_writer
 from app.database.repositories import (
     StationRepository,
     ChargerRepository,
     ConnectorRepository,
     SessionRepository,
     PowerMetricRepository,
-    BESSStatusRepository,
-    EventRepository
+    BESSStatusRepository
 )
 from app.services.mqtt_service import MQTTService
 from app.mqtt.messages import (
@@ -19,20 +22,68 @@ from app.mqtt.messages import (
     SessionStartMessage,
     SessionStopMessage,
     SessionUpdateMessage,
+    SessionUpdateBatchMessage,
     BESSStatusMessage
 )
 from app.database.connection import AsyncSessionLocal
 import logging
+import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-# Variables globales pour partager l'état entre les handlers
-_global_load_manager: Optional[LoadManagementAlgorithm] = None
-_global_bess_controller: Optional[BESSController] = None
-_global_station_db_id: Optional[int] = None
-_global_station_config: Optional[StationConfig] = None
-_global_mqtt_service: Optional[MQTTService] = None
+
+@dataclass(frozen=True, slots=True)
+class StationContext:
+    """
+    État partagé entre les handlers MQTT et les requêtes API
+
+    Construit une seule fois par SessionServiceMQTT.initialize() ; les objets
+    référencés (load manager, BESS) restent mutables, pas le contexte.
+    """
+    station_config: StationConfig
+    station_db_id: int
+    load_manager: LoadManagementAlgorithm
+    bess_controller: Optional[BESSController]
+    mqtt: MQTTService
+    status_skeleton: dict
+
+
+# Contexte de la station (défini au démarrage)
+_station_context: Optional[StationContext] = None
+
+
+def get_station_context() -> StationContext:
+    """Obtenir le contexte de la station"""
+    if _station_context is None:
+        raise RuntimeError("Station context not initialized")
+    return _station_context
+
+
+# Conversion des puissances de télémétrie (W) en kW
+W_TO_KW = 0.001
+# Intervalle maximal d'intégration de l'énergie entre deux mises à jour : une
+# session restée muette ne se voit pas créditer toute la durée du silence
+MAX_ENERGY_INTERVAL = 60.0  # secondes
+
+# Champs exposés par get_station_status pour chaque session / allocation
+_SESSION_STATUS_KEYS = (
+    "sessionId", "chargerId", "connectorId", "status", "startTime",
+    "vehicleMaxPower", "allocatedPower", "consumedPower", "offeredPower",
+    "totalEnergy", "vehicleSoc"
+)
+_session_status_values = attrgetter(*_SESSION_STATUS_KEYS)
+
+_ALLOCATION_STATUS_KEYS = (
+    "sessionId", "chargerId", "connectorId",
+    "allocatedPower", "consumedPower", "vehicleMaxPower"
+)
+_allocation_status_values = attrgetter(*_ALLOCATION_STATUS_KEYS)
+
+
+def _status_dicts(items, keys: tuple, values_getter) -> list:
+    """Construire les dicts de statut (un dict neuf par session/allocation)"""
+    return [dict(zip(keys, values_getter(item))) for item in items]
 
 
 class SessionServiceMQTT:
@@ -40,66 +91,92 @@ class SessionServiceMQTT:
     Service de gestion des sessions avec communication MQTT
     """
 
-    def __init__(self, station_config: StationConfig, db: AsyncSession, mqtt_service: MQTTService):
-        global _global_load_manager, _global_bess_controller, _global_station_config, _global_mqtt_service
-
+    def __init__(self, station_config: StationConfig, db: AsyncSession, mqtt_service: MQTTService,
+                 context: Optional[StationContext] = None):
+        # Construit à chaque message MQTT / requête : pas d'allocation inutile ici,
+        # les repositories sont créés à la première utilisation
         self.config = station_config
         self.db = db
         self.mqtt = mqtt_service
 
-        # Utiliser les instances globales ou en créer de nouvelles
-        if _global_load_manager is None:
-            _global_load_manager = LoadManagementAlgorithm(station_config)
-        self.load_manager = _global_load_manager
+        if context is not None:
+            # Réutiliser l'état partagé de la station
+            self.load_manager = context.load_manager
+            self.bess_controller = context.bess_controller
+            self.station_db_id = context.station_db_id
+            self._status_skeleton = context.status_skeleton
+        else:
+            # Démarrage : l'état partagé est créé ici et publié par initialize()
+            self.load_manager = LoadManagementAlgorithm(station_config)
+            self.bess_controller = (
+                BESSController(station_config.battery) if station_config.battery else None
+            )
+            self.station_db_id = None
+            self._status_skeleton = self._build_status_skeleton()
 
-        # Repositories
-        self.station_repo = StationRepository(db)
-        self.charger_repo = ChargerRepository(db)
-        self.connector_repo = ConnectorRepository(db)
-        self.session_repo = SessionRepository(db)
-        self.power_metric_repo = PowerMetricRepository(db)
-        self.event_repo = EventRepository(db)
+    @classmethod
+    def from_context(cls, context: StationContext, db: AsyncSession) -> "SessionServiceMQTT":
+        """Construire un service sur l'état partagé de la station"""
+        return cls(context.station_config, db, context.mqtt, context)
 
-        # BESS
-        if _global_bess_controller is None and station_config.battery:
-            _global_bess_controller = BESSController(station_config.battery)
-        self.bess_controller = _global_bess_controller
+    # Repositories (créés à la demande, liés à self.db)
 
-        if self.bess_controller:
-            self.bess_repo = BESSStatusRepository(db)
-        else:
-            self.bess_repo = None
+    @cached_property
+    def station_repo(self) -> StationRepository:
+        return StationRepository(self.db)
 
-        self.station_db_id = _global_station_db_id
+    @cached_property
+    def charger_repo(self) -> ChargerRepository:
+        return ChargerRepository(self.db)
 
-        # Sauvegarder les références globales
-        _global_station_config = station_config
-        _global_mqtt_service = mqtt_service
+    @cached_property
+    def connector_repo(self) -> ConnectorRepository:
+        return ConnectorRepository(self.db)
 
-        # Enregistrer les handlers MQTT (une seule fois)
-        if not hasattr(mqtt_service, '_handlers_registered'):
-            self._register_mqtt_handlers()
-            mqtt_service._handlers_registered = True
+    @cached_property
+    def session_repo(self) -> SessionRepository:
+        return SessionRepository(self.db)
+
+    @cached_property
+    def power_metric_repo(self) -> PowerMetricRepository:
+        return PowerMetricRepository(self.db)
+
+    @cached_property
+    def bess_repo(self) -> Optional[BESSStatusRepository]:
+        return BESSStatusRepository(self.db) if self.bess_controller else None
 
     def _register_mqtt_handlers(self):
         """Enregistrer les handlers pour les messages MQTT"""
-        # Utiliser des fonctions statiques qui accèdent aux variables globales
-        self.mqtt.register_telemetry_handler(handle_charger_telemetry_global)
-        self.mqtt.register_session_start_handler(handle_session_start_global)
-        self.mqtt.register_session_stop_handler(handle_session_stop_global)
-        self.mqtt.register_session_update_handler(handle_session_update_global)
-        self.mqtt.register_bess_status_handler(handle_bess_status_global)
-
-        logger.info("MQTT handlers registered (global)")
+        # Fonctions de module qui travaillent sur le contexte de la station
+        registered = self.mqtt.register_handlers_once(
+            telemetry=handle_charger_telemetry_global,
+            session_start=handle_session_start_global,
+            session_stop=handle_session_stop_global,
+            session_update=handle_session_update_global,
+            session_update_batch=handle_session_update_batch_global,
+            bess_status=handle_bess_status_global
+        )
+        if registered:
+            logger.info("MQTT handlers registered (global)")
 
     async def initialize(self):
         """Initialiser le service"""
-        global _global_station_db_id
+        global _station_context
 
         station = await self.station_repo.get_by_station_id(self.config.stationId)
         if station:
             self.station_db_id = station.id
-            _global_station_db_id = station.id
+            _station_context = StationContext(
+                station_config=self.config,
+                station_db_id=station.id,
+                load_manager=self.load_manager,
+                bess_controller=self.bess_controller,
+                mqtt=self.mqtt,
+                status_skeleton=self._status_skeleton
+            )
+
+            # Enregistrer les handlers MQTT (une seule fois, au démarrage)
+            self._register_mqtt_handlers()
             logger.info(
                 f"SessionServiceMQTT initialized for station {self.config.stationId} (DB ID: {self.station_db_id})")
         else:
@@ -116,35 +193,17 @@ class SessionServiceMQTT:
         """Créer une nouvelle session de charge"""
         logger.info(f"Creating session {session_id} on {charger_id}:{connector_id}")
 
-        # Récupérer le chargeur et le connecteur
-        charger = await self.charger_repo.get_by_charger_id(self.station_db_id, charger_id)
-        if not charger:
+        # Récupérer les IDs DB du chargeur et du connecteur (une seule requête)
+        ids = await self.charger_repo.get_charger_and_connector_ids(
+            self.station_db_id, charger_id, connector_id
+        )
+        if ids is None:
             raise ValueError(f"Charger {charger_id} not found")
 
-        connector = await self.connector_repo.get_by_charger_and_connector_id(
-            charger.id,
-            connector_id
-        )
-        if not connector:
+        charger_db_id, connector_db_id = ids
+        if connector_db_id is None:
             raise ValueError(f"Connector {connector_id} not found")
 
-        # Mettre à jour le statut du connecteur
-        await self.connector_repo.update_status(connector.id, "occupied")
-
-        # Créer la session dans la DB
-        db_session = await self.session_repo.create(
-            session_id=session_id,
-            station_db_id=self.station_db_id,
-            charger_db_id=charger.id,
-            connector_id=connector.id,
-            vehicle_max_power=vehicle_max_power
-        )
-
-        # Obtenir le statut BESS
-        bess_status = None
-        if self.bess_controller:
-            bess_status = self.bess_controller.get_status()
-
         # Créer la session dans le load manager
         allocated = self.load_manager.handle_session_start(
             session_id=session_id,
@@ -153,16 +212,24 @@ class SessionServiceMQTT:
             vehicle_max_power=vehicle_max_power
         )
 
-        # Mettre à jour la DB
-        await self.session_repo.update_power(
-            session_id=session_id,
-            consumed_power=0.0,
-            allocated_power=allocated,
-            vehicle_max_power=vehicle_max_power
-        )
+        # Créer la session et occuper le connecteur en une seule requête
+        try:
+            await self.session_repo.create_and_occupy(
+                session_id=session_id,
+                station_db_id=self.station_db_id,
+                charger_db_id=charger_db_id,
+                connector_id=connector_db_id,
+                vehicle_max_power=vehicle_max_power,
+                allocated_power=allocated
+            )
+            await self.db.commit()
+        except Exception:
+            # La session n'existe pas en DB : la retirer du load manager
+            self.load_manager.handle_session_stop(session_id, 0.0)
+            raise
 
         # Log de l'événement
-        await self.event_repo.create(
+        event_writer.record(
             event_type="session_start",
             description=f"Session {session_id} started",
             data={
@@ -173,6 +240,11 @@ class SessionServiceMQTT:
             }
         )
 
+        # Limite initiale toujours envoyée : la valeur en cache peut venir
+        # de la session précédente sur ce connecteur
+        self.mqtt.forget_power_limit(charger_id, connector_id)
+        self.mqtt.publish_power_limit(charger_id, connector_id, allocated)
+
         # Optimiser BESS et envoyer commandes si nécessaire
         await self._optimize_and_publish_bess()
 
@@ -183,20 +255,23 @@ class SessionServiceMQTT:
         logger.info(f"Stopping session {session_id}")
 
         # Arrêter dans le load manager
+        session = self.load_manager.sessions.get(session_id)
         success = self.load_manager.handle_session_stop(session_id, consumed_energy)
         if not success:
             return False
+        self.mqtt.forget_power_limit(session.chargerId, session.connectorId)
 
-        # Mettre à jour la DB
-        db_session = await self.session_repo.complete_session(session_id, consumed_energy)
+        # La session est clôturée ci-dessous, sa mise à jour en attente est caduque
+        power_update_writer.discard(session_id)
+
+        # Clôturer la session et libérer le connecteur en une seule requête
+        db_session = await self.session_repo.complete_and_release(session_id, consumed_energy)
         if not db_session:
             return False
-
-        # Libérer le connecteur
-        await self.connector_repo.update_status(db_session.connector_id, "available")
+        await self.db.commit()
 
         # Log
-        await self.event_repo.create(
+        event_writer.record(
             event_type="session_stop",
             description=f"Session {session_id} stopped",
             data={"session_id": session_id, "energy": consumed_energy}
@@ -221,51 +296,36 @@ class SessionServiceMQTT:
         """
         Mettre à jour la consommation ET l'énergie d'une session
         """
-        logger.info(
-            f"UPDATE_POWER_AND_ENERGY called: session={session_id}, "
-            f"power={consumed_power:.1f}kW, energy={total_energy:.3f}kWh, soc={vehicle_soc}"
-        )
-
         # Mettre à jour dans le load manager
         session = self.load_manager.sessions.get(session_id)
         if not session:
             logger.warning(f"Session {session_id} not found in load manager")
             return 0.0
 
-        logger.info(f"Before update: power={session.consumedPower}, energy={session.totalEnergy}")
-
         # Mettre à jour les valeurs
-        session.consumedPower = consumed_power
-        session.vehicleMaxPower = vehicle_max_power
         session.totalEnergy = total_energy
         if vehicle_soc is not None:
             session.vehicleSoc = vehicle_soc
-        logger.info(f"After update: power={session.consumedPower}, energy={session.totalEnergy}")
 
-        # Recalculer l'allocation
+        # Mettre à jour la puissance et recalculer l'allocation
         bess_status = None
         if self.bess_controller:
             bess_status = self.bess_controller.get_status()
 
-        allocations = self.load_manager.calculate_power_allocation(
-            self.load_manager.sessions,
-            bess_status
-        )
-
-        # Appliquer les allocations
-        for alloc in allocations:
-            if alloc.sessionId in self.load_manager.sessions:
-                self.load_manager.sessions[alloc.sessionId].allocatedPower = alloc.allocatedPower
-                self.load_manager.sessions[alloc.sessionId].offeredPower = alloc.allocatedPower
-
-        # Obtenir la nouvelle allocation pour cette session
-        new_allocated = next(
-            (a.allocatedPower for a in allocations if a.sessionId == session_id),
-            0.0
+        new_allocated = self.load_manager.handle_power_update(
+            session_id=session_id,
+            consumed_power=consumed_power,
+            vehicle_max_power=vehicle_max_power,
+            bess_status=bess_status
         )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Power update: session={session_id}, power={consumed_power:.1f}kW, "
+                f"energy={total_energy:.3f}kWh, soc={vehicle_soc}, allocated={new_allocated:.1f}kW"
+            )
 
-        # Mettre à jour dans la DB
-        await self.session_repo.update_power(
+        # Persistance différée : écrite par lot par le power_update_writer
+        power_update_writer.record(
             session_id=session_id,
             consumed_power=consumed_power,
             allocated_power=new_allocated,
@@ -276,34 +336,124 @@ class SessionServiceMQTT:
 
         return new_allocated
 
+    async def update_power_and_energy_many(
+            self,
+            updates: List[Tuple[str, float, float, Optional[float]]]
+    ) -> Dict[str, float]:
+        """
+        Mettre à jour la consommation et l'énergie de plusieurs sessions
+
+        Une seule réallocation pour tout le lot. L'énergie et le SOC sont
+        incrémentés de la consommation depuis la mise à jour précédente de
+        la session (depuis son démarrage pour la première), à partir de
+        l'état en mémoire ; les sessions inconnues sont ignorées.
+
+        Args:
+            updates: tuples (session_id, consumed_power, vehicle_max_power,
+                timestamp) ; timestamp en s epoch, None pour l'heure de réception
+
+        Returns:
+            Dict[str, float]: Nouvelle puissance allouée par session
+        """
+        sessions = self.load_manager.sessions
+        received = time.time()
+        batch = []
+        for session_id, consumed_power, vehicle_max_power, timestamp in updates:
+            session = sessions.get(session_id)
+            if session is None:
+                continue
+            if timestamp is None:
+                timestamp = received
+            previous = session.lastPowerUpdate
+            if previous is None:
+                previous = session.startTime.timestamp()
+            elapsed = min(max(0.0, timestamp - previous), MAX_ENERGY_INTERVAL)
+            session.lastPowerUpdate = max(timestamp, previous)
+            energy_increment = consumed_power * elapsed / 3600  # kWh
+            batch.append((
+                session_id, consumed_power, vehicle_max_power,
+                session.totalEnergy + energy_increment,
+                min(100, session.vehicleSoc + energy_increment * 1.5) if session.vehicleSoc else 20.0
+            ))
+
+        return await self.update_power_and_energy_batch(batch)
+
+    async def update_power_and_energy_batch(
+            self,
+            updates: List[Tuple[str, float, float, float, Optional[float]]]
+    ) -> Dict[str, float]:
+        """
+        Mettre à jour consommation, énergie et SOC de plusieurs sessions
+
+        Une seule réallocation pour tout le lot ; les sessions inconnues sont
+        ignorées. Les limites qui ont changé, y compris celles des sessions
+        hors du lot, sont poussées aux chargeurs sur MQTT.
+
+        Args:
+            updates: tuples (session_id, consumed_power, vehicle_max_power,
+                total_energy, vehicle_soc)
+
+        Returns:
+            Dict[str, float]: Nouvelle puissance allouée par session
+        """
+        sessions = self.load_manager.sessions
+        for session_id, _, _, total_energy, vehicle_soc in updates:
+            session = sessions.get(session_id)
+            if session is None:
+                continue
+            session.totalEnergy = total_energy
+            if vehicle_soc is not None:
+                session.vehicleSoc = vehicle_soc
+
+        bess_status = None
+        if self.bess_controller:
+            bess_status = self.bess_controller.get_status()
+
+        allocations = self.load_manager.handle_power_updates(
+            [update[:3] for update in updates], bess_status
+        )
+
+        # Persistance différée : écrite par lot par le power_update_writer
+        for session_id, consumed_power, vehicle_max_power, total_energy, vehicle_soc in updates:
+            allocation = allocations.get(session_id)
+            if allocation is None:
+                continue
+            power_update_writer.record(
+                session_id=session_id,
+                consumed_power=consumed_power,
+                allocated_power=allocation.allocatedPower,
+                vehicle_max_power=vehicle_max_power,
+                total_energy=total_energy,
+                vehicle_soc=vehicle_soc
+            )
+
+        # Seules les limites qui ont changé sont publiées
+        self.mqtt.publish_power_limits_batch([
+            (a.chargerId, a.connectorId, a.allocatedPower) for a in allocations.values()
+        ])
+
+        return {session_id: a.allocatedPower for session_id, a in allocations.items()}
+
     async def _reallocate_all_sessions(self):
         """Réallouer la puissance pour toutes les sessions actives"""
         allocations = self.load_manager.get_current_allocations()
 
-        for allocation in allocations:
-            session = self.load_manager.sessions.get(allocation.sessionId)
-            if session:
-                # Publier la nouvelle allocation via MQTT
-                self.mqtt.publish_power_limit(
-                    charger_id=allocation.chargerId,
-                    connector_id=allocation.connectorId,
-                    power_limit=allocation.allocatedPower
-                )
+        # Publier uniquement les limites qui ont changé
+        published = self.mqtt.publish_power_limits_batch([
+            (a.chargerId, a.connectorId, a.allocatedPower) for a in allocations
+        ])
 
-        logger.info(f"Reallocated power to {len(allocations)} sessions")
+        logger.info(f"Reallocated power to {len(allocations)} sessions ({published} limits published)")
 
     async def _optimize_and_publish_bess(self):
         """Optimiser l'utilisation du BESS et publier les commandes via MQTT"""
         if not self.bess_controller:
             return
 
-        grid_available = self.config.gridCapacity - self.config.staticLoad
+        grid_available = self.load_manager.grid_available
 
-        total_consumed = sum(s.consumedPower for s in self.load_manager.sessions.values())
-        total_demand = sum(
-            min(s.vehicleMaxPower, self.load_manager._get_charger_connector_limit(s))
-            for s in self.load_manager.sessions.values()
-        )
+        total_consumed = self.load_manager.total_consumed
+        total_demand = self.load_manager.total_demand
 
         if total_demand > grid_available:
             boost_power = self.bess_controller.calculate_boost_power(
@@ -316,7 +466,7 @@ class SessionServiceMQTT:
                 self.mqtt.publish_bess_command("discharge", command.power)
                 logger.info(f"BESS command: discharge {command.power}kW")
 
-        elif total_consumed < grid_available * 0.7:
+        elif total_consumed < self.load_manager.bess_charge_threshold:
             charge_power = self.bess_controller.calculate_charge_opportunity(
                 grid_available=grid_available,
                 current_load=total_consumed
@@ -330,96 +480,64 @@ class SessionServiceMQTT:
             self.bess_controller.set_idle()
             self.mqtt.publish_bess_command("idle", 0.0)
 
+    def _build_status_skeleton(self) -> dict:
+        """Partie statique du statut station, copiée puis complétée à chaque appel"""
+        return {
+            "stationId": self.config.stationId,
+            "gridCapacity": float(self.config.gridCapacity)
+        }
+
     def get_all_sessions(self) -> Dict[str, ChargingSession]:
         """Récupérer toutes les sessions actives"""
         return self.load_manager.sessions.copy()
 
+    async def get_station_summary(self) -> dict:
+        """Obtenir les grandeurs scalaires du statut, sans les listes de sessions"""
+        total_consumed = self.load_manager.get_total_consumption()
+
+        bess_power = 0.0
+        bess_soc = None
+
+        if self.bess_controller:
+            # Le contrôleur BESS peut garder des entiers (puissance 0, SOC initial)
+            bess_status = self.bess_controller.get_status()
+            bess_power = float(bess_status.power)
+            bess_soc = float(bess_status.soc)
+
+        # total_consumed est un float : les grandeurs dérivées le sont aussi
+        status = self._status_skeleton.copy()
+        status.update({
+            "timestamp": datetime.now().isoformat(),
+            "gridPower": total_consumed - bess_power,
+            "bessPower": bess_power,
+            "bessSOC": bess_soc,
+            "totalAllocated": self.load_manager.total_allocated,
+            "totalConsumed": total_consumed,
+            "activeSessions": len(self.load_manager.sessions),
+            "availablePower": self.config.gridCapacity - total_consumed + bess_power,
+            "mqttConnected": self.mqtt.connected if self.mqtt else False
+        })
+        return status
+
     async def get_station_status(self) -> dict:
-        """Obtenir le statut complet de la station"""
-        try:
-            # Vérifications de sécurité
-            if not self.load_manager:
-                logger.error("Load manager is None")
-                return {
-                    "stationId": self.config.stationId if self.config else "unknown",
-                    "timestamp": datetime.now().isoformat(),
-                    "error": "Load manager not initialized",
-                    "gridCapacity": self.config.gridCapacity if self.config else 0,
-                    "activeSessions": 0,
-                    "sessions": [],
-                    "powerAllocation": []
-                }
-
-            total_consumed = self.load_manager.get_total_consumption()
-            allocations = self.load_manager.get_current_allocations()
-
-            bess_power = 0.0
-            bess_soc = None
-
-            if self.bess_controller:
-                try:
-                    bess_status = self.bess_controller.get_status()
-                    bess_power = bess_status.power
-                    bess_soc = bess_status.soc
-                except Exception as e:
-                    logger.error(f"Error getting BESS status: {e}")
-
-            # Construire la liste des sessions avec toutes les données
-            sessions_data = []
-            try:
-                for session in self.load_manager.sessions.values():
-                    session_dict = {
-                        "sessionId": session.sessionId,
-                        "chargerId": session.chargerId,
-                        "connectorId": session.connectorId,
-                        "status": session.status,
-                        "startTime": session.startTime.isoformat() if session.startTime else None,
-                        "vehicleMaxPower": float(session.vehicleMaxPower) if session.vehicleMaxPower else 0.0,
-                        "allocatedPower": float(session.allocatedPower) if session.allocatedPower else 0.0,
-                        "consumedPower": float(session.consumedPower) if session.consumedPower else 0.0,
-                        "offeredPower": float(session.offeredPower) if session.offeredPower else 0.0,
-                        "totalEnergy": float(session.totalEnergy) if session.totalEnergy else 0.0,
-                        "vehicleSoc": float(session.vehicleSoc) if session.vehicleSoc else 0.0
-                    }
-                    sessions_data.append(session_dict)
-            except Exception as e:
-                logger.error(f"Error building sessions data: {e}", exc_info=True)
-
-            # Construire les allocations
-            power_allocation_data = []
-            try:
-                for a in allocations:
-                    allocation_dict = {
-                        "sessionId": a.sessionId,
-                        "chargerId": a.chargerId,
-                        "connectorId": a.connectorId,
-                        "allocatedPower": float(a.allocatedPower) if a.allocatedPower else 0.0,
-                        "consumedPower": float(a.consumedPower) if a.consumedPower else 0.0,
-                        "vehicleMaxPower": float(a.vehicleMaxPower) if a.vehicleMaxPower else 0.0
-                    }
-                    power_allocation_data.append(allocation_dict)
-            except Exception as e:
-                logger.error(f"Error building allocation data: {e}", exc_info=True)
-
-            return {
-                "stationId": self.config.stationId,
-                "timestamp": datetime.now().isoformat(),
-                "gridCapacity": float(self.config.gridCapacity),
-                "gridPower": float(total_consumed - bess_power),
-                "bessPower": float(bess_power),
-                "bessSOC": float(bess_soc) if bess_soc is not None else None,
-                "totalAllocated": float(sum(a.allocatedPower for a in allocations)),
-                "totalConsumed": float(total_consumed),
-                "activeSessions": len(self.load_manager.sessions),
-                "availablePower": float(self.config.gridCapacity - total_consumed + bess_power),
-                "mqttConnected": self.mqtt.connected if self.mqtt else False,
-                "sessions": sessions_data,
-                "powerAllocation": power_allocation_data
-            }
+        """
+        Obtenir le statut complet de la station
 
-        except Exception as e:
-            logger.error(f"Error in get_station_status: {e}", exc_info=True)
-            raise
+        Le load manager est toujours créé avec le service : pas de vérification
+        ici, les erreurs éventuelles sont journalisées par la route.
+        """
+        status = await self.get_station_summary()
+
+        # Construire la liste des sessions et des allocations
+        status["sessions"] = _status_dicts(
+            self.load_manager.sessions.values(),
+            _SESSION_STATUS_KEYS, _session_status_values
+        )
+        status["powerAllocation"] = _status_dicts(
+            self.load_manager.get_current_allocations(),
+            _ALLOCATION_STATUS_KEYS, _allocation_status_values
+        )
+        return status
 
 
 # ============================================================================
@@ -428,35 +546,47 @@ class SessionServiceMQTT:
 
 async def handle_charger_telemetry_global(message: ChargerTelemetryMessage):
     """Handler global pour la télémétrie"""
-    global _global_load_manager
-
-    if not _global_load_manager:
+    load_manager = get_station_context().load_manager
+
+    # Rejet rapide : la plupart des télémétries ne concernent pas une session active.
+    # La télémétrie binaire ne porte pas l'ID de session : recherche par connecteur.
+    if message.session_id:
+        session = load_manager.sessions.get(message.session_id)
+    else:
+        session = load_manager.find_session(message.charger_id, message.connector_id)
+    if session is None:
         return
 
-    logger.debug(
-        f"Telemetry: {message.charger_id}:{message.connector_id} - "
-        f"{message.power / 1000:.1f}kW"
-    )
-
     # Mettre à jour la session en mémoire
-    if message.session_id and message.session_id in _global_load_manager.sessions:
-        session = _global_load_manager.sessions[message.session_id]
-        session.consumedPower = message.power / 1000  # W vers kW
+    load_manager.set_consumed_power(session, message.power * W_TO_KW)
+
+    if message.vehicle_soc is not None:
+        session.vehicleSoc = message.vehicle_soc
+
+    power_update_writer.record(
+        session_id=session.sessionId,
+        consumed_power=session.consumedPower,
+        allocated_power=session.allocatedPower,
+        vehicle_max_power=session.vehicleMaxPower,
+        vehicle_soc=message.vehicle_soc
+    )
 
-        if message.vehicle_soc is not None:
-            session.vehicleSoc = message.vehicle_soc
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            f"Telemetry: {message.charger_id}:{message.connector_id} - "
+            f"{session.consumedPower:.1f}kW"
+        )
 
 
 async def handle_session_start_global(message: SessionStartMessage):
     """Handler global pour le démarrage de session"""
-    global _global_station_config, _global_mqtt_service, _global_station_db_id
+    ctx = get_station_context()
 
     logger.info(f"Session start: {message.session_id}")
 
     try:
         async with AsyncSessionLocal() as db:
-            service = SessionServiceMQTT(_global_station_config, db, _global_mqtt_service)
-            service.station_db_id = _global_station_db_id
+            service = SessionServiceMQTT.from_context(ctx, db)
 
             allocated_power = await service.create_session(
                 session_id=message.session_id,
@@ -466,13 +596,6 @@ async def handle_session_start_global(message: SessionStartMessage):
                 user_id=message.user_id
             )
 
-            # Envoyer la limite de puissance
-            _global_mqtt_service.publish_power_limit(
-                charger_id=message.charger_id,
-                connector_id=message.connector_id,
-                power_limit=allocated_power
-            )
-
             logger.info(f"Session {message.session_id} started with {allocated_power:.1f}kW")
 
     except Exception as e:
@@ -481,14 +604,13 @@ async def handle_session_start_global(message: SessionStartMessage):
 
 async def handle_session_stop_global(message: SessionStopMessage):
     """Handler global pour l'arrêt de session"""
-    global _global_station_config, _global_mqtt_service, _global_station_db_id
+    ctx = get_station_context()
 
     logger.info(f"Session stop: {message.session_id}")
 
     try:
         async with AsyncSessionLocal() as db:
-            service = SessionServiceMQTT(_global_station_config, db, _global_mqtt_service)
-            service.station_db_id = _global_station_db_id
+            service = SessionServiceMQTT.from_context(ctx, db)
 
             await service.stop_session(
                 session_id=message.session_id,
@@ -503,66 +625,78 @@ async def handle_session_stop_global(message: SessionStopMessage):
 
 async def handle_session_update_global(message: SessionUpdateMessage):
     """Handler global pour la mise à jour de session"""
-    global _global_station_config, _global_mqtt_service, _global_station_db_id, _global_load_manager
-
-    logger.debug(f"Session update: {message.session_id}")
+    ctx = get_station_context()
 
     try:
-        async with AsyncSessionLocal() as db:
-            service = SessionServiceMQTT(_global_station_config, db, _global_mqtt_service)
-            service.station_db_id = _global_station_db_id
+        # Tout se passe en mémoire (persistance différée) : pas de session DB
+        service = SessionServiceMQTT.from_context(ctx, None)
+
+        # Mettre à jour la puissance ET l'énergie
+        await service.update_power_and_energy(
+            session_id=message.session_id,
+            consumed_power=message.consumed_power,
+            vehicle_max_power=message.vehicle_max_power,
+            total_energy=message.energy_delivered,
+            vehicle_soc=message.vehicle_soc
+        )
 
-            # Mettre à jour la puissance ET l'énergie
-            new_allocated = await service.update_power_and_energy(
-                session_id=message.session_id,
-                consumed_power=message.consumed_power,
-                vehicle_max_power=message.vehicle_max_power,
-                total_energy=message.energy_delivered,
-                vehicle_soc=message.vehicle_soc
-            )
-
-            # Si l'allocation a changé, envoyer la nouvelle limite
-            session = _global_load_manager.sessions.get(message.session_id)
-            if session and abs(session.allocatedPower - new_allocated) > 0.5:
-                _global_mqtt_service.publish_power_limit(
-                    charger_id=message.charger_id,
-                    connector_id=message.connector_id,
-                    power_limit=new_allocated
-                )
-                logger.info(f"Power limit updated: {message.session_id} -> {new_allocated:.1f}kW")
+        # La réallocation touche toutes les sessions : seules les limites
+        # qui ont changé sont publiées
+        ctx.mqtt.publish_power_limits_batch([
+            (a.chargerId, a.connectorId, a.allocatedPower)
+            for a in ctx.load_manager.get_current_allocations()
+        ])
 
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug(
                 f"Session {message.session_id}: "
                 f"power={message.consumed_power:.1f}kW, "
                 f"energy={message.energy_delivered:.2f}kWh, "
-                f"soc={message.vehicle_soc:.1f}%"
+                f"soc={message.vehicle_soc}%"
             )
 
     except Exception as e:
         logger.error(f"Error handling session update: {e}", exc_info=True)
 
 
+async def handle_session_update_batch_global(message: SessionUpdateBatchMessage):
+    """Handler global pour le lot de mises à jour de session d'un chargeur"""
+    ctx = get_station_context()
+
+    try:
+        # Tout se passe en mémoire (persistance différée) : pas de session DB
+        service = SessionServiceMQTT.from_context(ctx, None)
+        await service.update_power_and_energy_batch([
+            (u.session_id, u.consumed_power, u.vehicle_max_power, u.energy_delivered, u.vehicle_soc)
+            for u in message.updates
+        ])
+
+    except Exception as e:
+        logger.error(f"Error handling session update batch from {message.charger_id}: {e}", exc_info=True)
+
+
 async def handle_bess_status_global(message: BESSStatusMessage):
     """Handler global pour le statut BESS"""
-    global _global_bess_controller, _global_station_db_id, _global_station_config, _global_mqtt_service
+    ctx = get_station_context()
+    bess_controller = ctx.bess_controller
 
     logger.debug(f"BESS status: SOC={message.soc:.1f}%, Power={message.power:.1f}kW")
 
-    if _global_bess_controller:
+    if bess_controller:
         # Mettre à jour le contrôleur BESS
-        _global_bess_controller.update_from_telemetry(
+        bess_controller.update_from_telemetry(
             soc=message.soc,
             power=message.power
         )
 
         # Sauvegarder en DB
         try:
-            async with AsyncSessionLocal() as db:
+            async with AsyncSessionLocal.begin() as db:
                 bess_repo = BESSStatusRepository(db)
-                bess_status = _global_bess_controller.get_status()
+                bess_status = bess_controller.get_status()
 
                 await bess_repo.create(
-                    station_db_id=_global_station_db_id,
+                    station_db_id=ctx.station_db_id,
                     mode=bess_status.mode.value,
                     power=bess_status.power,
                     soc=bess_status.soc,
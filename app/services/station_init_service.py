@@ -3,6 +3,7 @@ from app.models.station import StationConfig
 from app.database.repositories import (
     StationRepository, ChargerRepository, ConnectorRepository
 )
+from app.database.models import ConnectorTypeEnum, ConnectorStatusEnum
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,47 +32,56 @@ class StationInitService:
 
         logger.info(f"Station {config.stationId} initialized with ID {station.id}")
 
-        # Créer les chargeurs et connecteurs
+        # Chargeurs et connecteurs déjà présents, en une seule requête
+        existing = {
+            charger.charger_id: charger
+            for charger in await charger_repo.get_all_by_station(station.id)
+        }
+        charger_db_ids = {charger_id: c.id for charger_id, c in existing.items()}
+
+        # Créer les chargeurs manquants en un seul INSERT
+        charger_rows = [
+            {
+                "station_id": station.id,
+                "charger_id": charger_config.id,
+                "max_power": charger_config.maxPower,
+                "num_connectors": len(charger_config.connectors),
+                "manufacturer": charger_config.manufacturer,
+                "model": charger_config.model
+            }
+            for charger_config in config.chargers
+            if charger_config.id not in existing
+        ]
+        charger_db_ids.update(await charger_repo.create_many(charger_rows))
+
+        for row in charger_rows:
+            logger.info(f"  Charger {row['charger_id']} created")
+        if existing:
+            logger.info(f"  {len(existing)} charger(s) already exist")
+
+        # Créer les connecteurs manquants en un seul INSERT
+        connector_rows = []
         for charger_config in config.chargers:
-            # Vérifier si le chargeur existe déjà
-            charger = await charger_repo.get_by_charger_id(
-                station.id,
-                charger_config.id
+            charger = existing.get(charger_config.id)
+            existing_connectors = (
+                {c.connector_id for c in charger.connectors} if charger else set()
             )
 
-            if not charger:
-                # Créer le chargeur
-                charger = await charger_repo.create(
-                    station_db_id=station.id,
-                    charger_id=charger_config.id,
-                    max_power=charger_config.maxPower,
-                    num_connectors=len(charger_config.connectors),
-                    manufacturer=charger_config.manufacturer,
-                    model=charger_config.model
-                )
-                logger.info(f"  Charger {charger_config.id} created")
-            else:
-                logger.info(f"  Charger {charger_config.id} already exists")
-
-            # Créer les connecteurs
             for connector_config in charger_config.connectors:
-                # Vérifier si le connecteur existe déjà
-                connector = await connector_repo.get_by_charger_and_connector_id(
-                    charger.id,
-                    connector_config.connector_id
-                )
+                if connector_config.connector_id in existing_connectors:
+                    continue
+
+                connector_rows.append({
+                    "charger_id": charger_db_ids[charger_config.id],
+                    "connector_id": connector_config.connector_id,
+                    "connector_type": ConnectorTypeEnum(connector_config.connector_type.value),
+                    "max_power": connector_config.max_power,
+                    "status": ConnectorStatusEnum.AVAILABLE
+                })
+                logger.info(f"    Connector {charger_config.id}:{connector_config.connector_id} "
+                            f"({connector_config.connector_type}) created")
 
-                if not connector:
-                    connector = await connector_repo.create(
-                        charger_db_id=charger.id,
-                        connector_id=connector_config.connector_id,
-                        connector_type=connector_config.connector_type.value,
-                        max_power=connector_config.max_power
-                    )
-                    logger.info(f"    Connector {connector_config.connector_id} "
-                                f"({connector_config.connector_type}) created")
-                else:
-                    logger.info(f"    Connector {connector_config.connector_id} "
-                                f"already exists")
+        await connector_repo.create_many(connector_rows)
 
+        await db.commit()
         return station
@@ -0,0 +1,170 @@
+import asyncio
+import orjson
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.config import settings
+from app.database.connection import AsyncSessionLocal
+from app.database.repositories import EventRepository, SessionRepository
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter(ABC):
+    """
+    Écriture différée en base de données
+
+    Les écritures sont mises en tampon en mémoire puis persistées par lots
+    par une tâche de fond, hors du chemin des sessions.
+    """
+
+    def __init__(self, sessionmaker: async_sessionmaker[AsyncSession], flush_interval: float):
+        self._sessionmaker = sessionmaker
+        self.flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+        # Réveille la tâche de fond avant la fin de l'intervalle
+        self._wakeup = asyncio.Event()
+
+    @abstractmethod
+    def _drain(self) -> list:
+        """Vider le tampon et retourner son contenu"""
+
+    @abstractmethod
+    async def _write(self, db: AsyncSession, batch: list) -> int:
+        """Persister un lot"""
+
+    async def flush(self) -> int:
+        """Écrire les données en attente, retourne le nombre de lignes écrites"""
+        batch = self._drain()
+        if not batch:
+            return 0
+
+        try:
+            async with self._sessionmaker.begin() as db:
+                return await self._write(db, batch)
+        except Exception as e:
+            logger.error(f"{type(self).__name__}: error flushing {len(batch)} rows: {e}", exc_info=True)
+            return 0
+
+    async def _run(self):
+        """Boucle de vidage périodique du tampon"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """Démarrer la tâche de fond"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"{type(self).__name__} started (flush every {self.flush_interval}s)")
+
+    async def stop(self):
+        """Arrêter la tâche de fond et écrire les dernières données"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+class EventWriter(BufferedWriter):
+    """
+    Événements du Load Management, insérés par lots via COPY
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+        flush_interval: float = settings.EVENT_FLUSH_INTERVAL,
+        buffer_size: int = settings.EVENT_BUFFER_SIZE,
+        flush_batch_size: int = settings.EVENT_FLUSH_BATCH_SIZE
+    ):
+        super().__init__(sessionmaker, flush_interval)
+        self.flush_batch_size = flush_batch_size
+        # Si la base ne suit pas, les événements les plus anciens sont abandonnés
+        self._buffer: deque = deque(maxlen=buffer_size)
+
+    def record(self, event_type: str, description: str, data: dict = None):
+        """Ajouter un événement au tampon (non bloquant)"""
+        self._buffer.append((
+            datetime.utcnow(),
+            event_type,
+            description,
+            # Colonne JSON : COPY attend le texte, pas des bytes
+            orjson.dumps(data).decode() if data is not None else None
+        ))
+        if len(self._buffer) >= self.flush_batch_size:
+            self._wakeup.set()
+
+    def _drain(self) -> list:
+        batch = list(self._buffer)
+        self._buffer.clear()
+        return batch
+
+    async def _write(self, db: AsyncSession, batch: list) -> int:
+        return await EventRepository(db).copy_records(batch)
+
+
+class PowerUpdateWriter(BufferedWriter):
+    """
+    Mises à jour de puissance/énergie des sessions
+
+    Seule la dernière valeur de chaque session est gardée entre deux
+    vidages : un seul UPDATE groupé remplace un UPDATE par message.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+        flush_interval: float = settings.SESSION_UPDATE_FLUSH_INTERVAL
+    ):
+        super().__init__(sessionmaker, flush_interval)
+        self._pending: Dict[str, dict] = {}
+
+    def record(self, session_id: str, consumed_power: float, allocated_power: float,
+               vehicle_max_power: float, total_energy: float = None,
+               vehicle_soc: float = None):
+        """Enregistrer l'état courant d'une session (non bloquant)"""
+        previous = self._pending.get(session_id)
+        if previous is not None:
+            # Une télémétrie sans énergie/SOC ne doit pas effacer une valeur en attente
+            if total_energy is None:
+                total_energy = previous["total_energy"]
+            if vehicle_soc is None:
+                vehicle_soc = previous["vehicle_soc"]
+
+        self._pending[session_id] = {
+            "session_id": session_id,
+            "consumed_power": consumed_power,
+            "allocated_power": allocated_power,
+            "vehicle_max_power": vehicle_max_power,
+            "total_energy": total_energy,
+            "vehicle_soc": vehicle_soc
+        }
+
+    def discard(self, session_id: str):
+        """Abandonner la mise à jour en attente d'une session terminée"""
+        self._pending.pop(session_id, None)
+
+    def _drain(self) -> list:
+        batch = list(self._pending.values())
+        self._pending = {}
+        return batch
+
+    async def _write(self, db: AsyncSession, batch: list) -> int:
+        return await SessionRepository(db).update_power_bulk(batch)
+
+
+# Instances globales
+event_writer = EventWriter()
+power_update_writer = PowerUpdateWriter()
@@ -0,0 +1,183 @@
+import pytest
+from app.models.station import StationConfig
+from app.core.load_management import LoadManagementAlgorithm
+
+
+@pytest.fixture
+def station_config():
+    """Station de test : 2 chargeurs de 200kW, réseau de 400kW"""
+    return StationConfig(
+        stationId="ELECTRA_TEST_LM",
+        gridCapacity=400,
+        staticLoad=3.0,
+        chargers=[
+            {
+                "id": "CP001",
+                "maxPower": 200,
+                "connectors": [
+                    {"connector_id": 1, "connector_type": "CCS2", "max_power": 150.0},
+                    {"connector_id": 2, "connector_type": "CCS2", "max_power": 150.0}
+                ]
+            },
+            {
+                "id": "CP002",
+                "maxPower": 200,
+                "connectors": [
+                    {"connector_id": 1, "connector_type": "CCS2", "max_power": 150.0},
+                    {"connector_id": 2, "connector_type": "CCS2", "max_power": 150.0}
+                ]
+            }
+        ]
+    )
+
+
+def _full_totals(load_manager: LoadManagementAlgorithm):
+    """Recalcul complet des totaux pour comparaison"""
+    sessions = load_manager.sessions.values()
+    return (
+        sum(s.consumedPower for s in sessions),
+        sum(s.allocatedPower for s in sessions)
+    )
+
+
+def test_incremental_totals_match_full_recompute(station_config):
+    """Les totaux incrémentaux restent égaux au recalcul complet"""
+    lm = LoadManagementAlgorithm(station_config)
+
+    lm.handle_session_start("S1", "CP001", 1, 150)
+    lm.handle_session_start("S2", "CP001", 2, 150)
+    lm.handle_session_start("S3", "CP002", 1, 150)
+
+    lm.handle_power_update("S1", 90.0, 150)
+    lm.handle_power_update("S2", 95.5, 150)
+    lm.handle_power_update("S3", 140.0, 150)
+    lm.handle_power_update("S1", 99.0, 150)
+
+    consumed, allocated = _full_totals(lm)
+    assert lm.total_consumed == pytest.approx(consumed)
+    assert lm.total_allocated == pytest.approx(allocated)
+    assert lm.get_total_consumption() == pytest.approx(consumed + station_config.staticLoad)
+
+    lm.handle_session_stop("S2", consumed_energy=10.0)
+
+    consumed, allocated = _full_totals(lm)
+    assert lm.total_consumed == pytest.approx(consumed)
+    assert lm.total_allocated == pytest.approx(allocated)
+
+
+def _full_demand(load_manager: LoadManagementAlgorithm):
+    """Recalcul complet de la demande pour comparaison"""
+    return sum(
+        min(s.vehicleMaxPower, load_manager._get_charger_connector_limit(s))
+        for s in load_manager.sessions.values()
+    )
+
+
+def test_incremental_demand_follows_charger_sharing(station_config):
+    """La demande incrémentale suit le partage de puissance entre connecteurs"""
+    lm = LoadManagementAlgorithm(station_config)
+
+    lm.handle_session_start("S1", "CP001", 1, 150)
+    assert lm.total_demand == pytest.approx(150.0)
+
+    # Deux sessions sur CP001 : 100kW par connecteur
+    lm.handle_session_start("S2", "CP001", 2, 150)
+    assert lm.total_demand == pytest.approx(200.0)
+
+    lm.handle_session_start("S3", "CP002", 1, 80)
+    lm.handle_power_update("S3", 50.0, 120)
+    assert lm.total_demand == pytest.approx(_full_demand(lm))
+    assert lm.total_demand == pytest.approx(320.0)
+
+    lm.handle_session_stop("S1", consumed_energy=5.0)
+    assert lm.total_demand == pytest.approx(_full_demand(lm))
+    assert lm.total_demand == pytest.approx(270.0)
+
+
+def test_resync_corrects_direct_writes(station_config):
+    """Le recalcul périodique corrige une écriture directe sur une session"""
+    lm = LoadManagementAlgorithm(station_config)
+    lm.handle_session_start("S1", "CP001", 1, 150)
+
+    # Écriture qui contourne set_consumed_power
+    lm.sessions["S1"].consumedPower = 42.0
+    assert lm.total_consumed == pytest.approx(0.0)
+
+    lm._resync_totals()
+    assert lm.total_consumed == pytest.approx(42.0)
+
+
+def test_session_and_allocation_serialization(station_config):
+    """Les sessions et allocations (dataclasses) restent sérialisables en JSON"""
+    from dataclasses import asdict
+    from fastapi.encoders import jsonable_encoder
+    from app.models.session import SessionStatus
+
+    lm = LoadManagementAlgorithm(station_config)
+    lm.handle_session_start("S1", "CP001", 1, 150)
+    session = lm.sessions["S1"]
+
+    assert session.status is SessionStatus.ACTIVE
+    assert not hasattr(session, "__dict__")
+
+    data = jsonable_encoder(asdict(session))
+    assert data["status"] == "active"
+    assert data["allocatedPower"] == pytest.approx(150.0)
+    assert isinstance(data["startTime"], str)
+
+    allocations = jsonable_encoder([asdict(a) for a in lm.get_current_allocations()])
+    assert allocations[0]["sessionId"] == "S1"
+
+
+def test_fast_path_matches_full_allocation(station_config):
+    """Sans bridage, la mise à jour incrémentale donne l'allocation complète"""
+    lm = LoadManagementAlgorithm(station_config)
+    lm.handle_session_start("S1", "CP001", 1, 150)
+    lm.handle_session_start("S2", "CP002", 1, 60)
+
+    allocated = lm.handle_power_update("S2", 55.0, 120)
+    assert allocated == pytest.approx(120.0)
+    assert not lm._throttled
+
+    expected = {sid: a.allocatedPower for sid, a in lm.calculate_power_allocation(lm.sessions).items()}
+    assert {sid: s.allocatedPower for sid, s in lm.sessions.items()} == pytest.approx(expected)
+    assert lm.total_allocated == pytest.approx(sum(expected.values()))
+
+    # Dépassement de la capacité : retour au calcul complet et proportionnel
+    lm.handle_session_start("S3", "CP002", 2, 150)
+    lm.handle_power_update("S1", 100.0, 150)
+    assert lm.total_allocated <= station_config.gridCapacity - station_config.staticLoad + 0.5
+
+
+def test_allocations_keyed_by_session_in_start_order(station_config):
+    """Les allocations sont indexées par session, dans l'ordre de démarrage"""
+    lm = LoadManagementAlgorithm(station_config)
+    lm.handle_session_start("S2", "CP002", 1, 150)
+    lm.handle_session_start("S1", "CP001", 1, 150)
+
+    allocations = lm.calculate_power_allocation(lm.sessions)
+
+    assert list(allocations) == ["S2", "S1"]
+    assert allocations["S1"].sessionId == "S1"
+    assert lm.calculate_power_allocation({}) == {}
+
+
+def test_batched_power_updates_match_sequential(station_config):
+    """Un lot de mises à jour donne les mêmes allocations que des appels successifs"""
+    updates = [("S1", 90.0, 150), ("S2", 140.0, 150), ("S3", 60.0, 80), ("SX", 10.0, 10)]
+
+    sequential = LoadManagementAlgorithm(station_config)
+    batched = LoadManagementAlgorithm(station_config)
+    for lm in (sequential, batched):
+        lm.handle_session_start("S1", "CP001", 1, 150)
+        lm.handle_session_start("S2", "CP001", 2, 150)
+        lm.handle_session_start("S3", "CP002", 1, 150)
+
+    for update in updates:
+        sequential.handle_power_update(*update)
+    allocations = batched.handle_power_updates(updates)
+
+    assert set(allocations) == {"S1", "S2", "S3"}
+    for session_id, alloc in allocations.items():
+        assert alloc.allocatedPower == pytest.approx(sequential.sessions[session_id].allocatedPower)
+    assert batched.total_allocated == pytest.approx(sequential.total_allocated)
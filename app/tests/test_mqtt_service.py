@@ -0,0 +1,181 @@
+import asyncio
+import pytest
+from app.services.mqtt_service import MQTTService
+
+
+@pytest.mark.asyncio
+async def test_messages_of_a_charger_are_processed_in_order():
+    """Les messages d'un même chargeur sont traités dans l'ordre de réception"""
+    service = MQTTService("ELECTRA_TEST_MQTT")
+    received = []
+
+    async def on_update(message):
+        await asyncio.sleep(0)
+        received.append((message.charger_id, message.energy_delivered))
+
+    service.register_session_update_handler(on_update)
+    service.start_workers(num_workers=3, queue_size=100)
+
+    for i in range(20):
+        for charger_id in ("CP001", "CP002"):
+            service._enqueue("session_update", {
+                "timestamp": "2024-01-01T00:00:00Z",
+                "charger_id": charger_id,
+                "connector_id": 1,
+                "session_id": f"S-{charger_id}",
+                "consumed_power": 50.0,
+                "vehicle_max_power": 150.0,
+                "energy_delivered": float(i)
+            })
+
+    await asyncio.gather(*(q.join() for q in service._queues))
+    await service.stop_workers()
+
+    for charger_id in ("CP001", "CP002"):
+        energies = [e for c, e in received if c == charger_id]
+        assert energies == [float(i) for i in range(20)]
+
+
+class _RecordingClient:
+    """Client MQTT minimal qui enregistre les publications"""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append(topic)
+
+        class _Result:
+            rc = 0
+        return _Result()
+
+
+def test_power_limits_batch_skips_unchanged_limits():
+    """Seules les limites qui ont changé de plus de 0.5kW sont republiées"""
+    service = MQTTService("ELECTRA_TEST_MQTT")
+    service.client = _RecordingClient()
+    service.connected = True
+
+    limits = [("CP001", 1, 100.0), ("CP001", 2, 100.0), ("CP002", 1, 150.0)]
+    assert service.publish_power_limits_batch(limits) == 3
+
+    limits = [("CP001", 1, 100.3), ("CP001", 2, 75.0), ("CP002", 1, 150.0)]
+    assert service.publish_power_limits_batch(limits) == 1
+    assert service.client.published[-1].endswith("/charger/CP001/connector/2/power_limit")
+
+    # Nouvelle session sur le connecteur : la limite est renvoyée même inchangée
+    service.forget_power_limit("CP002", 1)
+    assert service.publish_power_limits_batch([("CP002", 1, 150.0)]) == 1
+
+
+def test_handlers_registered_once():
+    """Un second enregistrement du jeu de handlers est ignoré"""
+    service = MQTTService("ELECTRA_TEST_MQTT")
+    handlers = dict.fromkeys(
+        ("telemetry", "session_start", "session_stop", "session_update",
+         "session_update_batch", "bess_status"),
+        lambda message: None
+    )
+
+    assert service.register_handlers_once(**handlers) is True
+    assert service.register_handlers_once(**handlers) is False
+    assert len(service.session_update_handlers) == 1
+    assert len(service.bess_status_handlers) == 1
+
+@pytest.mark.asyncio
+async def test_session_update_batch_routed_to_batch_handlers():
+    """Un lot publié sur update_batch n'est pas pris pour une mise à jour simple"""
+    service = MQTTService("ELECTRA_TEST_MQTT")
+    service.loop = asyncio.get_running_loop()
+    received = []
+
+    async def on_batch(message):
+        received.append([u.session_id for u in message.updates])
+
+    async def on_update(message):
+        received.append(message.session_id)
+
+    service.register_session_update_batch_handler(on_batch)
+    service.register_session_update_handler(on_update)
+    service.start_workers(num_workers=2, queue_size=10)
+
+    class _Message:
+        topic = "electra/ELECTRA_TEST_MQTT/charger/CP001/session/update_batch"
+        payload = (
+            b'{"timestamp": "2024-01-01T00:00:00Z", "charger_id": "CP001", "updates": ['
+            b'{"connector_id": 1, "session_id": "S1", "consumed_power": 50.0,'
+            b' "vehicle_max_power": 150.0, "vehicle_soc": 42.0, "energy_delivered": 1.5}]}'
+        )
+
+    service._on_message(None, None, _Message())
+    await asyncio.sleep(0)
+    await asyncio.gather(*(q.join() for q in service._queues))
+    await service.stop_workers()
+
+    assert received == [["S1"]]
+
+
+@pytest.mark.asyncio
+async def test_binary_telemetry_decoded_as_charger_telemetry():
+    """Une télémétrie binaire est décodée et traitée comme la télémétrie JSON"""
+    from app.mqtt.messages import CHARGER_TELEMETRY_STRUCT
+
+    service = MQTTService("ELECTRA_TEST_MQTT")
+    service.loop = asyncio.get_running_loop()
+    received = []
+
+    async def on_telemetry(message):
+        received.append(message)
+
+    service.register_telemetry_handler(on_telemetry)
+    service.start_workers(num_workers=2, queue_size=10)
+
+    class _Message:
+        topic = "electra/ELECTRA_TEST_MQTT/charger/CP002/telemetry/bin"
+        payload = CHARGER_TELEMETRY_STRUCT.pack(2, 400.0, 250.0, 100000.0, 42.5, 1704067200)
+
+    service._on_message(None, None, _Message())
+    await asyncio.sleep(0)
+    await asyncio.gather(*(q.join() for q in service._queues))
+    await service.stop_workers()
+
+    message, = received
+    assert (message.charger_id, message.connector_id) == ("CP002", 2)
+    assert message.session_id is None
+    assert message.power == pytest.approx(100000.0)
+    assert message.vehicle_soc == pytest.approx(42.5)
+    assert message.timestamp.year == 2024
+
+
+@pytest.mark.asyncio
+async def test_fake_transport_delivers_to_subscribed_service():
+    """Le transport en mémoire remet les publications aux workers, sans broker"""
+    from app.mqtt.fake_transport import FakeMqttTransport
+
+    transport = FakeMqttTransport()
+    service = MQTTService("ELECTRA_TEST_MQTT")
+    service.initialize(transport)
+    service.set_event_loop(asyncio.get_running_loop())
+    received = []
+
+    async def on_start(message):
+        received.append(message.session_id)
+
+    service.register_session_start_handler(on_start)
+    service.start_workers(num_workers=2, queue_size=10)
+
+    info = transport.publish(
+        "electra/ELECTRA_TEST_MQTT/charger/CP001/session/start",
+        b'{"timestamp": "2024-01-01T00:00:00Z", "charger_id": "CP001", "connector_id": 1,'
+        b' "session_id": "S1", "vehicle_max_power": 150.0}',
+        qos=1
+    )
+    # Topic auquel le service n'est pas abonné : ignoré
+    transport.publish("electra/OTHER_STATION/charger/CP001/session/start", b"{}")
+    await asyncio.sleep(0)
+    await asyncio.gather(*(q.join() for q in service._queues))
+    await service.stop_workers()
+
+    assert service.connected
+    assert info.is_published()
+    assert received == ["S1"]
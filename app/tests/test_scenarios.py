@@ -1,44 +1,187 @@
 import pytest
 import json
+from contextlib import asynccontextmanager
+from datetime import datetime
 from pathlib import Path
+from types import SimpleNamespace
 from app.models.station import StationConfig
+from app.services import session_service as session_service_module
 from app.services.session_service import SessionService
-import time
 
 
-def load_scenario(scenario_file: str):
-    """Charger un fichier de scénario"""
-    path = Path("scenarios") / scenario_file
-    with open(path, 'r') as f:
-        return json.load(f)
+SCENARIO_NAMES = ["scenario_1_static", "scenario_2_dynamic", "scenario_3_bess"]
+SCENARIOS_DIR = Path(__file__).resolve().parents[2] / "scenarios"
 
 
-def test_scenario_1_static_load():
+@pytest.fixture(scope="session")
+def scenarios():
+    """Fichiers de scénario, lus et parsés une seule fois par session de test"""
+    return {
+        name: json.loads((SCENARIOS_DIR / f"{name}.json").read_bytes())
+        for name in SCENARIO_NAMES
+    }
+
+
+class InMemoryStore:
+    """
+    Base simulée d'un scénario : chargeurs, connecteurs, sessions et lignes
+    de métriques. Les repositories PostgreSQL (CTE avec UPDATE ... RETURNING,
+    COPY) sont remplacés par les doubles ci-dessous, qui travaillent ici.
+    """
+
+    def __init__(self, config: StationConfig):
+        self.station_db_id = 1
+        self.chargers = {c.id: i for i, c in enumerate(config.chargers, start=1)}
+        self.connectors = {
+            (c.id, conn.connector_id): i * 10 + conn.connector_id
+            for i, c in enumerate(config.chargers, start=1)
+            for conn in c.connectors
+        }
+        self.sessions = {}
+        self.power_metrics = []
+        self.bess_status = []
+
+
+class InMemorySessionmaker:
+    """async_sessionmaker minimal : chaque « session » est le store du scénario"""
+
+    def __init__(self, store: InMemoryStore):
+        self.store = store
+
+    @asynccontextmanager
+    async def __call__(self):
+        yield self.store
+
+    begin = __call__
+
+
+class _StationRepository:
+    def __init__(self, db: InMemoryStore):
+        self.db = db
+
+    async def get_by_station_id(self, station_id: str):
+        return SimpleNamespace(id=self.db.station_db_id)
+
+
+class _ChargerRepository:
+    def __init__(self, db: InMemoryStore):
+        self.db = db
+
+    async def get_charger_and_connector_ids(self, station_db_id: int, charger_id: str,
+                                            connector_id: int):
+        charger_db_id = self.db.chargers.get(charger_id)
+        if charger_db_id is None:
+            return None
+        return charger_db_id, self.db.connectors.get((charger_id, connector_id))
+
+
+class _SessionRepository:
+    def __init__(self, db: InMemoryStore):
+        self.db = db
+
+    async def create_and_occupy(self, session_id: str, station_db_id: int,
+                                charger_db_id: int, connector_id: int,
+                                vehicle_max_power: float, allocated_power: float):
+        self.db.sessions[session_id] = SimpleNamespace(
+            session_id=session_id, connector_id=connector_id, status="active",
+            start_time=datetime.utcnow(), vehicle_max_power=vehicle_max_power,
+            allocated_power=allocated_power, consumed_power=0.0, total_energy=0.0
+        )
+
+    async def complete_and_release(self, session_id: str, total_energy: float):
+        session = self.db.sessions.get(session_id)
+        if session is None or session.status != "active":
+            return None
+        session.status = "completed"
+        session.total_energy = total_energy
+        return session
+
+    async def update_power_bulk(self, updates: list) -> int:
+        for u in updates:
+            session = self.db.sessions.get(u["session_id"])
+            if session is not None and session.status == "active":
+                session.consumed_power = u["consumed_power"]
+                session.allocated_power = u["allocated_power"]
+                session.vehicle_max_power = u["vehicle_max_power"]
+        return len(updates)
+
+
+class _RowRepository:
+    """PowerMetricRepository / BESSStatusRepository : lignes ajoutées à une liste"""
+
+    table = ""
+
+    def __init__(self, db: InMemoryStore):
+        self.rows = getattr(db, self.table)
+
+    async def create(self, **fields):
+        self.rows.append(fields)
+
+
+class _PowerMetricRepository(_RowRepository):
+    table = "power_metrics"
+
+
+class _BESSStatusRepository(_RowRepository):
+    table = "bess_status"
+
+
+@pytest.fixture
+def make_service(scenarios, monkeypatch):
+    """
+    Construire la config de station et un SessionService initialisé pour un
+    scénario, sur une base en mémoire propre au test
+
+    Retourne (config, service, store).
+    """
+    for name, repository in (
+        ("StationRepository", _StationRepository),
+        ("ChargerRepository", _ChargerRepository),
+        ("SessionRepository", _SessionRepository),
+        ("PowerMetricRepository", _PowerMetricRepository),
+        ("BESSStatusRepository", _BESSStatusRepository)
+    ):
+        monkeypatch.setattr(session_service_module, name, repository)
+
+    async def _make(scenario_name: str):
+        config = StationConfig(**scenarios[scenario_name]['stationConfig'])
+        store = InMemoryStore(config)
+        service = SessionService(config, InMemorySessionmaker(store))
+        await service.initialize()
+        return config, service, store
+    return _make
+
+
+@pytest.mark.asyncio
+async def test_scenario_1_static_load(make_service):
     """
     Scenario 1: Static Load Management on a single charger
     2 vehicles on same charger, 150kW each → each gets 100kW
     """
-    scenario = load_scenario("scenario_1_static.json")
-
     # Créer le service avec la config du scénario
-    config = StationConfig(**scenario['stationConfig'])
-    service = SessionService(config)
+    config, service, store = await make_service("scenario_1_static")
 
     # Démarrer les 2 sessions
-    session1_allocated = service.create_session(
+    session1_allocated = await service.create_session(
         session_id="S1",
         charger_id="CP001",
         connector_id=1,
         vehicle_max_power=150
     )
 
-    session2_allocated = service.create_session(
+    session2_allocated = await service.create_session(
         session_id="S2",
         charger_id="CP001",
         connector_id=2,
         vehicle_max_power=150
     )
 
+    # S1 a été réallouée à l'arrivée de S2 : lire les allocations courantes
+    allocations = {a.sessionId: a.allocatedPower
+                   for a in service.load_manager.get_current_allocations()}
+    session1_allocated = allocations["S1"]
+    session2_allocated = allocations["S2"]
+
     # Vérifications
     print(f"\n=== Scenario 1 Results ===")
     print(f"Session 1 allocated: {session1_allocated}kW")
@@ -49,30 +192,28 @@ def test_scenario_1_static_load():
     assert abs(session2_allocated - 100) < 1, f"Expected ~100kW, got {session2_allocated}kW"
 
     # Vérifier la conformité grid
-    status = service.get_station_status()
+    status = await service.get_station_status()
     assert status['totalAllocated'] <= config.gridCapacity, "Grid capacity exceeded!"
 
     print(f"✓ Total allocated: {status['totalAllocated']}kW (grid: {config.gridCapacity}kW)")
     print("✓ Scenario 1 PASSED")
 
 
-def test_scenario_2_dynamic_reallocation():
+@pytest.mark.asyncio
+async def test_scenario_2_dynamic_reallocation(make_service):
     """
     Scenario 2: Dynamic Power Re-allocation
     Test power reallocation as vehicles arrive and leave
     """
-    scenario = load_scenario("scenario_2_dynamic.json")
-
-    config = StationConfig(**scenario['stationConfig'])
-    service = SessionService(config)
+    config, service, store = await make_service("scenario_2_dynamic")
 
     print(f"\n=== Scenario 2: Dynamic Re-allocation ===")
 
     # T0: 2 vehicles start charging
-    s1_power = service.create_session("S1", "CP001", 1, 150)
-    s2_power = service.create_session("S2", "CP001", 2, 150)
+    s1_power = await service.create_session("S1", "CP001", 1, 150)
+    s2_power = await service.create_session("S2", "CP001", 2, 150)
 
-    status = service.get_station_status()
+    status = await service.get_station_status()
     print(f"\nT0: 2 vehicles")
     print(f"  S1: {s1_power}kW, S2: {s2_power}kW")
     print(f"  Total: {status['totalAllocated']}kW")
@@ -82,17 +223,17 @@ def test_scenario_2_dynamic_reallocation():
     assert s2_power >= 145, f"Expected ~150kW, got {s2_power}kW"
 
     # T1: 3rd vehicle arrives
-    s3_power = service.create_session("S3", "CP002", 1, 150)
+    s3_power = await service.create_session("S3", "CP002", 1, 150)
 
-    status = service.get_station_status()
+    status = await service.get_station_status()
     print(f"\nT1: 3rd vehicle arrives")
     print(f"  Total allocated: {status['totalAllocated']}kW")
     print(f"  Active sessions: {status['activeSessions']}")
 
     # T2: 4th vehicle arrives - grid becomes constrained
-    s4_power = service.create_session("S4", "CP002", 2, 150)
+    s4_power = await service.create_session("S4", "CP002", 2, 150)
 
-    status = service.get_station_status()
+    status = await service.get_station_status()
     allocations = service.load_manager.get_current_allocations()
 
     print(f"\nT2: 4th vehicle arrives (GRID CONSTRAINED)")
@@ -110,9 +251,9 @@ def test_scenario_2_dynamic_reallocation():
     assert 95 <= avg_power <= 105, f"Expected ~99kW per vehicle, got {avg_power}kW"
 
     # T3: 1st vehicle finishes
-    service.stop_session("S1", consumed_energy=12.5)
+    await service.stop_session("S1", consumed_energy=12.5)
 
-    status = service.get_station_status()
+    status = await service.get_station_status()
     allocations = service.load_manager.get_current_allocations()
 
     print(f"\nT3: 1st vehicle left (POWER REALLOCATION)")
@@ -131,15 +272,13 @@ def test_scenario_2_dynamic_reallocation():
     print("✓ Scenario 2 PASSED")
 
 
-def test_scenario_3_bess_boost():
+@pytest.mark.asyncio
+async def test_scenario_3_bess_boost(make_service):
     """
     Scenario 3: Battery Boost Integration
     Test BESS providing boost power when grid is constrained
     """
-    scenario = load_scenario("scenario_3_bess.json")
-
-    config = StationConfig(**scenario['stationConfig'])
-    service = SessionService(config)
+    config, service, store = await make_service("scenario_3_bess")
 
     print(f"\n=== Scenario 3: BESS Boost ===")
     print(f"Grid capacity: {config.gridCapacity}kW")
@@ -147,29 +286,31 @@ def test_scenario_3_bess_boost():
     print(f"BESS power: {config.battery.power}kW")
 
     # T0: 2 vehicles start
-    s1_power = service.create_session("S1", "CP001", 1, 150)
-    s2_power = service.create_session("S2", "CP001", 2, 150)
+    s1_power = await service.create_session("S1", "CP001", 1, 150)
+    s2_power = await service.create_session("S2", "CP001", 2, 150)
 
-    status = service.get_station_status()
+    status = await service.get_station_status()
     print(f"\nT0: 2 vehicles")
     print(f"  Total allocated: {status['totalAllocated']}kW")
     print(f"  BESS SOC: {status['bessSOC']:.1f}%")
     print(f"  BESS Power: {status['bessPower']}kW")
 
     # T1: 3rd vehicle
-    s3_power = service.create_session("S3", "CP002", 1, 150)
+    s3_power = await service.create_session("S3", "CP002", 1, 150)
 
     # T2: 4th vehicle - demand exceeds grid, BESS should boost
-    s4_power = service.create_session("S4", "CP002", 2, 150)
+    s4_power = await service.create_session("S4", "CP002", 2, 150)
 
     # Simuler quelques updates pour activer le BESS
     for i in range(5):
-        service.update_power("S1", 150, 150)
-        service.update_power("S2", 150, 150)
-        service.update_power("S3", 150, 150)
-        service.update_power("S4", 150, 150)
-
-    status = service.get_station_status()
+        await service.update_power_many([
+            ("S1", 150, 150),
+            ("S2", 150, 150),
+            ("S3", 150, 150),
+            ("S4", 150, 150)
+        ])
+
+    status = await service.get_station_status()
     allocations = service.load_manager.get_current_allocations()
 
     print(f"\nT2: 4 vehicles (BESS BOOST ACTIVATED)")
@@ -192,15 +333,17 @@ def test_scenario_3_bess_boost():
     assert avg_power > 130, f"With BESS boost, expected >130kW per vehicle, got {avg_power}kW"
 
     # T3: 1 vehicle leaves
-    service.stop_session("S1", consumed_energy=25)
+    await service.stop_session("S1", consumed_energy=25)
 
     # Simuler quelques updates
     for i in range(5):
-        service.update_power("S2", 120, 150)
-        service.update_power("S3", 120, 150)
-        service.update_power("S4", 120, 150)
+        await service.update_power_many([
+            ("S2", 120, 150),
+            ("S3", 120, 150),
+            ("S4", 120, 150)
+        ])
 
-    status = service.get_station_status()
+    status = await service.get_station_status()
 
     print(f"\nT3: 1st vehicle left")
     print(f"  Active sessions: {status['activeSessions']}")
@@ -217,3 +360,26 @@ def test_scenario_3_bess_boost():
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])
+
+
+@pytest.mark.asyncio
+async def test_update_power_many_updates_active_sessions(make_service):
+    """Une réallocation pour tout le lot, les sessions terminées sont ignorées"""
+    config, service, store = await make_service("scenario_1_static")
+
+    await service.create_session("S1", "CP001", 1, 150)
+    await service.create_session("S2", "CP001", 2, 150)
+    await service.stop_session("S2", consumed_energy=5.0)
+
+    allocations = await service.update_power_many([
+        ("S1", 80.0, 120.0),
+        ("S2", 60.0, 120.0)
+    ])
+
+    assert set(allocations) == {"S1"}
+    assert store.sessions["S1"].consumed_power == 80.0
+    assert store.sessions["S1"].vehicle_max_power == 120.0
+    assert store.sessions["S1"].allocated_power == allocations["S1"]
+    assert store.sessions["S2"].status == "completed"
+    assert store.sessions["S2"].consumed_power == 0.0
+    assert len(store.power_metrics) > 0
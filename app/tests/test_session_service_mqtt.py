@@ -0,0 +1,111 @@
+import pytest
+from datetime import datetime
+from app.models.station import StationConfig
+from app.mqtt.messages import SessionUpdateMessage
+from app.services import session_service_mqtt
+from app.services.session_service_mqtt import SessionServiceMQTT, MAX_ENERGY_INTERVAL
+
+
+@pytest.fixture
+def station_config():
+    """Station de test : 1 chargeur de 200kW, réseau de 400kW"""
+    return StationConfig(
+        stationId="ELECTRA_TEST_SVC",
+        gridCapacity=400,
+        staticLoad=3.0,
+        chargers=[
+            {
+                "id": "CP001",
+                "maxPower": 200,
+                "connectors": [
+                    {"connector_id": 1, "connector_type": "CCS2", "max_power": 150.0},
+                    {"connector_id": 2, "connector_type": "CCS2", "max_power": 150.0}
+                ]
+            }
+        ]
+    )
+
+
+class _RecordingMQTT:
+    """Service MQTT minimal qui enregistre les limites publiées"""
+
+    def __init__(self):
+        self.limits = []
+
+    def publish_power_limits_batch(self, limits, threshold=0.5):
+        self.limits.extend(limits)
+        return len(limits)
+
+
+@pytest.mark.asyncio
+async def test_energy_integrated_over_elapsed_time(station_config):
+    """L'énergie est intégrée sur l'intervalle entre deux mises à jour"""
+    service = SessionServiceMQTT(station_config, None, _RecordingMQTT())
+    service.load_manager.handle_session_start("S1", "CP001", 1, 150)
+    session = service.load_manager.sessions["S1"]
+    start = session.startTime.timestamp()
+
+    # Ticks de 2s à 90kW : 0.05kWh par tick
+    await service.update_power_and_energy_many([("S1", 90.0, 150.0, start + 2.0)])
+    await service.update_power_and_energy_many([("S1", 90.0, 150.0, start + 4.0)])
+    assert session.totalEnergy == pytest.approx(0.1)
+
+    # Message en retard : rien n'est compté deux fois
+    await service.update_power_and_energy_many([("S1", 90.0, 150.0, start + 3.0)])
+    assert session.totalEnergy == pytest.approx(0.1)
+
+    # Long silence : intervalle plafonné
+    await service.update_power_and_energy_many([("S1", 36.0, 150.0, start + 1000.0)])
+    assert session.totalEnergy == pytest.approx(0.1 + 36.0 * MAX_ENERGY_INTERVAL / 3600)
+
+
+def test_status_dicts_are_built_per_call(station_config):
+    """Chaque appel renvoie des dicts neufs, que l'appelant peut modifier"""
+    from app.services.session_service_mqtt import (
+        _status_dicts, _SESSION_STATUS_KEYS, _session_status_values
+    )
+
+    service = SessionServiceMQTT(station_config, None, _RecordingMQTT())
+    service.load_manager.handle_session_start("S1", "CP001", 1, 150)
+    sessions = service.load_manager.sessions
+
+    first = _status_dicts(sessions.values(), _SESSION_STATUS_KEYS, _session_status_values)
+    first[0]["consumedPower"] = -1.0
+    second = _status_dicts(sessions.values(), _SESSION_STATUS_KEYS, _session_status_values)
+
+    assert second[0] is not first[0]
+    assert second[0]["sessionId"] == "S1"
+    assert second[0]["consumedPower"] == pytest.approx(0.0)
+
+
+@pytest.mark.asyncio
+async def test_session_update_publishes_new_allocations(station_config, monkeypatch):
+    """Une mise à jour unitaire publie les limites réallouées par le load manager"""
+    mqtt = _RecordingMQTT()
+    service = SessionServiceMQTT(station_config, None, mqtt)
+    service.load_manager.handle_session_start("S1", "CP001", 1, 150)
+    service.load_manager.handle_session_start("S2", "CP001", 2, 150)
+    monkeypatch.setattr(session_service_mqtt, "_station_context", session_service_mqtt.StationContext(
+        station_config=station_config,
+        station_db_id=1,
+        load_manager=service.load_manager,
+        bess_controller=None,
+        mqtt=mqtt,
+        status_skeleton={}
+    ))
+
+    # S1 ne consomme que 40kW : S2 récupère la puissance libérée
+    await session_service_mqtt.handle_session_update_global(SessionUpdateMessage(
+        timestamp=datetime.utcnow(), charger_id="CP001", connector_id=1,
+        session_id="S1", consumed_power=40.0, vehicle_max_power=40.0,
+        energy_delivered=0.5
+    ))
+
+    allocations = {
+        a.sessionId: a.allocatedPower
+        for a in service.load_manager.get_current_allocations()
+    }
+    assert sorted(mqtt.limits) == [
+        ("CP001", 1, allocations["S1"]),
+        ("CP001", 2, allocations["S2"])
+    ]
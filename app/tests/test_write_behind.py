@@ -0,0 +1,55 @@
+import json
+from app.services.write_behind import EventWriter, PowerUpdateWriter
+
+
+def test_record_buffers_serialized_events():
+    """Les événements sont mis en tampon avec leurs données déjà en JSON"""
+    writer = EventWriter(buffer_size=10)
+    writer.record("session_start", "Session S1 started", {"session_id": "S1"})
+    writer.record("bess_idle", "BESS idle")
+
+    (ts, event_type, description, data), (_, _, _, no_data) = writer._buffer
+    assert event_type == "session_start"
+    assert description == "Session S1 started"
+    assert json.loads(data) == {"session_id": "S1"}
+    assert no_data is None
+
+
+def test_buffer_drops_oldest_events_when_full():
+    """Au-delà de la taille du tampon, les plus anciens événements sont abandonnés"""
+    writer = EventWriter(buffer_size=3)
+    for i in range(5):
+        writer.record("power_update", f"update {i}")
+
+    assert [e[2] for e in writer._buffer] == ["update 2", "update 3", "update 4"]
+
+
+def test_power_updates_keep_latest_value_per_session():
+    """Seule la dernière mise à jour d'une session est gardée, sans perdre énergie/SOC"""
+    writer = PowerUpdateWriter()
+    writer.record("S1", 50.0, 100.0, 150.0, total_energy=1.2, vehicle_soc=40.0)
+    writer.record("S1", 55.0, 100.0, 150.0)
+    writer.record("S2", 20.0, 80.0, 80.0)
+    writer.discard("S2")
+
+    batch = writer._drain()
+    assert batch == [{
+        "session_id": "S1",
+        "consumed_power": 55.0,
+        "allocated_power": 100.0,
+        "vehicle_max_power": 150.0,
+        "total_energy": 1.2,
+        "vehicle_soc": 40.0
+    }]
+    assert writer._drain() == []
+
+
+def test_full_batch_wakes_up_flush_task():
+    """Un lot complet réveille la tâche de vidage sans attendre l'intervalle"""
+    writer = EventWriter(flush_batch_size=3)
+    writer.record("power_update", "update 0")
+    writer.record("power_update", "update 1")
+    assert not writer._wakeup.is_set()
+
+    writer.record("power_update", "update 2")
+    assert writer._wakeup.is_set()
@@ -8,12 +8,15 @@ import json
 
 API_URL = "http://localhost:8000"
 
+# Session HTTP partagée : connexion keep-alive réutilisée entre les appels
+SESSION = requests.Session()
+
 print("Testing API endpoints...")
 
 # Test 1: Root
 print("\n1. Testing root endpoint...")
 try:
-    response = requests.get(f"{API_URL}/")
+    response = SESSION.get(f"{API_URL}/")
     print(f"   Status: {response.status_code}")
     if response.status_code == 200:
         print(f"   Response: {json.dumps(response.json(), indent=2)}")
@@ -23,7 +26,7 @@ except Exception as e:
 # Test 2: Health
 print("\n2. Testing health endpoint...")
 try:
-    response = requests.get(f"{API_URL}/health")
+    response = SESSION.get(f"{API_URL}/health")
     print(f"   Status: {response.status_code}")
     if response.status_code == 200:
         print(f"   Response: {json.dumps(response.json(), indent=2)}")
@@ -33,7 +36,7 @@ except Exception as e:
 # Test 3: Station Status
 print("\n3. Testing station status endpoint...")
 try:
-    response = requests.get(f"{API_URL}/station/status")
+    response = SESSION.get(f"{API_URL}/station/status")
     print(f"Status Code: {response.status_code}")
     print(f"Headers: {dict(response.headers)}")
     print(f"\nResponse Body:")
@@ -5,11 +5,15 @@ Démo réaliste du flow complet
 
 import subprocess
 import time
+import json
 import requests
 import sys
 
 API_URL = "http://localhost:8000"
 
+# Session HTTP partagée : connexion keep-alive réutilisée entre les appels
+SESSION = requests.Session()
+
 
 def start_charger(charger_id: str):
     """Démarrer un simulateur de chargeur"""
@@ -25,7 +29,7 @@ def start_charger(charger_id: str):
 
 def create_session(charger_id: str, connector_id: int, vehicle_max_power: float):
     """Créer une session via l'API"""
-    response = requests.post(
+    response = SESSION.post(
         f"{API_URL}/sessions/",
         json={
             "chargerId": charger_id,
@@ -44,18 +48,40 @@ def create_session(charger_id: str, connector_id: int, vehicle_max_power: float)
         return None
 
 
-def show_status():
+def show_status(data: dict):
     """Afficher le statut"""
-    response = requests.get(f"{API_URL}/station/status")
-    if response.status_code == 200:
-        data = response.json()
-        print(f"\n{'=' * 70}")
-        print(f"Active Sessions: {data['activeSessions']}")
-        print(f"Total Consumed: {data['totalConsumed']:.1f}kW")
-
-        for s in data.get('sessions', []):
-            print(
-                f"  {s['sessionId']}: {s['consumedPower']:.1f}kW / {s['totalEnergy']:.2f}kWh / SOC:{s['vehicleSoc']:.1f}%")
+    print(f"\n{'=' * 70}")
+    print(f"Active Sessions: {data['activeSessions']}")
+    print(f"Total Consumed: {data['totalConsumed']:.1f}kW")
+
+    for s in data.get('sessions', []):
+        print(
+            f"  {s['sessionId']}: {s['consumedPower']:.1f}kW / {s['totalEnergy']:.2f}kWh / SOC:{s['vehicleSoc']:.1f}%")
+
+
+def watch_status(duration: float, interval: float = 3.0):
+    """
+    Suivre le statut pendant `duration` secondes
+
+    Une seule requête : le serveur pousse le statut (Server-Sent Events)
+    toutes les `interval` secondes au lieu d'être interrogé en boucle.
+    """
+    deadline = time.monotonic() + duration
+    with SESSION.get(
+        f"{API_URL}/station/status/stream",
+        params={"interval": interval},
+        stream=True,
+        timeout=interval + 10
+    ) as response:
+        if response.status_code != 200:
+            print(f"✗ Error: {response.status_code}")
+            return
+
+        for line in response.iter_lines():
+            if line.startswith(b"data: "):
+                show_status(json.loads(line[6:]))
+            if time.monotonic() >= deadline:
+                break
 
 
 def main():
@@ -78,9 +104,7 @@ def main():
 
     # 3. Observer la charge (les chargeurs envoient des updates à l'API)
     print("\n3. Monitoring charging...")
-    for i in range(20):
-        show_status()
-        time.sleep(3)
+    watch_status(duration=60, interval=3)
 
     # 4. Nettoyer
     print("\n4. Cleaning up...")
@@ -10,6 +10,7 @@ import signal
 import sys
 import argparse
 import logging
+from pathlib import Path
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,6 +18,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+LOG_DIR = Path("logs")
+
 
 class ScenarioRunner:
     def __init__(self, station_id: str = "ELECTRA_PARIS_15",
@@ -26,38 +29,51 @@ class ScenarioRunner:
         self.mqtt_port = mqtt_port
         self.processes = []
 
+    def _spawn(self, name: str, script: str, args: list) -> subprocess.Popen:
+        """
+        Lancer un simulateur avec l'interpréteur courant
+
+        La sortie de chaque simulateur va dans logs/<name>.log plutôt que sur le
+        terminal partagé. close_fds=False et pas de start_new_session :
+        sinon CPython n'utilise pas posix_spawn. Les descripteurs
+        Python ne sont de toute façon pas hérités (PEP 446), et un Ctrl+C
+        atteint aussi les simulateurs, que stop_all() achève.
+        """
+        LOG_DIR.mkdir(exist_ok=True)
+        with open(LOG_DIR / f"{name}.log", "wb") as log_file:
+            process = subprocess.Popen(
+                [sys.executable, script, *args],
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                close_fds=False
+            )
+        self.processes.append(process)
+        return process
+
     def start_charger(self, charger_id: str, duration: int = 300):
         """Démarrer un simulateur de chargeur"""
-        cmd = [
-            "python", "simulators/charger_simulator.py",
+        process = self._spawn(charger_id, "simulators/charger_simulator.py", [
             "--station-id", self.station_id,
             "--charger-id", charger_id,
             "--broker", self.mqtt_broker,
             "--port", str(self.mqtt_port),
             "--mode", "auto",
             "--duration", str(duration)
-        ]
-
-        process = subprocess.Popen(cmd)
-        self.processes.append(process)
-        logger.info(f"Started charger simulator: {charger_id}")
+        ])
+        logger.info(f"Started charger simulator: {charger_id} (logs/{charger_id}.log)")
         return process
 
     def start_bess(self, duration: int = 300, initial_soc: float = 100.0):
         """Démarrer un simulateur BESS"""
-        cmd = [
-            "python", "simulators/bess_simulator.py",
+        process = self._spawn("bess", "simulators/bess_simulator.py", [
             "--station-id", self.station_id,
             "--broker", self.mqtt_broker,
             "--port", str(self.mqtt_port),
             "--mode", "auto",
             "--duration", str(duration),
             "--initial-soc", str(initial_soc)
-        ]
-
-        process = subprocess.Popen(cmd)
-        self.processes.append(process)
-        logger.info("Started BESS simulator")
+        ])
+        logger.info("Started BESS simulator (logs/bess.log)")
         return process
 
     def stop_all(self):
@@ -139,10 +155,17 @@ class ScenarioRunner:
         finally:
             self.stop_all()
 
+    # Numéro de scénario → méthode à exécuter (un scénario = une entrée)
+    SCENARIOS = {
+        1: run_scenario_1,
+        2: run_scenario_2,
+        3: run_scenario_3,
+    }
+
 
 def main():
     parser = argparse.ArgumentParser(description="Run MQTT test scenarios")
-    parser.add_argument("scenario", type=int, choices=[1, 2, 3],
+    parser.add_argument("scenario", type=int, choices=sorted(ScenarioRunner.SCENARIOS),
                         help="Scenario number to run")
     parser.add_argument("--station-id", default="ELECTRA_PARIS_15",
                         help="Station ID")
@@ -168,12 +191,7 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
 
     # Exécuter le scénario
-    if args.scenario == 1:
-        runner.run_scenario_1()
-    elif args.scenario == 2:
-        runner.run_scenario_2()
-    elif args.scenario == 3:
-        runner.run_scenario_3()
+    ScenarioRunner.SCENARIOS[args.scenario](runner)
 
 
 if __name__ == "__main__":
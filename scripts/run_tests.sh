@@ -14,22 +14,35 @@ NC='\033[0m' # No Color
 # Créer le dossier de résultats
 mkdir -p test_results
 
+# Les 3 scénarios sont indépendants : ils tournent en parallèle,
+# chacun avec sa sortie dans test_results/, affichée ensuite dans l'ordre
+python -m pytest app/tests/test_scenarios.py::test_scenario_1_static_load -v -s > test_results/scenario_1.log 2>&1 &
+PID1=$!
+python -m pytest app/tests/test_scenarios.py::test_scenario_2_dynamic_reallocation -v -s > test_results/scenario_2.log 2>&1 &
+PID2=$!
+python -m pytest app/tests/test_scenarios.py::test_scenario_3_bess_boost -v -s > test_results/scenario_3.log 2>&1 &
+PID3=$!
+
+wait $PID1
+SCENARIO1=$?
+wait $PID2
+SCENARIO2=$?
+wait $PID3
+SCENARIO3=$?
+
 echo -e "${BLUE}Running Scenario 1: Static Load Management${NC}"
 echo "----------------------------------------"
-python -m pytest app/tests/test_scenarios.py::test_scenario_1_static_load -v -s
-SCENARIO1=$?
+cat test_results/scenario_1.log
 
 echo ""
 echo -e "${BLUE}Running Scenario 2: Dynamic Power Re-allocation${NC}"
 echo "----------------------------------------"
-python -m pytest app/tests/test_scenarios.py::test_scenario_2_dynamic_reallocation -v -s
-SCENARIO2=$?
+cat test_results/scenario_2.log
 
 echo ""
 echo -e "${BLUE}Running Scenario 3: BESS Boost Integration${NC}"
 echo "----------------------------------------"
-python -m pytest app/tests/test_scenarios.py::test_scenario_3_bess_boost -v -s
-SCENARIO3=$?
+cat test_results/scenario_3.log
 
 echo ""
 echo "=========================================="
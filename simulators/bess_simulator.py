@@ -4,25 +4,50 @@ Simulateur de BESS (Battery Energy Storage System) qui communique via MQTT
 """
 
 import paho.mqtt.client as mqtt
-import json
 import time
+import threading
 import random
 import argparse
-from datetime import datetime
+import sys
+from datetime import datetime, timezone
+from typing import Optional
 import logging
 
+from sim_common import dumps, loads
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# Variations minimales déclenchant une publication de télémétrie
+SOC_PUBLISH_DELTA = 0.1  # %
+POWER_PUBLISH_DELTA = 0.5  # kW
+TEMPERATURE_PUBLISH_DELTA = 0.5  # °C
+# Publication forcée au-delà de ce délai sans changement (heartbeat)
+TELEMETRY_KEEPALIVE = 10.0  # secondes
+
+# Attente maximale de la connexion au broker
+CONNECT_TIMEOUT = 10.0  # secondes
+
 
 class BESSSimulator:
     """
     Simulateur de système de stockage par batterie
     """
 
+    # Menu du mode interactif
+    INTERACTIVE_MENU = (
+        "\nCommands:\n"
+        "  1. Set discharge power\n"
+        "  2. Set charge power\n"
+        "  3. Set idle\n"
+        "  4. Show status\n"
+        "  5. Exit\n"
+        "  ?. Show this menu"
+    )
+
     def __init__(self, station_id: str, capacity: float = 200.0,
                  max_power: float = 100.0, initial_soc: float = 100.0,
                  broker_host: str = "localhost", broker_port: int = 1883):
@@ -40,17 +65,45 @@ class BESSSimulator:
         self.temperature = 25.0  # °C
         self.status = "idle"  # idle, charging, discharging, faulted
 
+        # Facteurs de conversion constants (capacité et tension fixes)
+        self._kwh_per_soc = capacity / 100  # kWh pour 1% de SOC
+        self._soc_per_kw_second = 100 / (capacity * 3600)  # % de SOC pour 1 kW pendant 1 s
+        self._amps_per_kw = 1000 / self.voltage
+
+        # Dernier statut publié et dernière télémétrie publiée
+        # (soc, power, temperature, instant monotone)
+        self._last_published_status = None
+        self._last_telemetry = None
+
         # Commande reçue
         self.commanded_power = 0.0
         self.commanded_mode = "idle"
+        # Limite de SOC déjà signalée (une seule alerte tant qu'elle est atteinte)
+        self._soc_limit_logged = False
+        # Invites du mode interactif affichées seulement en terminal
+        self._interactive_tty = sys.stdin.isatty()
+
+        # Topics et champs constants des messages publiés à chaque tick
+        self._status_topic = f"electra/{station_id}/bess/status"
+        self._telemetry_topic = f"electra/{station_id}/bess/telemetry"
+        self._telemetry_const = {
+            "capacity": self.capacity,
+            "max_power": self.max_power,
+            "min_soc": self.min_soc,
+            "max_soc": self.max_soc
+        }
 
         # MQTT
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.client = mqtt.Client(client_id=f"bess_{station_id}")
+        # File paho non bornée (défaut) : le statut QoS 1 n'est publié qu'aux
+        # changements d'état, une borne ne ferait que perdre des transitions
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.connected = False
+        # Signalé par _on_connect : connect() attend la connexion effective
+        self._connected_event = threading.Event()
 
     def connect(self):
         """Connexion au broker MQTT"""
@@ -58,7 +111,8 @@ class BESSSimulator:
             self.client.connect(self.broker_host, self.broker_port, 60)
             self.client.loop_start()
             logger.info(f"BESS connecting to MQTT broker...")
-            time.sleep(2)
+            if not self._connected_event.wait(CONNECT_TIMEOUT):
+                raise RuntimeError(f"MQTT connect timeout after {CONNECT_TIMEOUT}s")
         except Exception as e:
             logger.error(f"Failed to connect: {e}")
             raise
@@ -67,7 +121,11 @@ class BESSSimulator:
         """Callback de connexion"""
         if rc == 0:
             self.connected = True
+            self._connected_event.set()
             logger.info(f"✓ BESS connected to MQTT broker")
+            # Republier statut et télémétrie après une (re)connexion
+            self._last_published_status = None
+            self._last_telemetry = None
 
             # S'abonner aux commandes
             command_topic = f"electra/{self.station_id}/bess/command"
@@ -79,7 +137,7 @@ class BESSSimulator:
     def _on_message(self, client, userdata, msg):
         """Callback pour les messages reçus"""
         try:
-            payload = json.loads(msg.payload.decode())
+            payload = loads(msg.payload)
             self._handle_command(payload)
         except Exception as e:
             logger.error(f"Error handling message: {e}")
@@ -101,98 +159,107 @@ class BESSSimulator:
         Args:
             dt: Intervalle de temps en secondes
         """
+        soc = self.soc
+        # Puissance qui ferait varier le SOC de 1% pendant dt (même facteur
+        # que la mise à jour du SOC ci-dessous)
+        kw_per_soc = 1 / (dt * self._soc_per_kw_second)
+
         # Déterminer la puissance réelle basée sur la commande
         if self.commanded_mode == "discharge":
             # Vérifier si on peut décharger
-            if self.soc > self.min_soc:
+            if soc > self.min_soc:
                 # Limiter par la puissance max et le SOC
-                available_energy = ((self.soc - self.min_soc) / 100) * self.capacity
-                max_discharge = min(self.max_power, available_energy * 3600 / dt)  # kW
+                max_discharge = min(self.max_power, (soc - self.min_soc) * kw_per_soc)  # kW
                 self.power = min(self.commanded_power, max_discharge)
                 self.status = "discharging"
             else:
                 self.power = 0.0
                 self.status = "idle"
-                logger.warning("Cannot discharge: SOC too low")
+                if not self._soc_limit_logged:
+                    logger.warning("Cannot discharge: SOC too low")
+                    self._soc_limit_logged = True
 
         elif self.commanded_mode == "charge":
             # Vérifier si on peut charger
-            if self.soc < self.max_soc:
+            if soc < self.max_soc:
                 # Limiter par la puissance max et le SOC
-                available_capacity = ((self.max_soc - self.soc) / 100) * self.capacity
-                max_charge = min(self.max_power, available_capacity * 3600 / dt)  # kW
+                max_charge = min(self.max_power, (self.max_soc - soc) * kw_per_soc)  # kW
                 self.power = -min(self.commanded_power, max_charge)  # Négatif pour charge
                 self.status = "charging"
             else:
                 self.power = 0.0
                 self.status = "idle"
-                logger.warning("Cannot charge: SOC full")
+                if not self._soc_limit_logged:
+                    logger.warning("Cannot charge: SOC full")
+                    self._soc_limit_logged = True
 
         else:  # idle
             self.power = 0.0
             self.status = "idle"
 
-        # Mettre à jour le SOC
         if self.power != 0:
-            # Énergie transférée en kWh
-            energy_kwh = (abs(self.power) * dt) / 3600
+            self._soc_limit_logged = False
 
-            # Changement de SOC
-            soc_change = (energy_kwh / self.capacity) * 100
+        # Mettre à jour le SOC et le courant (signe de la puissance conservé :
+        # courant négatif en charge)
+        power = self.power
+        if power != 0:
+            # Changement de SOC : énergie transférée rapportée à la capacité
+            soc_change = abs(power) * dt * self._soc_per_kw_second
 
-            if self.power > 0:  # Décharge
-                self.soc = max(self.min_soc, self.soc - soc_change)
+            if power > 0:  # Décharge
+                self.soc = max(self.min_soc, soc - soc_change)
             else:  # Charge
-                self.soc = min(self.max_soc, self.soc + soc_change)
+                self.soc = min(self.max_soc, soc + soc_change)
 
-        # Calculer le courant
-        if self.power != 0:
-            self.current = (abs(self.power) * 1000) / self.voltage
-            if self.power < 0:  # Charge
-                self.current = -self.current
+            self.current = power * self._amps_per_kw
         else:
             self.current = 0.0
 
         # Simuler la température (augmente avec la puissance)
-        target_temp = 25 + abs(self.power) * 0.2
+        target_temp = 25 + abs(power) * 0.2
         self.temperature += (target_temp - self.temperature) * 0.1
         self.temperature = min(60, max(20, self.temperature))
 
     def publish_status(self):
-        """Publier le statut de la batterie"""
-        available_capacity = ((self.soc - self.min_soc) / 100) * self.capacity
+        """
+        Publier l'état de la batterie
 
-        topic = f"electra/{self.station_id}/bess/status"
-        message = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+        La télémétrie (1 Hz, remplaçable) part en QoS 0, seulement si SOC,
+        puissance ou température ont bougé ou toutes les TELEMETRY_KEEPALIVE
+        secondes ; le statut n'est publié qu'à un changement d'état, en QoS 1.
+        """
+        now = time.monotonic()
+        status_changed = self.status != self._last_published_status
+        last = self._last_telemetry
+        if (not status_changed and last is not None
+                and abs(self.soc - last[0]) <= SOC_PUBLISH_DELTA
+                and abs(self.power - last[1]) <= POWER_PUBLISH_DELTA
+                and abs(self.temperature - last[2]) <= TEMPERATURE_PUBLISH_DELTA
+                and now - last[3] < TELEMETRY_KEEPALIVE):
+            return
+
+        # Télémétrie : état courant + constantes de la batterie. Le statut en
+        # est un sous-ensemble (l'EMS traite les deux topics avec le même
+        # modèle) : le même payload, sérialisé une fois, part sur les deux.
+        payload = dumps({
+            "timestamp": datetime.now(timezone.utc),
             "soc": self.soc,
             "voltage": self.voltage,
             "current": self.current,
             "power": self.power,
             "temperature": self.temperature,
             "status": self.status,
-            "available_capacity": available_capacity
-        }
+            "available_capacity": (self.soc - self.min_soc) * self._kwh_per_soc,
+            **self._telemetry_const
+        })
 
-        self.client.publish(topic, json.dumps(message), qos=1)
-
-        # Publier aussi la télémétrie détaillée
-        telemetry_topic = f"electra/{self.station_id}/bess/telemetry"
-        telemetry_message = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "soc": self.soc,
-            "voltage": self.voltage,
-            "current": self.current,
-            "power": self.power,
-            "temperature": self.temperature,
-            "status": self.status,
-            "capacity": self.capacity,
-            "max_power": self.max_power,
-            "min_soc": self.min_soc,
-            "max_soc": self.max_soc
-        }
+        if status_changed:
+            self.client.publish(self._status_topic, payload, qos=1)
+            self._last_published_status = self.status
 
-        self.client.publish(telemetry_topic, json.dumps(telemetry_message), qos=1)
+        self.client.publish(self._telemetry_topic, payload, qos=0)
+        self._last_telemetry = (self.soc, self.power, self.temperature, now)
 
     def _print_status(self):
         """Afficher le statut"""
@@ -221,23 +288,31 @@ class BESSSimulator:
         logger.info(f"Initial SOC: {self.soc:.1f}%")
         logger.info(f"{'=' * 60}\n")
 
-        start_time = time.time()
+        start_time = time.monotonic()
         last_print = start_time
+        last_tick = start_time - 1.0  # le premier tick couvre une seconde, comme avant
+        # Échéances fixes : le temps de calcul ne décale pas les ticks
+        next_tick = start_time + 1.0
 
         try:
-            while time.time() - start_time < duration:
-                # Mettre à jour l'état
-                self.update_state(dt=1.0)
+            while time.monotonic() - start_time < duration:
+                # Mettre à jour l'état avec le temps réellement écoulé
+                now = time.monotonic()
+                self.update_state(dt=now - last_tick)
+                last_tick = now
 
                 # Publier le statut
                 self.publish_status()
 
                 # Afficher périodiquement
-                if time.time() - last_print >= 10:
+                if now - last_print >= 10:
                     self._print_status()
-                    last_print = time.time()
+                    last_print = now
 
-                time.sleep(1)
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+                next_tick += 1.0
 
         except KeyboardInterrupt:
             logger.info("\nSimulation interrupted by user")
@@ -246,41 +321,70 @@ class BESSSimulator:
             self._print_status()
             logger.info("\nSimulation completed")
 
+    def _read_line(self, prompt: str) -> Optional[str]:
+        """Lire une ligne sur stdin (invite seulement en terminal), None en fin de flux"""
+        if self._interactive_tty:
+            print(prompt, end="", flush=True)
+        line = sys.stdin.readline()
+        return line.strip() if line else None
+
+    def _read_power(self, prompt: str) -> float:
+        """Lire une puissance (kW), EOFError en fin de flux"""
+        line = self._read_line(prompt)
+        if line is None:
+            raise EOFError
+        return float(line)
+
+    def _cmd_discharge(self):
+        power = self._read_power(f"Discharge power (0-{self.max_power}kW): ")
+        self.commanded_mode = "discharge"
+        self.commanded_power = min(power, self.max_power)
+
+    def _cmd_charge(self):
+        power = self._read_power(f"Charge power (0-{self.max_power}kW): ")
+        self.commanded_mode = "charge"
+        self.commanded_power = min(power, self.max_power)
+
+    def _cmd_idle(self):
+        self.commanded_mode = "idle"
+        self.commanded_power = 0
+
     def run_interactive(self):
-        """Mode interactif"""
+        """
+        Mode interactif
+
+        Les commandes sont lues ligne par ligne sur stdin : le menu n'est
+        affiché qu'une fois (puis sur « ? »), ce qui permet aussi de piloter
+        la batterie par un script (ex. printf '1\n50\n5\n' | ...).
+        """
         logger.info(f"\n{'=' * 60}")
         logger.info(f"BESS - Interactive Mode")
         logger.info(f"{'=' * 60}\n")
 
-        while True:
-            print("\nCommands:")
-            print("  1. Set discharge power")
-            print("  2. Set charge power")
-            print("  3. Set idle")
-            print("  4. Show status")
-            print("  5. Exit")
-
-            choice = input("\nChoice: ").strip()
-
-            if choice == "1":
-                power = float(input(f"Discharge power (0-{self.max_power}kW): "))
-                self.commanded_mode = "discharge"
-                self.commanded_power = min(power, self.max_power)
-
-            elif choice == "2":
-                power = float(input(f"Charge power (0-{self.max_power}kW): "))
-                self.commanded_mode = "charge"
-                self.commanded_power = min(power, self.max_power)
-
-            elif choice == "3":
-                self.commanded_mode = "idle"
-                self.commanded_power = 0
+        commands = {
+            "1": self._cmd_discharge,
+            "2": self._cmd_charge,
+            "3": self._cmd_idle,
+            "4": self._print_status,
+            "?": lambda: print(self.INTERACTIVE_MENU)
+        }
 
-            elif choice == "4":
-                self._print_status()
+        print(self.INTERACTIVE_MENU)
+        while True:
+            choice = self._read_line("\nChoice: ")
+            if choice is None or choice == "5":
+                break
 
-            elif choice == "5":
+            command = commands.get(choice)
+            if command is None:
+                continue
+            try:
+                command()
+            except EOFError:
                 break
+            except ValueError:
+                logger.error("Invalid power value")
+                continue
 
             # Mettre à jour et publier
             self.update_state()
@@ -288,8 +392,10 @@ class BESSSimulator:
 
     def disconnect(self):
         """Déconnexion"""
-        self.client.loop_stop()
+        # Déconnecter avant d'arrêter la boucle réseau : le paquet DISCONNECT
+        # est envoyé par la boucle encore active
         self.client.disconnect()
+        self.client.loop_stop()
         logger.info("BESS disconnected")
 
 
@@ -4,14 +4,20 @@ Simulateur de chargeur réaliste avec communication bidirectionnelle
 """
 
 import paho.mqtt.client as mqtt
-import json
 import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 import random
 import argparse
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from sim_common import dumps, loads, charge_power_factor
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,6 +25,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Attente maximale de la connexion au broker
+CONNECT_TIMEOUT = 10.0  # secondes
+
+# Débit maximal de requêtes vers l'API et attente en cas de HTTP 429
+API_RATE_LIMIT = 10.0  # requêtes par seconde
+API_MAX_BACKOFF = 30.0  # secondes
+
+
+class TokenBucket:
+    """Limiteur de débit : `rate` jetons par seconde, au plus `capacity` en réserve"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+
+    def acquire(self):
+        """Prendre un jeton, en attendant qu'il soit disponible"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens < 1:
+            time.sleep((1 - self._tokens) / self.rate)
+            self._tokens = 1
+            self._last = time.monotonic()
+        self._tokens -= 1
+
 
 class RealisticChargerSimulator:
     """
@@ -30,13 +64,28 @@ class RealisticChargerSimulator:
 
     def __init__(self, station_id: str, charger_id: str, num_connectors: int = 2,
                  mqtt_broker: str = "localhost", mqtt_port: int = 1883,
-                 api_url: str = "http://localhost:8000"):
+                 api_url: str = "http://localhost:8000", seed: Optional[int] = None,
+                 telemetry_transport: str = "http"):
         self.station_id = station_id
         self.charger_id = charger_id
         self.num_connectors = num_connectors
         self.mqtt_broker = mqtt_broker
         self.mqtt_port = mqtt_port
         self.api_url = api_url
+        self.tick_s = 2.0  # Période de la boucle de télémétrie (secondes)
+        # "http" : lot POSTé à l'API REST ; "mqtt" : lot publié sur le broker.
+        # Dans les deux cas, les limites arrivent par les topics power_limit.
+        if telemetry_transport not in ("http", "mqtt"):
+            raise ValueError(f"Unknown telemetry transport: {telemetry_transport}")
+        self.telemetry_transport = telemetry_transport
+        # Générateur propre au simulateur : une graine rend la simulation reproductible
+        self._rng = random.Random(seed)
+
+        # Topics du chargeur, construits une seule fois
+        self._topic_prefix = topic_prefix = f"electra/{station_id}/charger/{charger_id}"
+        self._start_command_topic = f"{topic_prefix}/session/start_command"
+        self._power_limit_topic = f"{topic_prefix}/connector/+/power_limit"
+        self._update_batch_topic = f"{topic_prefix}/session/update_batch"
 
         # État des connecteurs
         self.connectors = {}
@@ -54,12 +103,35 @@ class RealisticChargerSimulator:
                 "start_time": None
             }
 
+        # Session HTTP : connexions keep-alive réutilisées entre les envois,
+        # au lieu d'une nouvelle connexion par requête
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=num_connectors,
+            pool_maxsize=num_connectors * 2,
+            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._bucket = TokenBucket(rate=API_RATE_LIMIT, capacity=API_RATE_LIMIT)
+        self._backoff = 0.0  # Attente après le dernier HTTP 429 (doublée à chaque 429)
+        self._retry_at = 0.0  # Instant (monotonic) avant lequel ne rien envoyer
+
+        # Appels à l'API dans un thread dédié : une requête lente ne bloque
+        # pas les ticks. Un seul worker garde l'ordre des requêtes (mises à
+        # jour puis arrêt) et l'accès au limiteur de débit depuis un seul thread.
+        self._io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"api_{charger_id}")
+        self._pending_update: Optional[Future] = None
+        self._skipped_ticks = 0  # Ticks non envoyés d'affilée (API plus lente qu'un tick)
+
         # Client MQTT
         self.client = mqtt.Client(client_id=f"charger_{charger_id}")
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.client.on_subscribe = self._on_subscribe
         self.connected = False
+        # Signalé par _on_connect : connect() attend la connexion effective
+        self._connected_event = threading.Event()
         self.running = True
 
     def connect(self):
@@ -69,7 +141,8 @@ class RealisticChargerSimulator:
             self.client.connect(self.mqtt_broker, self.mqtt_port, 60)
             self.client.loop_start()
             logger.info("loop_start() called")
-            time.sleep(5)  # Augmenter à 5 secondes
+            if not self._connected_event.wait(CONNECT_TIMEOUT):
+                raise RuntimeError(f"MQTT connect timeout after {CONNECT_TIMEOUT}s")
             logger.info(f"Connection status: self.connected={self.connected}")
             logger.info(f"MQTT Broker: {self.mqtt_broker}:{self.mqtt_port}")
             logger.info(f"Station ID: {self.station_id}")
@@ -80,30 +153,31 @@ class RealisticChargerSimulator:
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.connected = True
+            self._connected_event.set()
             logger.info(f"✓ Charger {self.charger_id} connected to MQTT broker")
 
             # Topic d'abonnement
-            start_topic = f"electra/{self.station_id}/charger/{self.charger_id}/session/start_command"
-            self.client.subscribe(start_topic, qos=1)
-            logger.info(f"  Subscribed to: {start_topic}")
+            self.client.subscribe(self._start_command_topic, qos=1)
+            logger.info(f"  Subscribed to: {self._start_command_topic}")
+
+            # Limites de puissance poussées par l'EMS, seulement quand elles changent
+            self.client.subscribe(self._power_limit_topic, qos=1)
+            logger.info(f"  Subscribed to: {self._power_limit_topic}")
 
     def _on_subscribe(self, client, userdata, mid, granted_qos):
         logger.info(f"✓ Subscription confirmed! mid={mid}, qos={granted_qos}")
 
     def _on_message(self, client, userdata, msg):
         """Callback pour les messages reçus"""
-        logger.info(f"!!! _on_message CALLED !!! Topic: {msg.topic}")
-        logger.info(f"!!! MESSAGE RECEIVED !!! Topic: {msg.topic}, Payload: {msg.payload.decode()}")
-
         try:
-            payload = json.loads(msg.payload.decode())
+            payload = loads(msg.payload)
             topic = msg.topic
 
-            logger.info(f"Parsed payload: {payload}")
-            logger.info(f"Checking topic: {topic}")
+            # Message formaté seulement si le niveau DEBUG est actif
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Received on {topic}: {payload}")
 
             if "/session/start_command" in topic:
-                logger.info("Calling _handle_start_command")
                 self._handle_start_command(payload)
             elif "/power_limit" in topic:
                 parts = topic.split("/")
@@ -119,19 +193,15 @@ class RealisticChargerSimulator:
         """
         Gérer une commande de démarrage de session depuis l'EMS
         """
-        logger.info(f"_handle_start_command called with payload: {payload}")
-
         session_id = payload.get("session_id")
         connector_id = payload.get("connector_id")
         vehicle_max_power = payload.get("vehicle_max_power")
 
-        logger.info(f"Extracted: session={session_id}, connector={connector_id}, power={vehicle_max_power}")
-
         if connector_id not in self.connectors:
             logger.error(f"Invalid connector: {connector_id}")
             return
 
-        logger.info(f"Connector {connector_id} found, starting session...")
+        logger.debug(f"Connector {connector_id} found, starting session...")
 
         connector = self.connectors[connector_id]
 
@@ -139,15 +209,18 @@ class RealisticChargerSimulator:
             logger.error(f"Connector {connector_id} not available")
             return
 
-        # Démarrer la session
-        connector["status"] = "charging"
+        # Démarrer la session. Ce callback tourne dans le thread réseau paho,
+        # la boucle de télémétrie dans le thread principal : le statut est
+        # basculé en dernier pour qu'elle ne voie jamais une session à moitié
+        # initialisée.
         connector["session_id"] = session_id
         connector["vehicle_max_power"] = vehicle_max_power
         connector["power_limit"] = vehicle_max_power
         connector["current_power"] = 0.0
         connector["energy_delivered"] = 0.0
-        connector["vehicle_soc"] = random.uniform(10, 40)
+        connector["vehicle_soc"] = self._rng.uniform(10, 40)
         connector["start_time"] = time.time()
+        connector["status"] = "charging"
 
         logger.info(f"✓ Session {session_id} started on connector {connector_id}")
         logger.info(f"  Vehicle max: {vehicle_max_power}kW, Initial SOC: {connector['vehicle_soc']:.1f}%")
@@ -167,65 +240,143 @@ class RealisticChargerSimulator:
         """
         Mettre à jour l'état et envoyer la télémétrie à l'API
         """
-        logger.info(
-            f"update_and_send_telemetry called, connectors charging: {sum(1 for c in self.connectors.values() if c['status'] == 'charging')}")
-
-        for connector_id, connector in self.connectors.items():
-            if connector["status"] == "charging":
-                session_id = connector["session_id"]
-
-                # Calculer la puissance
-                power_limit = connector["power_limit"]
-                vehicle_max = connector["vehicle_max_power"]
-                soc = connector["vehicle_soc"]
-
-                # Courbe de charge réaliste
-                if soc < 20:
-                    power_factor = 0.95
-                elif soc < 80:
-                    power_factor = 1.0
-                else:
-                    power_factor = max(0.2, 1.0 - (soc - 80) / 20 * 0.8)
-
-                target_power = min(power_limit, vehicle_max) * power_factor
-                connector["current_power"] = target_power * random.uniform(0.95, 1.0)
-
-                # Calculer le courant
-                connector["current"] = (connector["current_power"] * 1000) / connector["voltage"]
-
-                # Mettre à jour l'énergie (1 seconde)
-                energy_increment = connector["current_power"] / 3600
-                connector["energy_delivered"] += energy_increment
-
-                # Mettre à jour le SOC (1kWh = 1.5% pour batterie 65kWh)
-                soc_increment = energy_increment * 1.5
-                connector["vehicle_soc"] = min(100, connector["vehicle_soc"] + soc_increment)
-
-                # Envoyer à l'API REST
-                try:
-                    response = requests.post(
-                        f"{self.api_url}/sessions/{session_id}/power-update",
-                        json={
-                            "consumedPower": connector["current_power"],
-                            "vehicleMaxPower": connector["vehicle_max_power"]
-                        },
-                        timeout=2
-                    )
-
-                    if response.status_code == 200:
-                        data = response.json()
-                        new_limit = data.get("newAllocatedPower")
-                        if new_limit and abs(connector["power_limit"] - new_limit) > 0.5:
-                            connector["power_limit"] = new_limit
-                            logger.debug(f"Power limit updated from API: {new_limit:.1f}kW")
-
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"API error: {e}")
-
-                # Arrêter si plein
-                if connector["vehicle_soc"] >= 99.5:
-                    logger.info(f"Vehicle on connector {connector_id} fully charged, stopping...")
-                    self._stop_session(connector_id)
+        charging = [(connector_id, connector) for connector_id, connector in self.connectors.items()
+                    if connector["status"] == "charging"]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Telemetry tick, connectors charging: {len(charging)}")
+        if not charging:
+            return
+
+        # Énergie (kWh) délivrée en un tick par kW de puissance
+        kwh_per_kw = self.tick_s / 3600
+        uniform = self._rng.uniform
+
+        for _, connector in charging:
+            # Calculer la puissance (courbe de charge réaliste)
+            soc = connector["vehicle_soc"]
+            target_power = min(connector["power_limit"], connector["vehicle_max_power"]) * charge_power_factor(soc)
+            current_power = target_power * uniform(0.95, 1.0)
+            connector["current_power"] = current_power
+
+            # Calculer le courant
+            connector["current"] = current_power * 1000 / connector["voltage"]
+
+            # Mettre à jour l'énergie (un tick)
+            energy_increment = current_power * kwh_per_kw
+            connector["energy_delivered"] += energy_increment
+
+            # Mettre à jour le SOC (1kWh = 1.5% pour batterie 65kWh)
+            connector["vehicle_soc"] = min(100, soc + energy_increment * 1.5)
+
+        if self.telemetry_transport == "mqtt":
+            # Un seul message pour tout le chargeur, sans aller-retour HTTP
+            self.client.publish(self._update_batch_topic, dumps({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "charger_id": self.charger_id,
+                "updates": [
+                    {
+                        "connector_id": connector_id,
+                        "session_id": connector["session_id"],
+                        "consumed_power": connector["current_power"],
+                        "vehicle_max_power": connector["vehicle_max_power"],
+                        "vehicle_soc": connector["vehicle_soc"],
+                        "energy_delivered": connector["energy_delivered"]
+                    }
+                    for connector_id, connector in charging
+                ]
+            }), qos=0)
+
+        # Envoyer toutes les mises à jour à l'API REST en une seule requête,
+        # sans attendre la réponse. Si la précédente est encore en cours, ce
+        # tick n'est pas envoyé : le suivant portera des valeurs plus récentes.
+        elif self._pending_update is not None and not self._pending_update.done():
+            self._skipped_ticks += 1
+            if self._skipped_ticks == 1:
+                logger.warning(f"API slower than the {self.tick_s}s tick, skipping power updates")
+        else:
+            if self._skipped_ticks:
+                logger.info(f"API caught up after {self._skipped_ticks} skipped tick(s)")
+                self._skipped_ticks = 0
+            # Horodatage de la mesure : l'API intègre l'énergie sur l'intervalle
+            # entre deux mises à jour, ticks sautés compris
+            timestamp = datetime.now(timezone.utc).isoformat()
+            self._pending_update = self._io_pool.submit(self._post, "/sessions/power-update-batch", {
+                "updates": [
+                    {
+                        "sessionId": connector["session_id"],
+                        "consumedPower": connector["current_power"],
+                        "vehicleMaxPower": connector["vehicle_max_power"],
+                        "timestamp": timestamp
+                    }
+                    for _, connector in charging
+                ]
+            })
+            self._pending_update.add_done_callback(self._log_update_result)
+
+        # Arrêter les véhicules pleins
+        for connector_id, connector in charging:
+            if connector["vehicle_soc"] >= 99.5:
+                logger.info(f"Vehicle on connector {connector_id} fully charged, stopping...")
+                self._stop_session(connector_id)
+
+    def _log_update_result(self, future: Future):
+        """
+        Journaliser l'échec d'un envoi de mises à jour (thread d'envoi)
+
+        Le corps de la réponse n'est pas lu : les nouvelles limites arrivent
+        par MQTT (_handle_power_limit).
+        """
+        try:
+            response = future.result()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API error: {e}")
+            return
+
+        if response.status_code != 200:
+            logger.error(f"Power update rejected: HTTP {response.status_code}")
+
+    def _log_stop_result(self, session_id: str, duration: int, total_energy: float,
+                         final_soc: float, future: Future):
+        """Journaliser le résultat d'un arrêt de session (thread d'envoi)"""
+        try:
+            response = future.result()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API error: {e}")
+            return
+
+        if response.status_code == 200:
+            logger.info(f"✓ Session {session_id} stopped")
+            logger.info(f"  Duration: {duration}s")
+            logger.info(f"  Energy: {total_energy:.2f}kWh")
+            logger.info(f"  Final SOC: {final_soc:.1f}%")
+        else:
+            logger.error(f"API error stopping session: {response.status_code}")
+
+    def _post(self, path: str, json: dict) -> requests.Response:
+        """
+        POST vers l'API, en respectant le débit maximal
+
+        Après un HTTP 429, l'envoi suivant attend Retry-After (ou un délai
+        doublé à chaque 429 consécutif, avec gigue) ; un succès le réinitialise.
+        """
+        wait = self._retry_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._bucket.acquire()
+
+        response = self.session.post(f"{self.api_url}{path}", json=json, timeout=2)
+
+        if response.status_code == 429:
+            self._backoff = min(API_MAX_BACKOFF, max(1.0, self._backoff * 2))
+            try:
+                delay = float(response.headers["Retry-After"])
+            except (KeyError, ValueError):
+                delay = self._backoff * self._rng.uniform(0.5, 1.0)
+            self._retry_at = time.monotonic() + delay
+            logger.warning(f"API rate limited (HTTP 429), next request in {delay:.1f}s")
+        else:
+            self._backoff = 0.0
+        return response
 
     def _stop_session(self, connector_id: int):
         """Arrêter une session"""
@@ -236,32 +387,22 @@ class RealisticChargerSimulator:
 
         session_id = connector["session_id"]
         total_energy = connector["energy_delivered"]
+        duration = int(time.time() - connector["start_time"])
 
-        # Appeler l'API REST pour arrêter
-        try:
-            response = requests.post(
-                f"{self.api_url}/sessions/{session_id}/stop",
-                json={"consumedEnergy": total_energy},
-                timeout=2
-            )
-
-            if response.status_code == 200:
-                logger.info(f"✓ Session {session_id} stopped")
-                logger.info(f"  Duration: {int(time.time() - connector['start_time'])}s")
-                logger.info(f"  Energy: {total_energy:.2f}kWh")
-                logger.info(f"  Final SOC: {connector['vehicle_soc']:.1f}%")
-            else:
-                logger.error(f"API error stopping session: {response.status_code}")
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"API error: {e}")
+        # Appeler l'API REST pour arrêter (après les mises à jour déjà envoyées)
+        self._io_pool.submit(
+            self._post, f"/sessions/{session_id}/stop", {"consumedEnergy": total_energy}
+        ).add_done_callback(partial(
+            self._log_stop_result, session_id, duration, total_energy, connector["vehicle_soc"]
+        ))
 
-        # Réinitialiser le connecteur
-        connector["status"] = "available"
+        # Réinitialiser le connecteur, puis le rendre disponible : une
+        # commande de démarrage reçue entre-temps ne peut pas être écrasée
         connector["session_id"] = None
         connector["current_power"] = 0.0
         connector["power_limit"] = 0.0
         connector["energy_delivered"] = 0.0
+        connector["status"] = "available"
 
     def run(self):
         """Boucle principale"""
@@ -270,10 +411,16 @@ class RealisticChargerSimulator:
         logger.info(f"Waiting for session start commands from EMS...")
         logger.info(f"{'=' * 60}\n")
 
+        # Échéances fixes : la durée des envois ne décale pas les ticks, et
+        # l'intégration de l'énergie sur tick_s reste juste
+        next_tick = time.monotonic() + self.tick_s
         try:
             while self.running:
                 self.update_and_send_telemetry()
-                time.sleep(2)
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+                next_tick += self.tick_s
         except KeyboardInterrupt:
             logger.info("\nStopping...")
         finally:
@@ -284,6 +431,9 @@ class RealisticChargerSimulator:
         self.running = False
         self.client.loop_stop()
         self.client.disconnect()
+        # Laisser partir les requêtes en attente (arrêts de session) avant de fermer
+        self._io_pool.shutdown(wait=True)
+        self.session.close()
         logger.info(f"Charger {self.charger_id} disconnected")
 
 
@@ -295,6 +445,9 @@ def main():
     parser.add_argument("--mqtt-broker", default="localhost", help="MQTT broker host")
     parser.add_argument("--mqtt-port", type=int, default=1883, help="MQTT broker port")
     parser.add_argument("--api-url", default="http://localhost:8000", help="API URL")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed, for reproducible simulations")
+    parser.add_argument("--transport", choices=["http", "mqtt"], default="http",
+                        help="Telemetry transport: REST batch or single MQTT message per tick")
 
     args = parser.parse_args()
 
@@ -304,7 +457,9 @@ def main():
         num_connectors=args.connectors,
         mqtt_broker=args.mqtt_broker,
         mqtt_port=args.mqtt_port,
-        api_url=args.api_url
+        api_url=args.api_url,
+        seed=args.seed,
+        telemetry_transport=args.transport
     )
 
     simulator.connect()
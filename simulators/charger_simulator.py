@@ -4,20 +4,39 @@ Simulateur de chargeur EV qui communique via MQTT
 """
 
 import paho.mqtt.client as mqtt
-import json
+import struct
 import time
+import threading
 import random
 import argparse
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 import logging
 
+from sim_common import dumps, loads, charge_power_factor
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# Attente maximale de la connexion au broker
+CONNECT_TIMEOUT = 10.0  # secondes
+
+# Télémétrie binaire (topic .../telemetry/bin), même format que
+# CHARGER_TELEMETRY_STRUCT dans app/mqtt/messages.py : connector_id,
+# voltage V, current A, power W, vehicle_soc %, timestamp (s epoch UTC)
+TELEMETRY_STRUCT = struct.Struct("<IffffI")
+
+# Variations minimales déclenchant une publication de télémétrie. La puissance
+# comparée est la consigne sans bruit (le bruit de mesure fait varier la
+# puissance mesurée de plusieurs kW à chaque tick)
+POWER_PUBLISH_DELTA = 0.1  # kW
+SOC_PUBLISH_DELTA = 0.1  # %
+# Publication forcée au-delà de ce délai sans changement (heartbeat)
+TELEMETRY_KEEPALIVE = 30.0  # secondes
+
 
 class ChargerSimulator:
     """
@@ -25,12 +44,20 @@ class ChargerSimulator:
     """
 
     def __init__(self, station_id: str, charger_id: str, num_connectors: int = 2,
-                 broker_host: str = "localhost", broker_port: int = 1883):
+                 broker_host: str = "localhost", broker_port: int = 1883,
+                 seed: Optional[int] = None, binary_telemetry: bool = False):
         self.station_id = station_id
         self.charger_id = charger_id
         self.num_connectors = num_connectors
         self.broker_host = broker_host
         self.broker_port = broker_port
+        self.tick_s = 1.0  # Période de publication de la télémétrie (secondes)
+        self._tick = 0  # Nombre d'appels à publish_telemetry
+        self._log_every = max(1, round(5.0 / self.tick_s))  # Log de debug toutes les 5 secondes
+        # Générateur propre au simulateur : une graine rend la simulation reproductible
+        self._rng = random.Random(seed)
+        # Télémétrie en binaire (24 octets) plutôt qu'en JSON
+        self.binary_telemetry = binary_telemetry
 
         # État des connecteurs
         self.connectors = {}
@@ -44,14 +71,26 @@ class ChargerSimulator:
                 "voltage": 400.0,  # V
                 "current": 0.0,  # A
                 "energy_delivered": 0.0,  # kWh
-                "vehicle_soc": 20.0  # %
+                "vehicle_soc": 20.0,  # %
+                "last_published": None  # (puissance cible, SOC, instant monotonic)
             }
 
+        # Topics du chargeur, construits une seule fois
+        self._topic_prefix = topic_prefix = f"electra/{station_id}/charger/{charger_id}"
+        self._command_topic = f"{topic_prefix}/command"
+        self._session_start_topic = f"{topic_prefix}/session/start"
+        self._session_stop_topic = f"{topic_prefix}/session/stop"
+        self._telemetry_topic = f"{topic_prefix}/telemetry"
+        self._telemetry_bin_topic = f"{topic_prefix}/telemetry/bin"
+        self._session_update_topic = f"{topic_prefix}/session/update"
+
         # Client MQTT
         self.client = mqtt.Client(client_id=f"charger_{charger_id}")
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.connected = False
+        # Signalé par _on_connect : connect() attend la connexion effective
+        self._connected_event = threading.Event()
 
     def connect(self):
         """Connexion au broker MQTT"""
@@ -59,7 +98,8 @@ class ChargerSimulator:
             self.client.connect(self.broker_host, self.broker_port, 60)
             self.client.loop_start()
             logger.info(f"Charger {self.charger_id} connecting to MQTT broker...")
-            time.sleep(2)  # Attendre la connexion
+            if not self._connected_event.wait(CONNECT_TIMEOUT):
+                raise RuntimeError(f"MQTT connect timeout after {CONNECT_TIMEOUT}s")
         except Exception as e:
             logger.error(f"Failed to connect: {e}")
             raise
@@ -68,16 +108,16 @@ class ChargerSimulator:
         """Callback de connexion"""
         if rc == 0:
             self.connected = True
+            self._connected_event.set()
             logger.info(f"✓ Charger {self.charger_id} connected to MQTT broker")
 
             # S'abonner aux commandes
-            command_topic = f"electra/{self.station_id}/charger/{self.charger_id}/command"
-            self.client.subscribe(command_topic, qos=1)
-            logger.info(f"  Subscribed to: {command_topic}")
+            self.client.subscribe(self._command_topic, qos=1)
+            logger.info(f"  Subscribed to: {self._command_topic}")
 
             # S'abonner aux limites de puissance pour chaque connecteur
             for connector_id in self.connectors.keys():
-                power_limit_topic = f"electra/{self.station_id}/charger/{self.charger_id}/connector/{connector_id}/power_limit"
+                power_limit_topic = f"{self._topic_prefix}/connector/{connector_id}/power_limit"
                 self.client.subscribe(power_limit_topic, qos=1)
                 logger.info(f"  Subscribed to: {power_limit_topic}")
         else:
@@ -86,7 +126,7 @@ class ChargerSimulator:
     def _on_message(self, client, userdata, msg):
         """Callback pour les messages reçus"""
         try:
-            payload = json.loads(msg.payload.decode())
+            payload = loads(msg.payload)
             topic = msg.topic
 
             if "/power_limit" in topic:
@@ -148,10 +188,25 @@ class ChargerSimulator:
         connector["power_limit"] = vehicle_max_power  # Initialement
         connector["current_power"] = 0.0
         connector["energy_delivered"] = 0.0
-        connector["vehicle_soc"] = random.uniform(10, 40)  # SOC initial aléatoire
+        connector["vehicle_soc"] = self._rng.uniform(10, 40)  # SOC initial aléatoire
+        connector["last_published"] = None  # Première télémétrie publiée d'office
+        # Champs constants pendant la session, repris dans chaque payload
+        connector["static_telemetry"] = {
+            "charger_id": self.charger_id,
+            "connector_id": connector_id,
+            "voltage": connector["voltage"],
+            "session_id": session_id,
+            "status": "charging"
+        }
+        connector["static_session_update"] = {
+            "charger_id": self.charger_id,
+            "connector_id": connector_id,
+            "session_id": session_id,
+            "vehicle_max_power": vehicle_max_power  # kW
+        }
 
         # Publier le message de démarrage de session
-        topic = f"electra/{self.station_id}/charger/{self.charger_id}/session/start"
+        topic = self._session_start_topic
         message = {
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "charger_id": self.charger_id,
@@ -161,7 +216,7 @@ class ChargerSimulator:
             "user_id": user_id
         }
 
-        self.client.publish(topic, json.dumps(message), qos=1)
+        self.client.publish(topic, dumps(message), qos=1)
         logger.info(f"✓ Session started on connector {connector_id}: {session_id}")
         logger.info(f"  Vehicle max power: {vehicle_max_power}kW")
         logger.info(f"  Initial SOC: {connector['vehicle_soc']:.1f}%")
@@ -185,7 +240,7 @@ class ChargerSimulator:
         total_energy = connector["energy_delivered"]
 
         # Publier le message d'arrêt
-        topic = f"electra/{self.station_id}/charger/{self.charger_id}/session/stop"
+        topic = self._session_stop_topic
         message = {
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "charger_id": self.charger_id,
@@ -195,7 +250,7 @@ class ChargerSimulator:
             "reason": "user_stop"
         }
 
-        self.client.publish(topic, json.dumps(message), qos=1)
+        self.client.publish(topic, dumps(message), qos=1)
         logger.info(f"✓ Session stopped on connector {connector_id}: {session_id}")
         logger.info(f"  Total energy delivered: {total_energy:.2f}kWh")
         logger.info(f"  Final SOC: {connector['vehicle_soc']:.1f}%")
@@ -209,69 +264,82 @@ class ChargerSimulator:
     def publish_telemetry(self):
         """
         Publier la télémétrie de tous les connecteurs
+
+        Télémétrie et mises à jour de session sont des instantanés remplacés à
+        chaque tick (énergie cumulée incluse) : QoS 0, une perte est rattrapée
+        au tick suivant. Le démarrage et l'arrêt de session restent en QoS 1.
+
+        Un connecteur ne publie que si sa puissance ou son SOC ont bougé, ou
+        toutes les TELEMETRY_KEEPALIVE secondes.
         """
+        # Un seul horodatage par tick, partagé par tous les messages
+        timestamp = datetime.now(timezone.utc)
+        now = time.monotonic()
+        # Énergie (kWh) délivrée en un tick par kW de puissance
+        kwh_per_kw = self.tick_s / 3600
+        uniform = self._rng.uniform
+        # Décidé une fois par tick, pas par connecteur
+        self._tick += 1
+        log_status = self._tick % self._log_every == 0 and logger.isEnabledFor(logging.DEBUG)
+
         for connector_id, connector in self.connectors.items():
             if connector["status"] == "charging":
-                power_limit = connector["power_limit"]
-                vehicle_max = connector["vehicle_max_power"]
                 soc = connector["vehicle_soc"]
-
-                if soc < 20:
-                    power_factor = 0.95
-                elif soc < 80:
-                    power_factor = 1.0
-                else:
-                    # Réduction de puissance au-dessus de 80%
-                    power_factor = max(0.2, 1.0 - (soc - 80) / 20 * 0.8)
-
-                target_power = min(power_limit, vehicle_max) * power_factor
-                connector["current_power"] = target_power * random.uniform(0.95, 1.0)
+                target_power = min(connector["power_limit"], connector["vehicle_max_power"]) * charge_power_factor(soc)
+                current_power = target_power * uniform(0.95, 1.0)
+                connector["current_power"] = current_power
 
                 # Calculer le courant
-                connector["current"] = (connector["current_power"] * 1000) / connector["voltage"]
+                connector["current"] = current_power * 1000 / connector["voltage"]
 
-                # Mettre à jour l'énergie délivrée (en supposant 1 seconde entre chaque publication)
-                energy_increment = connector["current_power"] / 3600  # kWh
+                # Mettre à jour l'énergie délivrée pendant un tick
+                energy_increment = current_power * kwh_per_kw  # kWh
                 connector["energy_delivered"] += energy_increment
 
                 # Mettre à jour le SOC (approximation: 1kWh = 1.5% pour une batterie de 65kWh)
-                soc_increment = energy_increment * 1.5
-                connector["vehicle_soc"] = min(100, connector["vehicle_soc"] + soc_increment)
-
-                # Publier la télémétrie
-                topic = f"electra/{self.station_id}/charger/{self.charger_id}/telemetry"
-                message = {
-                    "timestamp": datetime.utcnow().isoformat() + "Z",
-                    "charger_id": self.charger_id,
-                    "connector_id": connector_id,
-                    "voltage": connector["voltage"],
-                    "current": connector["current"],
-                    "power": connector["current_power"] * 1000,  # W
-                    "session_id": connector["session_id"],
-                    "vehicle_soc": connector["vehicle_soc"],
-                    "status": connector["status"],
-                    "temperature": random.uniform(25, 45)
-                }
-
-                self.client.publish(topic, json.dumps(message), qos=1)
-
-                # Publier la mise à jour de session avec TOUTES les données
-                session_topic = f"electra/{self.station_id}/charger/{self.charger_id}/session/update"
-                session_message = {
-                    "timestamp": datetime.utcnow().isoformat() + "Z",
-                    "charger_id": self.charger_id,
-                    "connector_id": connector_id,
-                    "session_id": connector["session_id"],
-                    "consumed_power": connector["current_power"],  # kW
-                    "vehicle_max_power": connector["vehicle_max_power"],  # kW
-                    "vehicle_soc": connector["vehicle_soc"],  # %
-                    "energy_delivered": connector["energy_delivered"]  # kWh - IMPORTANT!
-                }
-
-                self.client.publish(session_topic, json.dumps(session_message), qos=1)
+                connector["vehicle_soc"] = min(100, soc + energy_increment * 1.5)
+
+                # Publier la télémétrie, si elle a changé
+                last = connector["last_published"]
+                if (last is None
+                        or abs(target_power - last[0]) > POWER_PUBLISH_DELTA
+                        or abs(connector["vehicle_soc"] - last[1]) >= SOC_PUBLISH_DELTA
+                        or now - last[2] >= TELEMETRY_KEEPALIVE):
+                    if self.binary_telemetry:
+                        self.client.publish(self._telemetry_bin_topic, TELEMETRY_STRUCT.pack(
+                            connector_id,
+                            connector["voltage"],
+                            connector["current"],
+                            connector["current_power"] * 1000,  # W
+                            connector["vehicle_soc"],
+                            int(timestamp.timestamp())
+                        ), qos=0)
+                    else:
+                        message = {
+                            **connector["static_telemetry"],
+                            "timestamp": timestamp,
+                            "current": connector["current"],
+                            "power": connector["current_power"] * 1000,  # W
+                            "vehicle_soc": connector["vehicle_soc"],
+                            "temperature": uniform(25, 45)
+                        }
+
+                        self.client.publish(self._telemetry_topic, dumps(message), qos=0)
+
+                    # Publier la mise à jour de session avec TOUTES les données
+                    session_message = {
+                        **connector["static_session_update"],
+                        "timestamp": timestamp,
+                        "consumed_power": connector["current_power"],  # kW
+                        "vehicle_soc": connector["vehicle_soc"],  # %
+                        "energy_delivered": connector["energy_delivered"]  # kWh - IMPORTANT!
+                    }
+
+                    self.client.publish(self._session_update_topic, dumps(session_message), qos=0)
+                    connector["last_published"] = (target_power, connector["vehicle_soc"], now)
 
                 # Log pour debug
-                if int(time.time()) % 5 == 0:  # Log toutes les 5 secondes
+                if log_status:
                     logger.debug(
                         f"Connector {connector_id}: "
                         f"Power={connector['current_power']:.1f}kW, "
@@ -340,7 +408,7 @@ class ChargerSimulator:
         logger.info(f"Starting automatic simulation for {duration} seconds")
         logger.info(f"{'=' * 60}\n")
 
-        start_time = time.time()
+        start_time = time.monotonic()
 
         # Démarrer une session sur le premier connecteur
         self.start_session(1, vehicle_max_power=150.0)
@@ -350,16 +418,25 @@ class ChargerSimulator:
         if self.num_connectors > 1:
             self.start_session(2, vehicle_max_power=100.0)
 
+        last_print = time.monotonic()
+        # Échéances fixes : le temps de publication ne décale pas les ticks
+        next_tick = time.monotonic() + self.tick_s
+
         try:
-            while time.time() - start_time < duration:
+            while time.monotonic() - start_time < duration:
                 # Publier la télémétrie
                 self.publish_telemetry()
 
                 # Afficher le statut périodiquement
-                if int(time.time() - start_time) % 10 == 0:
+                now = time.monotonic()
+                if now - last_print >= 10:
                     self._print_status()
+                    last_print = now
 
-                time.sleep(1)  # Publier toutes les secondes
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+                next_tick += self.tick_s
 
         except KeyboardInterrupt:
             logger.info("\nSimulation interrupted by user")
@@ -390,6 +467,10 @@ def main():
                         help="Simulation mode")
     parser.add_argument("--duration", type=int, default=300,
                         help="Duration of auto simulation in seconds")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Random seed, for reproducible simulations")
+    parser.add_argument("--binary-telemetry", action="store_true",
+                        help="Publish telemetry as packed binary frames on .../telemetry/bin")
 
     args = parser.parse_args()
 
@@ -399,7 +480,9 @@ def main():
         charger_id=args.charger_id,
         num_connectors=args.connectors,
         broker_host=args.broker,
-        broker_port=args.port
+        broker_port=args.port,
+        seed=args.seed,
+        binary_telemetry=args.binary_telemetry
     )
 
     # Connexion
@@ -0,0 +1,40 @@
+"""
+Éléments communs aux simulateurs : sérialisation des messages et courbe
+de charge des véhicules
+
+Les simulateurs sont lancés comme scripts (python simulators/xxx.py) : ce
+module est importé depuis leur répertoire, sans dépendre du package app.
+"""
+try:
+    import orjson
+
+    loads = orjson.loads
+
+    def dumps(data: dict) -> bytes:
+        """Sérialiser un message (datetime UTC formaté en C, suffixe Z)"""
+        return orjson.dumps(data, option=orjson.OPT_UTC_Z)
+except ImportError:  # orjson non installé : json de la stdlib
+    import json
+
+    loads = json.loads  # accepte aussi les bytes
+
+    def dumps(data: dict) -> str:
+        """Sérialiser un message (datetime UTC, suffixe Z)"""
+        return json.dumps(data, default=lambda o: o.isoformat().replace("+00:00", "Z"))
+
+
+# Courbe de charge du véhicule : facteur appliqué à la puissance disponible
+CURVE_LOW_SOC = 20.0  # % : en dessous, facteur CURVE_LOW_FACTOR
+CURVE_LOW_FACTOR = 0.95
+CURVE_TAPER_SOC = 80.0  # % : au-dessus, décroissance linéaire jusqu'à 100%
+CURVE_MIN_FACTOR = 0.2
+
+
+def charge_power_factor(soc: float) -> float:
+    """Facteur de puissance de la courbe de charge pour un SOC donné (%)"""
+    if soc < CURVE_LOW_SOC:
+        return CURVE_LOW_FACTOR
+    if soc < CURVE_TAPER_SOC:
+        return 1.0
+    # Réduction de puissance au-dessus de 80%
+    return max(CURVE_MIN_FACTOR, 1.0 - (soc - CURVE_TAPER_SOC) / (100 - CURVE_TAPER_SOC) * (1 - CURVE_MIN_FACTOR))
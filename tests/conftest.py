@@ -0,0 +1,4 @@
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "broker: test qui passe par le broker MQTT (EMS lancé à part)"
+    )
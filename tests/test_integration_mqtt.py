@@ -1,28 +1,102 @@
+import logging
+import os
+import sys
+import time
 import pytest
 import asyncio
-import json
-from datetime import datetime
+import orjson
+import pytest_asyncio
+from itertools import accumulate
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database.connection import AsyncSessionLocal
+from app.database.connection import AsyncSessionLocal, engine, init_db
+from app.database.models import ChargingSession
 from app.database.repositories import SessionRepository, PowerMetricRepository
+from app.mqtt.fake_transport import FakeMqttTransport
 from app.services.mqtt_service import initialize_mqtt_service, get_mqtt_service
 from app.services.session_service_mqtt import SessionServiceMQTT
+from app.services.station_init_service import StationInitService
+from app.services.write_behind import event_writer, power_update_writer
 from app.models.station import StationConfig
 import paho.mqtt.client as mqtt
+import paho.mqtt.publish as publish
+
+logger = logging.getLogger(__name__)
 
 STATION_ID = "ELECTRA_PARIS_15"
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
+PUBLISH_TIMEOUT = 5.0  # secondes
+# Durée de la charge simulée (1 échantillon par seconde) ; EMS_TEST_SAMPLES=3
+# pour un passage rapide, 30 par défaut
+TEST_SAMPLES = int(os.environ.get("EMS_TEST_SAMPLES", "30"))
+# USE_FAKE_MQTT=1 : l'EMS tourne dans le processus de test et les messages
+# passent par un transport en mémoire (la DB reste nécessaire, pas le broker)
+USE_FAKE_MQTT = os.environ.get("USE_FAKE_MQTT") == "1"
+
+# Sans transport en mémoire, les tests passent par le broker : -m "not broker"
+# les exclut quand il n'est pas disponible
+pytestmark = [] if USE_FAKE_MQTT else [pytest.mark.broker]
+
+
+async def wait_until(fetch, until=bool, timeout: float = 5.0, interval: float = 0.05):
+    """
+    Attendre qu'une lecture async satisfasse une condition
+
+    fetch est réévalué toutes les interval secondes jusqu'à until(résultat) ;
+    le dernier résultat est retourné, même après timeout, pour que les
+    assertions du test signalent l'échec.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        result = await fetch()
+        if until(result) or loop.time() >= deadline:
+            return result
+        await asyncio.sleep(interval)
+
+
+async def fetch_session_fields(db: AsyncSession, session_id: str, *columns):
+    """Lire quelques colonnes d'une session, sans recharger toute l'entité"""
+    result = await db.execute(select(*columns).where(ChargingSession.session_id == session_id))
+    return result.one()
+
+
+async def fetch_sessions_fields(db: AsyncSession, session_ids: List[str], *columns) -> list:
+    """Lire quelques colonnes de plusieurs sessions en une requête, dans l'ordre de session_ids"""
+    result = await db.execute(
+        select(ChargingSession.session_id, *columns)
+        .where(ChargingSession.session_id.in_(session_ids))
+    )
+    rows = {row.session_id: row for row in result}
+    return [rows[session_id] for session_id in session_ids]
 
 
-@pytest.fixture
-async def db_session():
+def dumps(message: dict) -> bytes:
+    """Sérialiser un message (datetime UTC formaté en C, suffixe Z)"""
+    return orjson.dumps(message, option=orjson.OPT_UTC_Z)
+
+
+# Les connexions asyncpg du pool sont liées à la boucle qui les a ouvertes :
+# fixtures async et tests tournent tous dans la boucle de la session de tests
+# (loop_scope="session"), sinon le pool ne pourrait pas être réutilisé.
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def db_engine():
+    """Pool de connexions partagé par tous les tests, fermé en fin de session"""
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def db_session(db_engine):
     """Fixture pour la session DB"""
     async with AsyncSessionLocal() as session:
         yield session
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def station_config():
     """Configuration de test"""
     return StationConfig(
@@ -37,6 +111,15 @@ def station_config():
                     {"connector_id": 1, "connector_type": "CCS2", "max_power": 150.0},
                     {"connector_id": 2, "connector_type": "CCS2", "max_power": 150.0}
                 ]
+            },
+            {
+                # Chargeur du test de cycle de vie (CP001 : test d'allocation)
+                "id": "CP002",
+                "maxPower": 200.0,
+                "connectors": [
+                    {"connector_id": 1, "connector_type": "CCS2", "max_power": 150.0},
+                    {"connector_id": 2, "connector_type": "CCS2", "max_power": 150.0}
+                ]
             }
         ],
         battery={"initialCapacity": 200.0, "power": 100.0}
@@ -46,138 +129,314 @@ def station_config():
 class MQTTTestClient:
     """Client MQTT de test"""
 
-    def __init__(self, station_id: str):
+    def __init__(self, station_id: str, transport: Optional[FakeMqttTransport] = None):
         self.station_id = station_id
-        self.client = mqtt.Client(client_id=f"test_{int(datetime.now().timestamp())}")
-        self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        self.client.loop_start()
+        # Transport en mémoire partagé avec l'EMS, sinon connexion au broker
+        self._broker = transport is None
+        if self._broker:
+            # Un client_id par processus : deux clients de même id se déconnectent
+            # mutuellement sur le broker (tests lancés en parallèle avec -n)
+            self.client = mqtt.Client(client_id=f"test_{os.getpid()}_{time.time_ns()}")
+            self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
+            self.client.loop_start()
+        else:
+            self.client = transport
+        # Publications pas encore acquittées par le broker
+        self._in_flight: list[mqtt.MQTTMessageInfo] = []
+        # Topics de chaque chargeur, construits au premier message
+        self._topics: Dict[str, Dict[str, str]] = {}
+        # Champs constants d'une session, construits au premier message
+        self._session_fields: Dict[Tuple[str, int, str], dict] = {}
+        self._telemetry_fields: Dict[Tuple[str, int, str], dict] = {}
+
+    def _charger_topics(self, charger_id: str) -> Dict[str, str]:
+        """Topics d'un chargeur, par type de message"""
+        topics = self._topics.get(charger_id)
+        if topics is None:
+            prefix = f"electra/{self.station_id}/charger/{charger_id}"
+            topics = self._topics[charger_id] = {
+                "start": f"{prefix}/session/start",
+                "update": f"{prefix}/session/update",
+                "update_batch": f"{prefix}/session/update_batch",
+                "stop": f"{prefix}/session/stop",
+                "telemetry": f"{prefix}/telemetry"
+            }
+        return topics
+
+    def _publish(self, topic: str, message: dict, qos: int = 1):
+        """Publier un message, son envoi est attendu par flush()"""
+        self._in_flight.append(self.client.publish(topic, dumps(message), qos=qos))
+
+    def publish_batch(self, messages: List[Tuple[str, dict, int]]):
+        """
+        Publier plusieurs messages (topic, message, qos) d'un coup
+
+        Tout est sérialisé avant la première publication : les paquets
+        partent à la suite sur la connexion.
+        """
+        payloads = [(topic, dumps(message), qos) for topic, message, qos in messages]
+        for topic, payload, qos in payloads:
+            self._in_flight.append(self.client.publish(topic, payload, qos=qos))
+
+    async def flush(self, timeout: float = PUBLISH_TIMEOUT):
+        """
+        Attendre que toutes les publications soient parties (et acquittées
+        par le broker pour celles en QoS 1)
+
+        Le thread réseau de paho envoie les messages en arrière-plan : on
+        sonde leur état sans bloquer la boucle asyncio.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._in_flight:
+            self._in_flight = [info for info in self._in_flight if not info.is_published()]
+            if not self._in_flight:
+                break
+            if loop.time() > deadline:
+                raise TimeoutError(f"{len(self._in_flight)} MQTT publish(es) not acknowledged")
+            await asyncio.sleep(0.01)
 
     def publish_session_start(self, charger_id: str, connector_id: int,
                               session_id: str, vehicle_max_power: float):
         """Publier un démarrage de session"""
-        topic = f"electra/{self.station_id}/charger/{charger_id}/session/start"
+        topic = self._charger_topics(charger_id)["start"]
         message = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": datetime.now(timezone.utc),
             "charger_id": charger_id,
             "connector_id": connector_id,
             "session_id": session_id,
             "vehicle_max_power": vehicle_max_power,
             "user_id": "test_user"
         }
-        self.client.publish(topic, json.dumps(message), qos=1)
+        self._publish(topic, message)
 
-    def publish_session_update(self, charger_id: str, connector_id: int,
+    def session_update_message(self, charger_id: str, connector_id: int,
                                session_id: str, consumed_power: float,
                                vehicle_max_power: float, energy_delivered: float,
-                               vehicle_soc: float):
-        """Publier une mise à jour de session"""
-        topic = f"electra/{self.station_id}/charger/{charger_id}/session/update"
+                               vehicle_soc: float) -> Tuple[str, dict, int]:
+        """
+        Construire une mise à jour de session (topic, message, qos)
+
+        QoS 1 : l'énergie cumulée qu'elle porte est persistée par l'EMS.
+        """
+        topic = self._charger_topics(charger_id)["update"]
+        key = (charger_id, connector_id, session_id)
+        fields = self._session_fields.get(key)
+        if fields is None:
+            fields = self._session_fields[key] = {
+                "charger_id": charger_id,
+                "connector_id": connector_id,
+                "session_id": session_id
+            }
         message = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "charger_id": charger_id,
-            "connector_id": connector_id,
-            "session_id": session_id,
+            **fields,
+            "timestamp": datetime.now(timezone.utc),
             "consumed_power": consumed_power,
             "vehicle_max_power": vehicle_max_power,
             "vehicle_soc": vehicle_soc,
             "energy_delivered": energy_delivered
         }
-        self.client.publish(topic, json.dumps(message), qos=1)
+        return topic, message, 1
 
-    def publish_telemetry(self, charger_id: str, connector_id: int,
-                          session_id: str, power: float, vehicle_soc: float):
-        """Publier la télémétrie"""
-        topic = f"electra/{self.station_id}/charger/{charger_id}/telemetry"
+    def publish_session_update(self, *args, **kwargs):
+        """Publier une mise à jour de session"""
+        self._publish(*self.session_update_message(*args, **kwargs))
+
+    def publish_session_update_batch(self, charger_id: str, updates: List[dict]):
+        """
+        Publier les mises à jour de toutes les sessions d'un chargeur en un
+        seul message (SessionUpdateBatchMessage) : une seule réallocation côté EMS
+
+        updates: dicts connector_id, session_id, consumed_power,
+        vehicle_max_power, energy_delivered, vehicle_soc
+        """
+        topic = self._charger_topics(charger_id)["update_batch"]
         message = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": datetime.now(timezone.utc),
             "charger_id": charger_id,
-            "connector_id": connector_id,
-            "voltage": 400.0,
+            "updates": updates
+        }
+        self._publish(topic, message)
+
+    def telemetry_message(self, charger_id: str, connector_id: int,
+                          session_id: str, power: float, vehicle_soc: float,
+                          qos: int = 0) -> Tuple[str, dict, int]:
+        """
+        Construire une télémétrie (topic, message, qos)
+
+        QoS 0 par défaut : un échantillon perdu est remplacé par le suivant,
+        sans attendre d'acquittement du broker.
+        """
+        topic = self._charger_topics(charger_id)["telemetry"]
+        key = (charger_id, connector_id, session_id)
+        fields = self._telemetry_fields.get(key)
+        if fields is None:
+            fields = self._telemetry_fields[key] = {
+                "charger_id": charger_id,
+                "connector_id": connector_id,
+                "voltage": 400.0,
+                "session_id": session_id,
+                "status": "charging",
+                "temperature": 30.0
+            }
+        message = {
+            **fields,
+            "timestamp": datetime.now(timezone.utc),
             "current": power * 1000 / 400,
             "power": power * 1000,  # Watts
-            "session_id": session_id,
-            "vehicle_soc": vehicle_soc,
-            "status": "charging",
-            "temperature": 30.0
+            "vehicle_soc": vehicle_soc
         }
-        self.client.publish(topic, json.dumps(message), qos=1)
+        return topic, message, qos
+
+    def publish_telemetry(self, *args, **kwargs):
+        """Publier la télémétrie"""
+        self._publish(*self.telemetry_message(*args, **kwargs))
 
-    def publish_session_stop(self, charger_id: str, connector_id: int,
-                             session_id: str, total_energy: float):
-        """Publier un arrêt de session"""
-        topic = f"electra/{self.station_id}/charger/{charger_id}/session/stop"
+    def session_stop_message(self, charger_id: str, connector_id: int,
+                             session_id: str, total_energy: float) -> Tuple[str, dict, int]:
+        """Construire un arrêt de session (topic, message, qos)"""
         message = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": datetime.now(timezone.utc),
             "charger_id": charger_id,
             "connector_id": connector_id,
             "session_id": session_id,
             "total_energy": total_energy,
             "reason": "user_stop"
         }
-        self.client.publish(topic, json.dumps(message), qos=1)
+        return self._charger_topics(charger_id)["stop"], message, 1
+
+    async def publish_session_stops(self, *stops: Tuple[str, int, str, float]):
+        """
+        Publier les arrêts de fin de test en une seule connexion
+
+        paho.mqtt.publish.multiple() envoie tous les messages sur une même
+        connexion TCP puis se déconnecte ; le client persistant reste réservé
+        à la boucle de télémétrie. Les publications en cours sont acquittées
+        d'abord pour que les arrêts arrivent après les dernières mises à jour.
+        """
+        await self.flush()
+        if not self._broker:
+            self.publish_batch([self.session_stop_message(*stop) for stop in stops])
+            return
+        msgs = [
+            {"topic": topic, "payload": dumps(message), "qos": qos}
+            for topic, message, qos in (self.session_stop_message(*stop) for stop in stops)
+        ]
+        # Appel bloquant (CONNECT/CONNACK + PUBACK) : hors de la boucle asyncio
+        await asyncio.to_thread(publish.multiple, msgs, hostname=MQTT_BROKER, port=MQTT_PORT)
 
     def disconnect(self):
-        """Déconnexion"""
-        self.client.loop_stop()
-        self.client.disconnect()
+        """Déconnexion (le transport en mémoire appartient à la fixture)"""
+        if self._broker:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+
+@pytest.fixture
+def n_samples() -> int:
+    """Nombre d'échantillons de télémétrie du test de cycle de vie"""
+    return TEST_SAMPLES
 
 
-@pytest.mark.asyncio
-async def test_complete_session_lifecycle(db_session: AsyncSession, station_config):
+@pytest.fixture(scope="session")
+def mqtt_transport() -> Optional[FakeMqttTransport]:
+    """Transport en mémoire partagé par l'EMS et le client (USE_FAKE_MQTT=1)"""
+    return FakeMqttTransport() if USE_FAKE_MQTT else None
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="session", autouse=True)
+async def in_process_ems(db_engine, station_config, mqtt_transport):
+    """
+    EMS démarré dans le processus de test, relié au transport en mémoire
+
+    Avec le broker, l'EMS tourne à part (make docker-up) : rien à démarrer.
+    """
+    if mqtt_transport is None:
+        yield None
+        return
+
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        await StationInitService.initialize_station(db, station_config)
+    service = initialize_mqtt_service(station_config.stationId, client=mqtt_transport)
+    service.set_event_loop(asyncio.get_running_loop())
+    service.start_workers()
+    async with AsyncSessionLocal() as db:
+        await SessionServiceMQTT(station_config, db, service).initialize()
+    event_writer.start()
+    power_update_writer.start()
+
+    yield service
+
+    await service.stop_workers()
+    await power_update_writer.stop()
+    await event_writer.stop()
+
+
+@pytest.fixture(scope="session")
+def mqtt_client(mqtt_transport):
+    """Client MQTT connecté une seule fois pour tous les tests"""
+    client = MQTTTestClient(STATION_ID, mqtt_transport)
+    yield client
+    client.disconnect()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_complete_session_lifecycle(db_session: AsyncSession, station_config,
+                                          mqtt_client: MQTTTestClient, n_samples: int):
     """Test du cycle complet d'une session avec MQTT"""
 
     # Setup
-    mqtt_client = MQTTTestClient(STATION_ID)
     session_repo = SessionRepository(db_session)
 
-    session_id = f"test_session_{int(datetime.now().timestamp())}"
-    charger_id = "CP001"
+    # Identifiant interné : le même objet sert de clé à chaque publication
+    session_id = sys.intern(f"test_session_{time.time_ns()}")
+    # CP001 est utilisé par test_multiple_sessions_power_allocation :
+    # les deux tests peuvent tourner en parallèle
+    charger_id = "CP002"
     connector_id = 1
     vehicle_max_power = 150.0
 
-    try:
-        # 1. Publier le démarrage de session
-        print(f"\n1. Publishing session start: {session_id}")
-        mqtt_client.publish_session_start(
-            charger_id=charger_id,
-            connector_id=connector_id,
-            session_id=session_id,
-            vehicle_max_power=vehicle_max_power
-        )
-
-        # Attendre que le message soit traité
-        await asyncio.sleep(3)
-
-        # Vérifier en DB
-        db_session_obj = await session_repo.get_by_session_id(session_id)
-        assert db_session_obj is not None, "Session not created in DB"
-        assert db_session_obj.status.value == "active"
-        print(f"   ✓ Session created in DB: {db_session_obj.session_id}")
-
-        # 2. Simuler la charge avec télémétrie
-        print(f"\n2. Simulating charging (30 seconds)")
-
-        consumed_power = 0.0
-        energy_delivered = 0.0
-        vehicle_soc = 20.0
-
-        for i in range(30):
-            # Augmenter progressivement
-            consumed_power = min(140.0, consumed_power + 5.0)
-            energy_delivered += consumed_power / 3600  # kWh
-            vehicle_soc += 0.5  # +0.5% par seconde
-
-            # Publier télémétrie
-            mqtt_client.publish_telemetry(
+    # 1. Publier le démarrage de session
+    logger.info(f"1. Publishing session start: {session_id}")
+    mqtt_client.publish_session_start(
+        charger_id=charger_id,
+        connector_id=connector_id,
+        session_id=session_id,
+        vehicle_max_power=vehicle_max_power
+    )
+
+    # Attendre que le message soit traité
+    await mqtt_client.flush()
+
+    # Vérifier en DB
+    db_session_obj = await wait_until(lambda: session_repo.get_by_session_id(session_id))
+    assert db_session_obj is not None, "Session not created in DB"
+    assert db_session_obj.status.value == "active"
+    logger.info(f"✓ Session created in DB: {db_session_obj.session_id}")
+
+    # 2. Simuler la charge avec télémétrie
+    logger.info(f"2. Simulating charging ({n_samples} seconds)")
+
+    # Profil de charge calculé d'avance : la boucle ne fait que publier
+    powers = [min(140.0, 5.0 * (i + 1)) for i in range(n_samples)]  # +5kW par seconde
+    energies = list(accumulate(power / 3600 for power in powers))  # kWh
+    socs = [20.0 + 0.5 * (i + 1) for i in range(n_samples)]  # +0.5% par seconde
+
+    # Échéances fixes : le temps de publication ne décale pas les ticks
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for i, (consumed_power, energy_delivered, vehicle_soc) in enumerate(zip(powers, energies, socs)):
+        # Publier télémétrie et session update ensemble
+        mqtt_client.publish_batch([
+            mqtt_client.telemetry_message(
                 charger_id=charger_id,
                 connector_id=connector_id,
                 session_id=session_id,
                 power=consumed_power,
                 vehicle_soc=vehicle_soc
-            )
-
-            # Publier session update
-            mqtt_client.publish_session_update(
+            ),
+            mqtt_client.session_update_message(
                 charger_id=charger_id,
                 connector_id=connector_id,
                 session_id=session_id,
@@ -186,127 +445,141 @@ async def test_complete_session_lifecycle(db_session: AsyncSession, station_conf
                 energy_delivered=energy_delivered,
                 vehicle_soc=vehicle_soc
             )
+        ])
 
-            if i % 10 == 0:
-                print(f"   t={i}s: {consumed_power:.1f}kW, {energy_delivered:.3f}kWh, SOC={vehicle_soc:.1f}%")
+        if i % 10 == 0:
+            logger.info(f"t={i}s: {consumed_power:.1f}kW, {energy_delivered:.3f}kWh, SOC={vehicle_soc:.1f}%")
 
-            await asyncio.sleep(1)
+        await mqtt_client.flush()
+        await asyncio.sleep(max(0.0, start + i + 1 - loop.time()))
 
-        # Attendre traitement
-        await asyncio.sleep(2)
+    # 3. Vérifier les mises à jour en DB (écrites par lots par l'EMS)
+    logger.info("3. Verifying DB updates")
 
-        # 3. Vérifier les mises à jour en DB
-        print(f"\n3. Verifying DB updates")
-        await db_session.refresh(db_session_obj)
-
-        assert db_session_obj.consumed_power > 0, "Consumed power not updated"
-        assert db_session_obj.total_energy > 0, "Total energy not updated"
-        assert db_session_obj.vehicle_soc > 20, "Vehicle SOC not updated"
-
-        print(f"   ✓ Consumed Power: {db_session_obj.consumed_power:.1f}kW")
-        print(f"   ✓ Total Energy: {db_session_obj.total_energy:.3f}kWh")
-        print(f"   ✓ Vehicle SOC: {db_session_obj.vehicle_soc:.1f}%")
+    row = await wait_until(
+        lambda: fetch_session_fields(
+            db_session, session_id,
+            ChargingSession.consumed_power, ChargingSession.total_energy, ChargingSession.vehicle_soc
+        ),
+        until=lambda r: r.consumed_power > 0 and r.total_energy > 0 and (r.vehicle_soc or 0) > 20
+    )
 
-        # 4. Arrêter la session
-        print(f"\n4. Stopping session")
-        mqtt_client.publish_session_stop(
-            charger_id=charger_id,
-            connector_id=connector_id,
-            session_id=session_id,
-            total_energy=energy_delivered
-        )
+    assert row.consumed_power > 0, "Consumed power not updated"
+    assert row.total_energy > 0, "Total energy not updated"
+    assert row.vehicle_soc > 20, "Vehicle SOC not updated"
 
-        await asyncio.sleep(2)
+    logger.info(f"✓ Consumed Power: {row.consumed_power:.1f}kW")
+    logger.info(f"✓ Total Energy: {row.total_energy:.3f}kWh")
+    logger.info(f"✓ Vehicle SOC: {row.vehicle_soc:.1f}%")
 
-        # 5. Vérifier l'arrêt en DB
-        await db_session.refresh(db_session_obj)
-        assert db_session_obj.status.value == "completed", "Session not completed"
-        assert db_session_obj.end_time is not None, "End time not set"
+    # 4. Arrêter la session
+    logger.info("4. Stopping session")
+    await mqtt_client.publish_session_stops(
+        (charger_id, connector_id, session_id, energy_delivered)
+    )
 
-        print(f"   ✓ Session completed")
-        print(f"   ✓ Final energy: {db_session_obj.total_energy:.3f}kWh")
+    # 5. Vérifier l'arrêt en DB
+    row = await wait_until(
+        lambda: fetch_session_fields(
+            db_session, session_id,
+            ChargingSession.status, ChargingSession.end_time, ChargingSession.total_energy
+        ),
+        until=lambda r: r.status.value == "completed"
+    )
+    assert row.status.value == "completed", "Session not completed"
+    assert row.end_time is not None, "End time not set"
 
-        print(f"\n✓ Integration test passed!")
+    logger.info("✓ Session completed")
+    logger.info(f"✓ Final energy: {row.total_energy:.3f}kWh")
 
-    finally:
-        mqtt_client.disconnect()
+    logger.info("✓ Integration test passed!")
 
 
-@pytest.mark.asyncio
-async def test_multiple_sessions_power_allocation(db_session: AsyncSession, station_config):
+@pytest.mark.asyncio(loop_scope="session")
+async def test_multiple_sessions_power_allocation(db_session: AsyncSession, station_config,
+                                                  mqtt_client: MQTTTestClient, n_samples: int):
     """Test de l'allocation de puissance avec plusieurs sessions"""
 
-    mqtt_client = MQTTTestClient(STATION_ID)
     session_repo = SessionRepository(db_session)
 
-    session1_id = f"test_s1_{int(datetime.now().timestamp())}"
-    session2_id = f"test_s2_{int(datetime.now().timestamp())}"
-
-    try:
-        # 1. Démarrer 2 sessions
-        print(f"\n1. Starting 2 sessions")
-
-        mqtt_client.publish_session_start("CP001", 1, session1_id, 150.0)
-        await asyncio.sleep(2)
-
-        mqtt_client.publish_session_start("CP001", 2, session2_id, 150.0)
-        await asyncio.sleep(2)
-
-        # Vérifier en DB
-        s1 = await session_repo.get_by_session_id(session1_id)
-        s2 = await session_repo.get_by_session_id(session2_id)
+    session1_id = sys.intern(f"test_s1_{time.time_ns()}")
+    session2_id = sys.intern(f"test_s2_{time.time_ns()}")
 
-        assert s1 is not None, "Session 1 not created"
-        assert s2 is not None, "Session 2 not created"
+    # 1. Démarrer 2 sessions
+    logger.info("1. Starting 2 sessions")
 
-        print(f"   ✓ Session 1: {s1.allocated_power}kW allocated")
-        print(f"   ✓ Session 2: {s2.allocated_power}kW allocated")
-
-        # 2. Simuler consommation
-        print(f"\n2. Simulating power consumption")
-
-        for i in range(15):
-            mqtt_client.publish_session_update(
-                "CP001", 1, session1_id, 140.0, 150.0, i * 0.04, 30.0 + i
-            )
-            mqtt_client.publish_session_update(
-                "CP001", 2, session2_id, 140.0, 150.0, i * 0.04, 25.0 + i
-            )
+    # Même chargeur : l'EMS traite les deux démarrages dans l'ordre
+    mqtt_client.publish_session_start("CP001", 1, session1_id, 150.0)
+    mqtt_client.publish_session_start("CP001", 2, session2_id, 150.0)
+    await mqtt_client.flush()
 
-            await asyncio.sleep(1)
-
-        await asyncio.sleep(2)
-
-        # 3. Vérifier les allocations
-        await db_session.refresh(s1)
-        await db_session.refresh(s2)
-
-        assert s1.consumed_power == 140.0, "Session 1 power not updated"
-        assert s2.consumed_power == 140.0, "Session 2 power not updated"
-
-        total_allocated = s1.allocated_power + s2.allocated_power
-        print(f"   ✓ Total allocated: {total_allocated:.1f}kW")
-        assert total_allocated <= station_config.gridCapacity, "Over capacity!"
+    # Vérifier en DB (une seule requête pour les deux sessions)
+    sessions = await wait_until(
+        lambda: session_repo.get_by_session_ids([session1_id, session2_id]),
+        until=lambda found: len(found) == 2
+    )
+    s1 = sessions.get(session1_id)
+    s2 = sessions.get(session2_id)
+
+    assert s1 is not None, "Session 1 not created"
+    assert s2 is not None, "Session 2 not created"
+
+    logger.info(f"✓ Session 1: {s1.allocated_power}kW allocated")
+    logger.info(f"✓ Session 2: {s2.allocated_power}kW allocated")
+
+    # 2. Simuler consommation
+    logger.info("2. Simulating power consumption")
+
+    # Échéances fixes : le temps de publication ne décale pas les ticks
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    # Moitié moins d'échantillons que le test de cycle de vie
+    for i in range(max(1, n_samples // 2)):
+        # Les deux sessions sont sur CP001 : un seul message pour le chargeur
+        mqtt_client.publish_session_update_batch("CP001", [
+            {"connector_id": 1, "session_id": session1_id, "consumed_power": 140.0,
+             "vehicle_max_power": 150.0, "energy_delivered": i * 0.04, "vehicle_soc": 30.0 + i},
+            {"connector_id": 2, "session_id": session2_id, "consumed_power": 140.0,
+             "vehicle_max_power": 150.0, "energy_delivered": i * 0.04, "vehicle_soc": 25.0 + i}
+        ])
+
+        await mqtt_client.flush()
+        await asyncio.sleep(max(0.0, start + i + 1 - loop.time()))
+
+    # 3. Vérifier les allocations
+    r1, r2 = await wait_until(
+        lambda: fetch_sessions_fields(
+            db_session, [session1_id, session2_id],
+            ChargingSession.consumed_power, ChargingSession.allocated_power
+        ),
+        until=lambda rows: all(r.consumed_power == 140.0 for r in rows)
+    )
 
-        # 4. Arrêter les sessions
-        print(f"\n3. Stopping sessions")
-        mqtt_client.publish_session_stop("CP001", 1, session1_id, 0.58)
-        mqtt_client.publish_session_stop("CP001", 2, session2_id, 0.58)
+    assert r1.consumed_power == 140.0, "Session 1 power not updated"
+    assert r2.consumed_power == 140.0, "Session 2 power not updated"
 
-        await asyncio.sleep(2)
+    total_allocated = r1.allocated_power + r2.allocated_power
+    logger.info(f"✓ Total allocated: {total_allocated:.1f}kW")
+    assert total_allocated <= station_config.gridCapacity, "Over capacity!"
 
-        await db_session.refresh(s1)
-        await db_session.refresh(s2)
+    # 4. Arrêter les sessions
+    logger.info("3. Stopping sessions")
+    await mqtt_client.publish_session_stops(
+        ("CP001", 1, session1_id, 0.58),
+        ("CP001", 2, session2_id, 0.58)
+    )
 
-        assert s1.status.value == "completed"
-        assert s2.status.value == "completed"
+    r1, r2 = await wait_until(
+        lambda: fetch_sessions_fields(db_session, [session1_id, session2_id], ChargingSession.status),
+        until=lambda rows: all(r.status.value == "completed" for r in rows)
+    )
 
-        print(f"   ✓ Both sessions completed")
-        print(f"\n✓ Integration test passed!")
+    assert r1.status.value == "completed"
+    assert r2.status.value == "completed"
 
-    finally:
-        mqtt_client.disconnect()
+    logger.info("✓ Both sessions completed")
+    logger.info("✓ Integration test passed!")
 
 
 if __name__ == "__main__":
-    pytest.main([__file__, "-v", "-s"])
+    pytest.main([__file__, "-v", "--log-cli-level=INFO"])